@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""Time property and link lookups, and show their query plans, with and without the covering indexes added by schema
+migration 2 (see tangos.core.migrations).
+
+The migration is first reverted, to measure the database as it was before the indexes existed, and then reapplied.
+
+See README.md for usage."""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import tangos
+from tangos import core, live_calculation, log
+from tangos.core import extraction_patterns, migrations
+from tangos.testing import simulation_generator
+from tangos.util.explain_query import explain_query
+
+
+def build_database(db_url, n_halos, n_timesteps, n_properties):
+    core.init_db(db_url)
+    generator = simulation_generator.SimulationGeneratorForTests(max_steps=n_timesteps)
+    extra_properties = {"extra_%d" % i: (lambda j, i=i: float(i*j)) for i in range(n_properties)}
+    for i in range(n_timesteps):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(n_halos, NDM=np.arange(n_halos, 0, -1)*100)
+        generator.add_properties_to_halos(Mvir=lambda j: 1e10*j, Rvir=lambda j: 10.0*j, **extra_properties)
+        if i>0:
+            generator.link_last_halos()
+    core.close_db()
+
+def _time(function, repeats):
+    timings = []
+    for i in range(repeats):
+        core.get_default_session().expunge_all()
+        start = time.time()
+        function()
+        timings.append(time.time()-start)
+    return np.median(timings)
+
+def _calculate_all(*names):
+    for ts in tangos.get_simulation("sim").timesteps:
+        ts.calculate_all(*names)
+
+def _get_from_session(n_halos):
+    session = core.get_default_session()
+    getter = extraction_patterns.HaloPropertyGetter()
+    property_id = core.get_dict_id("Mvir")
+    for halo in tangos.get_timestep("sim/ts1").objects.limit(n_halos):
+        getter.get_from_session(halo, property_id, session)
+
+def _halo_query(*names):
+    ts = tangos.get_timestep("sim/ts1")
+    query = core.get_default_session().query(core.SimulationObjectBase).filter_by(timestep_id=ts.id)
+    return live_calculation.parser.parse_property_names(*names).supplement_halo_query(query)
+
+def _property_query():
+    return core.get_default_session().query(core.HaloProperty).filter_by(
+        name_id=core.get_dict_id("Mvir"), halo_id=tangos.get_halo("sim/ts1/1").id, deprecated=False)
+
+def _print_plans():
+    for description, query in [("calculate_all('Mvir', 'Rvir')", _halo_query("Mvir", "Rvir")),
+                               ("calculate_all('ptcls_in_common.Mvir')", _halo_query("ptcls_in_common.Mvir")),
+                               ("HaloPropertyGetter.get_from_session", _property_query())]:
+        print("  Query plan for %s:" % description)
+        for row in explain_query(query):
+            print("    " + " | ".join(row))
+
+def run_benchmark(db_url, repeats, n_lookups, show_plans):
+    tests = [("calculate_all('Mvir', 'Rvir')", lambda: _calculate_all("Mvir", "Rvir")),
+             ("calculate_all('later(1).Mvir')", lambda: _calculate_all("later(1).Mvir")),
+             ("calculate_all('ptcls_in_common.Mvir')", lambda: _calculate_all("ptcls_in_common.Mvir")),
+             ("get_from_session x %d" % n_lookups, lambda: _get_from_session(n_lookups))]
+
+    core.init_db(db_url)
+    for label, migrate in [("without covering indexes", lambda engine: migrations.downgrade(engine, 1)),
+                           ("with covering indexes", lambda engine: migrations.upgrade(engine, 2))]:
+        # end the session's transaction, so that it sees the changed schema
+        core.get_default_session().close()
+        migrate(core.get_default_engine())
+        with core.get_default_engine().connect() as connection:
+            connection.exec_driver_sql("ANALYZE")
+        # SQLite connections only read the statistics from ANALYZE when first opened
+        core.get_default_engine().dispose()
+
+        print(label)
+        for description, function in tests:
+            print("  %-40s%10.1fms" % (description, 1000*_time(function, repeats)))
+        if show_plans:
+            _print_plans()
+    core.close_db()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark property and link lookups with and without the covering "
+                                                 "indexes added by schema migration 2")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Path of an SQLite database file to create, or the URL of an empty PostgreSQL "
+                             "database (default: a temporary SQLite file)")
+    parser.add_argument("--halos", type=int, default=1000, help="Number of halos per timestep")
+    parser.add_argument("--timesteps", type=int, default=3, help="Number of timesteps")
+    parser.add_argument("--properties", type=int, default=5,
+                        help="Number of additional properties per halo, besides Mvir and Rvir")
+    parser.add_argument("--lookups", type=int, default=500, help="Number of halos for get_from_session lookups")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of times to repeat each test")
+    parser.add_argument("--no-plans", action="store_true", help="Do not show query plans")
+    args = parser.parse_args()
+
+    log.logger.setLevel(logging.WARNING) # explain_query logs each plan; print only the plan rows instead
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_url = args.db or os.path.join(tmpdir, "benchmark.db")
+        if "//" not in db_url:
+            db_url = "sqlite:///" + db_url
+        build_database(db_url, args.halos, args.timesteps, args.properties)
+        run_benchmark(db_url, args.repeats, args.lookups, not args.no_plans)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""Time link-heavy live calculations, comparing the IN (...) and temporary table strategies for resolving links.
+
+See README.md for usage."""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import tangos
+from tangos import config, core
+from tangos.testing import simulation_generator
+
+EXPRESSIONS = ["later(1).Mvir",
+               "later(1).later(1).Mvir",
+               "earlier(1).Mvir",
+               "(later(1).Mvir, later(1).Rvir)"]
+
+def build_database(db_url, n_halos, n_timesteps):
+    core.init_db(db_url)
+    generator = simulation_generator.SimulationGeneratorForTests(max_steps=n_timesteps)
+    for i in range(n_timesteps):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(n_halos, NDM=np.arange(n_halos, 0, -1)*100)
+        generator.add_properties_to_halos(Mvir=lambda j: 1e10*j, Rvir=lambda j: 10.0*j)
+        if i>0:
+            generator.link_last_halos()
+
+def time_expression(expression, timestep, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.time()
+        timestep.calculate_all(expression)
+        timings.append(time.time()-start)
+    return min(timings)
+
+def run_benchmark(repeats):
+    timestep = tangos.get_simulation("sim").timesteps[1]
+    strategies = {'IN clause': 10**9, 'temporary table': 0}
+
+    print("%-35s"%"expression" + "".join("%18s"%s for s in strategies))
+    original_threshold = config.max_ids_for_in_clause
+    try:
+        for expression in EXPRESSIONS:
+            line = "%-35s"%expression
+            for threshold in strategies.values():
+                config.max_ids_for_in_clause = threshold
+                line += "%16.1fms"%(1000*time_expression(expression, timestep, repeats))
+            print(line)
+    finally:
+        config.max_ids_for_in_clause = original_threshold
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark link-heavy live calculations")
+    parser.add_argument("--db", type=str, default=None,
+                        help="SQLAlchemy URL of an empty database to use (default: a temporary sqlite file)")
+    parser.add_argument("--halos", type=int, default=300, help="Number of halos per timestep")
+    parser.add_argument("--timesteps", type=int, default=4, help="Number of timesteps")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of repeats for each timing (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_url = args.db or "sqlite:///"+os.path.join(tmpdir, "benchmark.db")
+        build_database(db_url, args.halos, args.timesteps)
+        try:
+            run_benchmark(args.repeats)
+        finally:
+            core.close_db()
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""Time parallel PropertyWriter._build_halo_list while another process writes, with and without the read-optimised
+SQLite profile (config.sqlite_read_optimised).
+
+One process repeatedly inserts properties through cached_writer.insert_list, as tangos write does, while the others
+repeatedly build halo lists. Without the profile, each halo list is built under the application-level SharedLock and so
+must wait for any write in progress; with it, reads proceed during writes.
+
+See README.md for usage."""
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import tangos
+from tangos import cached_writer, core, parallel_tasks, properties
+from tangos.testing import simulation_generator
+from tangos.tools import property_writer
+
+
+class BenchmarkProperty(properties.PropertyCalculation):
+    names = "benchmark_value",
+
+    def requires_property(self):
+        return ["Mvir", "Rvir"]
+
+    def calculate(self, data, entry):
+        return 0.0,
+
+def build_database(db_url, n_halos, n_timesteps):
+    core.init_db(db_url)
+    generator = simulation_generator.SimulationGeneratorForTests(max_steps=n_timesteps)
+    for i in range(n_timesteps):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(n_halos, NDM=np.arange(n_halos, 0, -1)*100)
+        generator.add_properties_to_halos(Mvir=lambda j: 1e10*j, Rvir=lambda j: 10.0*j)
+    core.close_db()
+
+def _write_until_readers_finish(results_dir, n_readers, batch_size):
+    session = core.get_default_session()
+    with cached_writer.read_lock():
+        halos = session.query(core.SimulationObjectBase).all()
+    n_writes = 0
+    while len(glob.glob(os.path.join(results_dir, "*.json"))) < n_readers:
+        batch = [halos[(n_writes*batch_size + i) % len(halos)] for i in range(batch_size)]
+        cached_writer.insert_list([(h, "written_value", float(n_writes)) for h in batch])
+        n_writes += 1
+
+def _build_halo_lists(results_dir, iterations):
+    writer = property_writer.PropertyWriter()
+    writer.parse_command_line(["benchmark_value"])
+    timesteps = tangos.get_simulation("sim").timesteps
+    writer._property_calculator_instances = properties.instantiate_classes(timesteps[0].simulation,
+                                                                           ["benchmark_value"])
+    timings = []
+    for i in range(iterations):
+        start = time.time()
+        with cached_writer.read_lock():
+            writer._build_halo_list(timesteps[i % len(timesteps)])
+        timings.append(time.time()-start)
+        core.get_default_session().rollback()
+
+    with open(os.path.join(results_dir, "%d.json" % parallel_tasks.backend.rank()), "w") as f:
+        json.dump(timings, f)
+
+def _benchmark_rank(results_dir, n_readers, iterations, batch_size):
+    if parallel_tasks.backend.rank()==1:
+        _write_until_readers_finish(results_dir, n_readers, batch_size)
+    else:
+        _build_halo_lists(results_dir, iterations)
+
+def run_benchmark(db_url, n_readers, iterations, batch_size):
+    print("%-22s%14s%14s%14s%14s"%("profile", "median", "mean", "max", "wall time"))
+    for read_optimised in [False, True]:
+        with tempfile.TemporaryDirectory() as results_dir:
+            core.init_db(db_url, sqlite_read_optimised=read_optimised)
+            parallel_tasks.use('multiprocessing-%d' % (n_readers+2))
+            start = time.time()
+            parallel_tasks.launch(_benchmark_rank, [results_dir, n_readers, iterations, batch_size])
+            wall_time = time.time()-start
+            core.close_db()
+
+            timings = []
+            for filename in glob.glob(os.path.join(results_dir, "*.json")):
+                with open(filename) as f:
+                    timings += json.load(f)
+
+        print("%-22s%12.1fms%12.1fms%12.1fms%13.1fs"%("read-optimised" if read_optimised else "default",
+                                                      1000*np.median(timings), 1000*np.mean(timings),
+                                                      1000*np.max(timings), wall_time))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel halo list queries during writes, with and "
+                                                 "without the read-optimised SQLite profile")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Path of an SQLite database file to create (default: a temporary file)")
+    parser.add_argument("--halos", type=int, default=2000, help="Number of halos per timestep")
+    parser.add_argument("--timesteps", type=int, default=4, help="Number of timesteps")
+    parser.add_argument("--readers", type=int, default=3, help="Number of processes building halo lists")
+    parser.add_argument("--iterations", type=int, default=20, help="Number of halo lists built by each reader")
+    parser.add_argument("--batch", type=int, default=200, help="Number of properties inserted per write")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_url = "sqlite:///" + (args.db or os.path.join(tmpdir, "benchmark.db"))
+        build_database(db_url, args.halos, args.timesteps)
+        run_benchmark(db_url, args.readers, args.iterations, args.batch)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""Time the hot paths of tangos against a parameterised synthetic database, writing the results as JSON so that they
+can be compared between commits.
+
+The database has the specified number of timesteps, halos per timestep and properties per halo. Each halo is linked to
+the halo with the same number in the next timestep, plus (link density - 1) randomly chosen others, in both directions.
+
+Example:
+
+    python suite.py --output before.json
+    (check out another commit)
+    python suite.py --output after.json --compare before.json
+
+See README.md for further details."""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import sqlalchemy
+
+import tangos
+from tangos import cached_writer, core, log, parallel_tasks, relation_finding
+from tangos.relation_finding import tree
+from tangos.testing import simulation_generator
+from tangos.util import link_writer
+
+BENCHMARKS = {}
+
+def benchmark(name):
+    """Register a benchmark. The decorated function does any untimed setup, and returns a function to be timed.
+
+    It is called afresh before each repeat, after all objects in the default session have been expired (so that they
+    are reloaded from the database)."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+class Context:
+    """Information about the synthetic database, passed to each benchmark"""
+    def __init__(self, db_url, tmpdir, args):
+        self.db_url = db_url
+        self.tmpdir = tmpdir
+        self.args = args
+        self.property_names = ["Mvir", "Rvir"] + ["extra_%d" % i for i in range(args.properties - 2)]
+        self.counter = 0
+
+    @property
+    def timesteps(self):
+        return tangos.get_simulation("sim").timesteps
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+
+def build_database(db_url, n_timesteps, n_halos, n_properties, link_density, seed):
+    core.init_db(db_url)
+    session = core.get_default_session()
+    random = np.random.RandomState(seed)
+    generator = simulation_generator.SimulationGeneratorForTests(max_steps=n_timesteps)
+    names = ["Mvir", "Rvir"] + ["extra_%d" % i for i in range(n_properties - 2)]
+    relation = core.get_or_create_dictionary_item(session, "ptcls_in_common")
+    halo_numbers = np.arange(1, n_halos + 1)
+
+    previous_ids = None
+    for i in range(n_timesteps):
+        generator.add_timestep()
+        halos = generator.add_objects_to_timestep(n_halos, NDM=np.arange(n_halos, 0, -1) * 100)
+        values = {"Mvir": 1e12 / halo_numbers, "Rvir": 100.0 / halo_numbers ** (1. / 3)}
+        property_list = [(halo, name, float(values[name][j]) if name in values else float(random.uniform()))
+                         for name in names for j, halo in enumerate(halos)]
+        cached_writer.insert_list(property_list)
+
+        ids = np.array([h.id for h in halos])
+        if previous_ids is not None:
+            n_extra = max(int(round(n_halos * (link_density - 1))), 0)
+            ids_from = np.concatenate([previous_ids, random.choice(previous_ids, n_extra)])
+            ids_to = np.concatenate([ids, random.choice(ids, n_extra)])
+            weights = np.concatenate([np.full(n_halos, 0.9), random.uniform(0.0, 0.1, n_extra)])
+            link_writer.insert_links(session, ids_from, ids_to, weights, relation)
+            link_writer.insert_links(session, ids_to, ids_from, weights, relation)
+            session.commit()
+        previous_ids = ids
+    core.close_db()
+
+
+@benchmark("calculate_all")
+def _calculate_all(context):
+    ts = context.timesteps[len(context.timesteps) // 2]
+    return lambda: ts.calculate_all(*context.property_names[:3])
+
+@benchmark("calculate_all_link")
+def _calculate_all_link(context):
+    ts = context.timesteps[0]
+    return lambda: ts.calculate_all("later(1).Mvir", "later(1).Rvir")
+
+@benchmark("calculate_for_progenitors")
+def _calculate_for_progenitors(context):
+    halos = context.timesteps[-1].halos.limit(context.args.tree_halos).all()
+    return lambda: [h.calculate_for_progenitors("Mvir") for h in halos]
+
+@benchmark("multi_source_multi_hop")
+def _multi_source_multi_hop(context):
+    timesteps = context.timesteps
+    halos = timesteps[0].halos.all()
+    return lambda: relation_finding.MultiSourceMultiHopStrategy(halos, timesteps[-1]).all()
+
+@benchmark("merger_tree")
+def _merger_tree(context):
+    halos = context.timesteps[-1].halos.limit(context.args.tree_halos).all()
+    return lambda: [tree.MergerTree(h).construct() for h in halos]
+
+@benchmark("insert_list")
+def _insert_list(context):
+    name = "inserted_%d" % context.next_id()
+    halos = context.timesteps[0].halos.all()
+    return lambda: cached_writer.insert_list([(h, name, float(h.halo_number)) for h in halos])
+
+@benchmark("db_importer")
+def _db_importer(context):
+    from tangos.tools import db_importer
+    destination = os.path.join(context.tmpdir, "import_%d.db" % context.next_id())
+    source_engine = core.get_default_engine()
+
+    def run():
+        core.init_db("sqlite:///" + destination)
+        try:
+            importer = db_importer.DBImporter()
+            importer.parse_command_line([context.db_url])
+            importer.options.files = [source_engine]
+            # hide the importer's progress messages and bars
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                importer.run_calculation_loop()
+        finally:
+            core.close_db()
+            core.init_db(context.db_url)
+            os.remove(destination)
+    return run
+
+def _web_benchmark(paths):
+    def setup(context):
+        app = _get_web_app(context)
+        return lambda: [app.get(path) for path in paths]
+    return setup
+
+def _get_web_app(context):
+    if not hasattr(context, "web_app"):
+        from webtest import TestApp
+
+        import tangos.web
+        context.web_app = TestApp(tangos.web.main({}))
+    return context.web_app
+
+benchmark("web_halo_view")(_web_benchmark(["/sim/ts1/halo_1"]))
+benchmark("web_get_property")(_web_benchmark(["/sim/ts1/halo_%d/Mvir.json" % i for i in range(1, 11)]))
+benchmark("web_gather")(_web_benchmark(["/sim/ts1/gather/halo/Mvir.json"]))
+benchmark("web_merger_tree")(_web_benchmark(["/sim/ts1/halo_1/merger/tree.json"]))
+
+
+def run_benchmarks(context, names, repeats):
+    results = {}
+    for name in names:
+        timings = []
+        try:
+            for _ in range(repeats):
+                core.get_default_session().commit()
+                core.get_default_session().expire_all()
+                run = BENCHMARKS[name](context)
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+        except ImportError as e:
+            print("%-30s skipped (%s)" % (name, e))
+            continue
+        results[name] = {"min": min(timings), "median": float(np.median(timings)), "timings": timings}
+        print("%-30s%12.1fms%12.1fms" % (name, 1000 * results[name]["min"], 1000 * results[name]["median"]))
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_filename):
+    with open(baseline_filename) as f:
+        baseline = json.load(f)
+    print()
+    print(f"Comparison with {baseline_filename} (commit {baseline.get('commit')})")
+    print("%-30s%14s%14s%10s" % ("benchmark", "baseline", "current", "ratio"))
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["min"]
+        print("%-30s%12.1fms%12.1fms%10.2f" % (name, 1000 * before, 1000 * result["min"], result["min"] / before))
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot paths of tangos against a synthetic database")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Path of an SQLite database file to create, or the SQLAlchemy URL of an empty database "
+                             "such as a local PostgreSQL database (default: a temporary SQLite file)")
+    parser.add_argument("--timesteps", type=int, default=5, help="Number of timesteps")
+    parser.add_argument("--halos", type=int, default=500, help="Number of halos per timestep")
+    parser.add_argument("--properties", type=int, default=5, help="Number of properties per halo (at least 2)")
+    parser.add_argument("--link-density", type=float, default=2.0,
+                        help="Mean number of links from each halo to halos in the next timestep (at least 1)")
+    parser.add_argument("--tree-halos", type=int, default=5,
+                        help="Number of halos for which to find progenitors or construct merger trees")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of repeats for each timing")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for generating the database")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Run only the specified benchmarks")
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Compare the results with those in this JSON file, from a previous run")
+    args = parser.parse_args()
+    if args.properties < 2 or args.link_density < 1:
+        parser.error("--properties must be at least 2, and --link-density at least 1")
+
+    parallel_tasks.use('null')
+    log.logger.setLevel(logging.WARNING) # otherwise the merger tree and importer log progress
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_url = args.db or os.path.join(tmpdir, "benchmark.db")
+        if "//" not in db_url:
+            db_url = "sqlite:///" + db_url
+
+        start = time.perf_counter()
+        build_database(db_url, args.timesteps, args.halos, args.properties, args.link_density, args.seed)
+        print("Built database in %.1fs" % (time.perf_counter() - start))
+
+        core.init_db(db_url)
+        try:
+            print("%-30s%14s%14s" % ("benchmark", "min", "median"))
+            results = run_benchmarks(Context(db_url, tmpdir, args), args.only, args.repeats)
+        finally:
+            core.close_db()
+
+    output = {"commit": _git_commit(),
+              "date": datetime.datetime.now().isoformat(),
+              "parameters": {k: v for k, v in vars(args).items() if k not in ("db", "output", "compare", "only")},
+              "backend": sqlalchemy.engine.make_url(db_url).get_backend_name(),
+              "environment": {"python": sys.version.split()[0], "platform": platform.platform(),
+                              "sqlalchemy": sqlalchemy.__version__, "numpy": np.__version__},
+              "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Asynchronous versions of the main query functions, for use from asyncio code such as notebooks or async web servers.
+
+For example, in a notebook:
+
+    from tangos import async_query
+    ts1, ts2 = tangos.get_simulation("sim").timesteps[-2:]
+    (Mvir1, ), (Mvir2, ) = await asyncio.gather(async_query.calculate_all(ts1, "Mvir"),
+                                                async_query.calculate_all(ts2, "Mvir"))
+
+Each query runs in a worker thread with its own session and database connection, so that several can proceed at once
+without blocking the event loop. At most config.async_max_concurrency queries run at a time; others wait their turn.
+Database objects in the results are transferred into the calling session (by default, the default session), so they
+can be used as normal once the query has finished.
+
+Cancelling a query (e.g. with task.cancel() or asyncio.wait_for) interrupts any SQL statement it is running on SQLite or
+PostgreSQL, and stops it before it issues any further statements. The cancellation completes once the worker thread has
+stopped, so time spent in python between statements can delay it.
+
+The queries run through the normal synchronous engine, rather than SQLAlchemy's asyncio extension, because tangos
+relies on lazy loading of relationships, which asynchronous sessions do not support."""
+
+import asyncio
+import concurrent.futures
+import threading
+import weakref
+
+import numpy as np
+import sqlalchemy.event
+import sqlalchemy.exc
+
+from . import config, core, query
+from .core import Base, SimulationObjectBase, TimeStep
+
+
+class QueryCancelled(Exception):
+    """Raised within a worker thread to stop a query whose coroutine has been cancelled"""
+    pass
+
+
+class _CancellationToken:
+    """Tracks whether a query has been cancelled, and the database connections it is using, for one worker session"""
+    def __init__(self):
+        self.cancelled = False
+        self._dbapi_connections = []
+        self._lock = threading.Lock()
+
+    def attach(self, session):
+        sqlalchemy.event.listen(session, "do_orm_execute", self._before_execute)
+        sqlalchemy.event.listen(session, "after_begin", self._after_begin)
+        sqlalchemy.event.listen(session, "after_transaction_end", self._after_transaction_end)
+
+    def _before_execute(self, orm_execute_state):
+        if self.cancelled:
+            raise QueryCancelled("The query was cancelled")
+
+    def _after_begin(self, session, transaction, connection):
+        with self._lock:
+            self._dbapi_connections.append(connection.connection.dbapi_connection)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            # the connections are returned to the pool, so must no longer be interrupted
+            with self._lock:
+                self._dbapi_connections = []
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for connection in self._dbapi_connections:
+                _interrupt(connection)
+
+
+def _interrupt(dbapi_connection):
+    """Abort the statement currently running on a DBAPI connection, if the driver allows it"""
+    if hasattr(dbapi_connection, "interrupt"):
+        dbapi_connection.interrupt() # sqlite3
+    elif hasattr(dbapi_connection, "cancel"):
+        dbapi_connection.cancel() # psycopg2
+
+
+def _reference(object, cls):
+    """Return something that identifies object (a database object of type cls, or its path) and can be safely passed
+    to a worker thread"""
+    if isinstance(object, str):
+        return cls, object
+    else:
+        return cls, object.id
+
+def _load(session, reference):
+    """Load the object identified by _reference into the specified session"""
+    cls, id = reference
+    if isinstance(id, str):
+        return query.get_timestep(id, session) if cls is TimeStep else query.get_object(id, session)
+    else:
+        return session.get(cls, id)
+
+def _transfer(value, session):
+    """Merge database objects within value (which may be a list, tuple or object array) into the specified session"""
+    if isinstance(value, Base):
+        return session.merge(value, load=False)
+    elif isinstance(value, np.ndarray) and value.dtype == object:
+        transferred = np.empty(value.shape, dtype=object)
+        for index, item in np.ndenumerate(value):
+            transferred[index] = _transfer(item, session)
+        return transferred
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_transfer(item, session) for item in value)
+    else:
+        return value
+
+
+class AsyncQueryRunner:
+    """Runs queries in a pool of worker threads, limiting how many run at once.
+
+    The module-level functions use a shared runner (see get_default_runner); separate runners can be created to give
+    different parts of an application their own limits."""
+
+    def __init__(self, max_concurrency=None):
+        """:param max_concurrency: the maximum number of queries to run at once (default config.async_max_concurrency)"""
+        self.max_concurrency = max_concurrency or config.async_max_concurrency
+        self._executor = None
+        self._semaphores = weakref.WeakKeyDictionary() # one per event loop
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                                       thread_name_prefix="tangos-async-query")
+            return self._executor
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._semaphores.get(loop, None)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+            return semaphore
+
+    def shutdown(self):
+        """Stop the worker threads, after any queries in progress have finished"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    async def run(self, function, *args, session=None, **kwargs):
+        """Call function(worker_session, *args, **kwargs) in a worker thread, and return its result.
+
+        The function must use only the worker session that it is passed, since sessions cannot be shared between
+        threads. Database objects in the result are transferred into session (default: the default session)."""
+        if session is None:
+            session = core.get_default_session() # also ensures that the database has been initialised
+
+        async with self._get_semaphore():
+            token = _CancellationToken()
+            future = self._get_executor().submit(self._run_in_worker, token, function, args, kwargs)
+            try:
+                result = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                token.cancel()
+                await self._wait_until_stopped(future)
+                raise
+        return _transfer(result, session)
+
+    @staticmethod
+    def _run_in_worker(token, function, args, kwargs):
+        worker_session = core.Session()
+        token.attach(worker_session)
+        try:
+            return function(worker_session, *args, **kwargs)
+        except sqlalchemy.exc.OperationalError as e:
+            if token.cancelled:
+                raise QueryCancelled("The query was cancelled") from e
+            raise
+        finally:
+            worker_session.close()
+
+    @staticmethod
+    async def _wait_until_stopped(future):
+        """Wait for a cancelled query's worker to stop, so that the limit on running queries is respected"""
+        while not future.done():
+            waiter = asyncio.wrap_future(future)
+            # the worker's exception (normally QueryCancelled) is superseded by the cancellation, so is not reported
+            waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+            try:
+                await asyncio.wait([waiter])
+            except asyncio.CancelledError:
+                pass # already being cancelled
+
+    async def get_object(self, path, session=None):
+        """Asynchronous version of tangos.get_object"""
+        return await self.run(lambda worker_session: query.get_object(path, worker_session), session=session)
+
+    async def calculate_all(self, timestep, *plist, session=None, **kwargs):
+        """Asynchronous version of TimeStep.calculate_all, where timestep is a TimeStep or its path"""
+        reference = _reference(timestep, TimeStep)
+        def calculate(worker_session):
+            return _load(worker_session, reference).calculate_all(*plist, **kwargs)
+        return await self.run(calculate, session=session)
+
+    async def calculate_for_descendants(self, halo, *plist, session=None, **kwargs):
+        """Asynchronous version of SimulationObjectBase.calculate_for_descendants, where halo is an object or its path"""
+        reference = _reference(halo, SimulationObjectBase)
+        def calculate(worker_session):
+            return _load(worker_session, reference).calculate_for_descendants(*plist, **kwargs)
+        return await self.run(calculate, session=session)
+
+    async def calculate_for_progenitors(self, halo, *plist, session=None, **kwargs):
+        """Asynchronous version of SimulationObjectBase.calculate_for_progenitors, where halo is an object or its path"""
+        reference = _reference(halo, SimulationObjectBase)
+        def calculate(worker_session):
+            return _load(worker_session, reference).calculate_for_progenitors(*plist, **kwargs)
+        return await self.run(calculate, session=session)
+
+    async def construct_merger_tree(self, tree):
+        """Asynchronous version of MergerTree.construct. The tree is constructed in place, and also returned."""
+        base_reference = _reference(tree.base_halo, SimulationObjectBase)
+        highlight_reference = _reference(tree.highlight_halo, SimulationObjectBase)
+
+        def construct(worker_session):
+            # construct the tree from copies of the halos in the worker session, then put the originals back
+            base_halo, highlight_halo = tree.base_halo, tree.highlight_halo
+            tree.base_halo = _load(worker_session, base_reference)
+            tree.highlight_halo = _load(worker_session, highlight_reference)
+            try:
+                tree.construct()
+            finally:
+                tree.base_halo, tree.highlight_halo = base_halo, highlight_halo
+
+        await self.run(construct)
+        return tree
+
+
+_default_runner = None
+_default_runner_lock = threading.Lock()
+
+def get_default_runner():
+    """Return the runner used by the module-level functions, creating it if necessary"""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = AsyncQueryRunner()
+        return _default_runner
+
+async def run(function, *args, session=None, **kwargs):
+    """Call function(worker_session, *args, **kwargs) in a worker thread; see AsyncQueryRunner.run"""
+    return await get_default_runner().run(function, *args, session=session, **kwargs)
+
+async def get_object(path, session=None):
+    """Asynchronous version of tangos.get_object"""
+    return await get_default_runner().get_object(path, session=session)
+
+async def calculate_all(timestep, *plist, session=None, **kwargs):
+    """Asynchronous version of TimeStep.calculate_all, where timestep is a TimeStep or its path"""
+    return await get_default_runner().calculate_all(timestep, *plist, session=session, **kwargs)
+
+async def calculate_for_descendants(halo, *plist, session=None, **kwargs):
+    """Asynchronous version of SimulationObjectBase.calculate_for_descendants, where halo is an object or its path"""
+    return await get_default_runner().calculate_for_descendants(halo, *plist, session=session, **kwargs)
+
+async def calculate_for_progenitors(halo, *plist, session=None, **kwargs):
+    """Asynchronous version of SimulationObjectBase.calculate_for_progenitors, where halo is an object or its path"""
+    return await get_default_runner().calculate_for_progenitors(halo, *plist, session=session, **kwargs)
+
+async def construct_merger_tree(tree):
+    """Asynchronous version of MergerTree.construct. The tree is constructed in place, and also returned."""
+    return await get_default_runner().construct_merger_tree(tree)
@@ -1,3 +1,5 @@
+import contextlib
+
 from . import core
 
 
@@ -17,6 +19,16 @@ def create_property(halo, name, prop, session):
 def _insert_list_unlocked(property_list):
     session = core.get_default_session()
     number = 0
+
+    # create any new dictionary items first, so that they have ids for the summary, then update the summary before
+    # any of the new properties are flushed
+    names = {name: core.dictionary.get_or_create_dictionary_item(session, name)
+             for name in {p[1] for p in property_list if p[2] is not None}}
+    session.flush()
+    core.timestep_summary.add_property_counts(session,
+        [(p[0].timestep_id, p[0].object_typecode, p[0].id, names[p[1]].id) for p in property_list
+         if p[2] is not None and p[0].id is not None and not isinstance(p[2], core.halo.Halo)])
+
     for p in property_list:
         if p[2] is not None:
             session.add(create_property(p[0], p[1], p[2], session))
@@ -33,3 +45,15 @@ def insert_list(property_list):
             return _insert_list_unlocked(property_list)
     else:
         return _insert_list_unlocked(property_list)
+
+def read_lock():
+    """Return a context manager to hold while reading from the database in parallel with insert_list.
+
+    Unless the database allows reading during writes (see core.reads_need_lock), this is a SharedLock, which waits for
+    any write to complete."""
+    from tangos import parallel_tasks as pt
+
+    if core.reads_need_lock():
+        return pt.lock.SharedLock("insert_list")
+    else:
+        return contextlib.nullcontext()
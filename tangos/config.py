@@ -26,6 +26,9 @@ default_fileset_handler_class = "pynbody.PynbodyInputHandler"
 default_linking_threshold = 0.005
 # the percentage of particles in common between two objects before the database bothers to store the relationship
 
+low_memory_matching_chunk_size = 10000000
+# when matching particles in low-memory mode (tangos link --low-memory), the number of particle ids compared at once
+
 min_halo_particles = 1000
 # the minimum number of particles needed in an object before the database bothers to store it
 
@@ -88,6 +91,22 @@ mergertree_max_hops = 500 # maximum number of timesteps to scan
 num_multihops_max_default = 100     # the maximum number of links to follow when searching for related halos
 max_relative_time_difference = 1e-4     # the maximum fractional difference in time between two contemporaneous timesteps when searching for related halos
 
+# live calculation: links to at most this many distinct objects are resolved using an IN (...) clause; larger
+# sets are loaded into a temporary table
+max_ids_for_in_clause = 500
+
+# the maximum number of dictionary entries (property and link names) to cache in memory for each database. If the
+# dictionary table is larger, the least recently used names are looked up in the database when next needed
+dictionary_cache_size = 100000
+
+# the maximum number of simulation and timestep names (e.g. as used in get_object("sim/ts/halo_1")) for which to cache
+# the database IDs they resolve to, for each database
+path_cache_size = 10000
+
+# the maximum number of queries run at once by the asynchronous query functions (see tangos/async_query.py), each in its
+# own worker thread and database connection
+async_max_concurrency = 4
+
 # On some network file systems, concurrency using sqlite is dodgy to say the least. After committing a transaction
 # on one node, and before attempting to open a new transaction on another node, it seems empirically helpful to
 # allow a significant time delay. This variable controls that delay.
@@ -110,8 +129,37 @@ diff_default_atol = 1e-3
 diff_default_rtol = 1e-3
 
 
-# Database import: how many rows to copy at a time
+# ChaNGa BH logs (.BlackHoles or .shortened.orbit): after parsing, write a binary copy next to the log file which
+# is memory-mapped by all later loads, until the log file changes
+bh_log_cache = True
+
+# SQLite databases: if True, use the read-optimised profile (WAL journaling, memory-mapping and separate read-only
+# connections for queries), so that parallel processes can read while another is writing. Only use this for databases
+# on local disks, not network filesystems. See tangos/core/sqlite_profile.py.
+sqlite_read_optimised = os.environ.get("TANGOS_SQLITE_READ_OPTIMISED", "0").lower() in ("1", "true", "yes")
+sqlite_mmap_size = 256*1024*1024 # bytes of the database file to memory-map, in the read-optimised profile
+sqlite_cache_size = 64*1024*1024 # bytes of page cache per connection, in the read-optimised profile
+
+# Column exports written by tangos export-columns: the folder in which they are stored (if None, a .tangos-columns
+# folder within the simulation folder), and whether TimeStep.calculate_all reads plain stored properties from an
+# export when it is up to date with the database. calculate_all(..., use_column_export=...) overrides the default.
+column_export_path = os.environ.get("TANGOS_COLUMN_EXPORT_FOLDER", None)
+use_column_export = False
+
+# Database import: how many rows to copy at a time. The first chunk of each table has DB_IMPORT_CHUNK_SIZE rows;
+# later chunks are sized to hold roughly DB_IMPORT_CHUNK_BYTES of data, up to at most DB_IMPORT_MAX_CHUNK_SIZE rows.
+# If statements are rejected by a server limit (e.g. max_allowed_packet in MySQL), reduce DB_IMPORT_CHUNK_BYTES.
 DB_IMPORT_CHUNK_SIZE = 10
+DB_IMPORT_CHUNK_BYTES = 8*1024*1024
+DB_IMPORT_MAX_CHUNK_SIZE = 100000
+
+# Database import: each chunk is committed as it is copied. After losing the connection, the import reconnects and
+# resumes from the last committed chunk, up to this many times in a row before giving up.
+DB_IMPORT_MAX_RETRIES = 3
+
+# Bulk deletions (thin-timesteps, delete-properties, remove-duplicates): the maximum number of rows to delete in a
+# single transaction
+DELETE_CHUNK_SIZE = 10000
 
 # Property writer: longest to wait before trying to commit properties (even if in middle of timestep)
 PROPERTY_WRITER_MAXIMUM_TIME_BETWEEN_COMMITS = 600 # seconds
@@ -1,16 +1,18 @@
 import os
 
 import sqlalchemy
-from sqlalchemy import Index, create_engine, event, inspect, text
+from sqlalchemy import Index, create_engine, event
 from sqlalchemy.orm import clear_mappers, declarative_base, sessionmaker
 
 from .. import config, log
+from . import sqlite_profile
 
 _verbose = False
 _internal_session=None
 _internal_session_args=None
 _internal_session_pid=None
 _engine=None
+_read_only_engine=None
 Session=None
 
 
@@ -46,18 +48,36 @@ def get_default_engine() -> sqlalchemy.engine.Engine:
     return _engine
 
 
+def get_engine_for_session(session=None) -> sqlalchemy.engine.Engine:
+    """Get the sqlalchemy engine that the specified session (or, if None, the default session) connects through."""
+    if session is None:
+        return get_default_engine()
+    elif session.bind is not None:
+        return session.bind.engine # session.bind may be an engine or a connection
+    else:
+        return session.get_bind().engine
+
+
+def reads_need_lock() -> bool:
+    """Return True if parallel processes must hold a SharedLock while reading, so as not to read during a write.
+
+    This is not necessary when the read-optimised SQLite profile is in use (see sqlite_profile)."""
+    return _read_only_engine is None
+
 
 clear_mappers()  # remove existing maps
 
 Base = declarative_base()
 
 
+from . import migrations
 from .creator import Creator
 from .dictionary import DictionaryItem
 from .halo import SimulationObjectBase
 from .halo_data import HaloLink, HaloProperty
 from .simulation import Simulation, SimulationProperty
 from .timestep import TimeStep
+from .timestep_summary import TimeStepSummary
 from .tracking import TrackData, update_tracker_halos
 
 Index("halo_index", HaloProperty.__table__.c.halo_id)
@@ -70,6 +90,7 @@ Index("haloproperties_creator_index", HaloProperty.__table__.c.creator_id)
 Index("halolink_index", HaloLink.__table__.c.halo_from_id)
 Index("halolink_bidirectional_index", HaloLink.__table__.c.halo_to_id, HaloLink.__table__.c.halo_from_id)
 Index("named_halolink_index", HaloLink.__table__.c.relation_id, HaloLink.__table__.c.halo_from_id)
+Index("timestepsummary_timestep_index", TimeStepSummary.__table__.c.timestep_id)
 
 
 
@@ -124,24 +145,35 @@ def process_options(argparser_options):
         config.db = argparser_options.db_filename
     _verbose = argparser_options.db_verbose
 
-def _check_and_upgrade_database(engine, colname='finder_offset'):
-    inspector = inspect(engine)
-    if 'halos' in inspector.get_table_names():
-        cols = inspector.get_columns('halos')
-        for c in cols:
-            if c['name']==colname:
-                return
-        log.logger.warning("The database uses an old schema, missing the finder_offset column from halos. Attempting to update.")
-        with engine.begin() as connection:
-            connection.execute(text(f"alter table halos add column {colname} integer;"))
-            connection.execute(text(f"update halos set {colname} = finder_id;"))
-        log.logger.warning("The database update appeared to complete without any problems.")
-
-
-def init_db(db_uri=None, timeout=30, verbose=None):
-    global _verbose, _internal_session, _engine, Session, _internal_session_args, _internal_session_pid
+def _check_and_upgrade_database(engine, colname='finder_offset', upgrade=False):
+    if not sqlalchemy.inspect(engine).has_table('halos'):
+        migrations.create(engine)
+        return
+    migrations.check(engine, colname)
+    if upgrade:
+        migrations.upgrade(engine)
+    else:
+        migrations.warn_if_out_of_date(engine)
+
+
+def init_db(db_uri=None, timeout=30, verbose=None, sqlite_read_optimised=None, upgrade=False):
+    """Connect to the database, creating tables if required.
+
+    An existing database is only upgraded to the latest schema if upgrade is True (see migrations).
+
+    :param db_uri: the sqlalchemy URI of the database, or the filename of an SQLite database. Defaults to config.db
+    :param timeout: the time in seconds to wait when connecting, or for a locked SQLite database
+    :param verbose: if True, sqlalchemy echoes all SQL statements
+    :param sqlite_read_optimised: if True, use the read-optimised profile for SQLite databases (see sqlite_profile).
+                                  Defaults to config.sqlite_read_optimised
+    :param upgrade: if True, upgrade an existing database to the latest schema, which can take some time
+    """
+    global _verbose, _internal_session, _engine, _read_only_engine, Session, _internal_session_args, \
+        _internal_session_pid
     if db_uri is None:
         db_uri = config.db
+    if sqlite_read_optimised is None:
+        sqlite_read_optimised = config.sqlite_read_optimised
 
     if 'psycopg2' in db_uri:
         from ..util import postgresql_adapters
@@ -163,18 +195,29 @@ def init_db(db_uri=None, timeout=30, verbose=None):
         future=True
     )
 
-    _check_and_upgrade_database(_engine)
+    use_sqlite_profile = sqlite_read_optimised and sqlite_profile.is_applicable(db_uri)
+    if use_sqlite_profile:
+        sqlite_profile.configure_engine(_engine)
 
-    Session = sessionmaker(bind=_engine, future=True)
+    if use_sqlite_profile:
+        _read_only_engine = sqlite_profile.create_read_only_engine(db_uri, timeout, verbose or _verbose)
+        Session = sessionmaker(bind=_engine, class_=sqlite_profile.ReadWriteSplitSession,
+                               read_only_bind=_read_only_engine, future=True)
+    else:
+        _read_only_engine = None
+        Session = sessionmaker(bind=_engine, future=True)
     _internal_session=Session()
-    Base.metadata.create_all(_engine)
+    _check_and_upgrade_database(_engine, upgrade=upgrade)
     creator.set_creator(None)
-    _internal_session_args = (db_uri, timeout, verbose)
+    _internal_session_args = (db_uri, timeout, verbose, sqlite_read_optimised)
     _internal_session_pid = os.getpid() # stored so that we can detect when a fork happens
 
 def close_db():
-    global _engine
+    global _engine, _read_only_engine
     close_session()
+    if _read_only_engine is not None:
+        _read_only_engine.dispose()
+        _read_only_engine = None
     if _engine is not None:
         _engine.dispose()
         _engine = None
@@ -187,11 +230,7 @@ def close_session():
     if Session is not None:
         Session = None
 
-from .dictionary import (
-    _get_dict_cache_for_session,
-    get_dict_id,
-    get_or_create_dictionary_item,
-)
+from .dictionary import get_dict_id, get_or_create_dictionary_item
 
 __all__ = ['DictionaryItem',
            'sim_query_from_name_list', 'sim_query_from_args',
@@ -29,6 +29,14 @@ def set_data_of_unknown_type(obj, data):
     mapper.set(obj,data)
 
 
+def pack_data_of_unknown_type(data):
+    """Return the name of the attribute in which the given data would be stored, and the value to store there.
+
+    This allows rows to be written directly to the database without constructing ORM objects."""
+    mapper = DataAttributeMapper(data=data)
+    return mapper._attribute_name, mapper.pack(data)
+
+
 class DataAttributeMapper:
     _order = 0
     # this can be used to force a subclass to be 'found' last
@@ -198,4 +206,4 @@ class NullAttributeMapper(DataAttributeMapper):
     def get(self, db_object):
         return None
 
-__all__ = ['get_data_of_unknown_type', 'set_data_of_unknown_type']
+__all__ = ['get_data_of_unknown_type', 'set_data_of_unknown_type', 'pack_data_of_unknown_type']
@@ -1,11 +1,13 @@
+import collections
+import threading
+import weakref
+
 import sqlalchemy
 import sqlalchemy.exc
-from sqlalchemy import Column, Integer, String
-
-from . import Base, get_default_session
+from sqlalchemy import Column, Integer, String, select
 
-_dict_id = {}  # maps dictionary text -> database ID
-_dict_obj = {} # maps session, dictionary text -> database object
+from .. import config
+from . import Base, get_engine_for_session
 
 
 class DictionaryItem(Base):
@@ -24,49 +26,96 @@ class DictionaryItem(Base):
         from .. import properties
         return properties.providing_class(self.text, handler, explain)
 
+class _DictionaryCache:
+    """Maps dictionary text -> database ID for one database, shared by all sessions and threads.
+
+    When a lookup misses, the rows added since the last refresh (i.e. with larger ids) are read, along with the row for
+    the missing text in case it was committed out of order. At most config.dictionary_cache_size entries are kept,
+    discarding the least recently used."""
+
+    def __init__(self):
+        self._ids = collections.OrderedDict()
+        self._max_id = 0
+        self._lock = threading.RLock()
+
+    def get(self, text):
+        """Return the cached ID for text, or None if it is not cached"""
+        with self._lock:
+            result = self._ids.get(text)
+            if result is not None:
+                self._ids.move_to_end(text)
+            return result
+
+    def lookup(self, text, engine):
+        """Return the ID for text, reading new entries from the database if it is not cached, or None if it does not
+        exist in the committed state of the database"""
+        with self._lock:
+            result = self.get(text)
+            if result is None:
+                with engine.connect() as connection:
+                    new_items = connection.execute(
+                        select(DictionaryItem.id, DictionaryItem.text)
+                        .where((DictionaryItem.id > self._max_id) | (DictionaryItem.text == text))
+                        .order_by(DictionaryItem.id)).all()
+                for id, item_text in new_items:
+                    if item_text == text:
+                        result = id
+                    else:
+                        self._add(item_text, id)
+                    self._max_id = max(self._max_id, id)
+                if result is not None:
+                    self._add(text, result) # last, so that it is not evicted by the other new items
+            return result
+
+    def _add(self, text, id):
+        self._ids[text] = id
+        self._ids.move_to_end(text)
+        while len(self._ids) > config.dictionary_cache_size:
+            self._ids.popitem(last=False)
+
+_dict_caches = weakref.WeakKeyDictionary() # maps engine -> _DictionaryCache
+_dict_caches_lock = threading.Lock()
+_dict_obj = weakref.WeakKeyDictionary() # maps session -> dictionary text -> database object
+
+def _get_dict_cache_for_engine(engine):
+    with _dict_caches_lock:
+        cache = _dict_caches.get(engine, None)
+        if cache is None:
+            cache = _dict_caches[engine] = _DictionaryCache()
+        return cache
+
 raise_exception = object()
 
 def get_dict_id(text, default=raise_exception, session=None, allow_query=True):
     """Get a DictionaryItem id for text (possibly cached). Raises KeyError if
     no dictionary object exists for the specified text, unless a default is provided
-    in which case the default value is returned instead."""
-
-    from . import Session
-
-    if session is None:
-        session = Session()
-        _dict_id = _get_dict_cache_for_session(get_default_session())
-        close_session=True
-    else:
-        _dict_id = _get_dict_cache_for_session(session)
-        close_session=False
-
-    try:
-        return _dict_id[text]
-    except KeyError:
-
-        if allow_query:
-            try:
-                obj = session.query(DictionaryItem).filter_by(text=text).first()
-            except:
-                if default is raise_exception:
-                    raise
-                else:
-                    return default
-            finally:
-                if close_session:
-                    session.close()
-        else:
-            obj = None
+    in which case the default value is returned instead.
+
+    If a session is specified, items it has created but not yet committed are also found."""
+
+    engine = get_engine_for_session(session)
+    cache = _get_dict_cache_for_engine(engine)
+
+    result = cache.get(text)
 
-        if obj is None:
+    if result is None and allow_query:
+        try:
+            result = cache.lookup(text, engine)
+            if result is None and session is not None:
+                result = session.execute(select(DictionaryItem.id).where(DictionaryItem.text == text)).scalar()
+        except:
             if default is raise_exception:
                 raise
             else:
                 return default
 
-        _dict_id[text] = obj.id
-        return obj.id
+    if result is None:
+        if default is raise_exception:
+            raise KeyError(text)
+        else:
+            return default
+
+    return result
 
 def get_or_create_dictionary_item(session, name):
     """This tries to get the DictionaryItem corresponding to name from
@@ -75,18 +124,18 @@ def get_or_create_dictionary_item(session, name):
     locked under the specified session* to prevent duplicate items
     being created"""
 
-    if session not in _dict_obj:
-        _dict_obj[session] = {}
+    session_dict_obj = _dict_obj.setdefault(session, {})
 
     # try to get it from the cache
-    obj = _dict_obj[session].get(name, None)
+    obj = session_dict_obj.get(name, None)
 
     if obj is not None:
         return obj
 
     # try to get it from the db
-    obj = session.query(DictionaryItem).filter_by(text=name).first()
-
+    dict_id = get_dict_id(name, None, session=session)
+    if dict_id is not None:
+        obj = session.get(DictionaryItem, dict_id)
 
     if obj is None:
         # try to create it
@@ -100,21 +149,9 @@ def get_or_create_dictionary_item(session, name):
             if obj is None:
                 raise # can't get it from the DB, can't create it from the DB... who knows...
 
-    _dict_obj[session][name] = obj
+    session_dict_obj[name] = obj
     return obj
 
-def _get_dict_cache_for_session(session):
-    session_dict = _dict_id.get(session, None)
-    if session_dict is None:
-        session_dict = {}
-        for dict_item in session.query(DictionaryItem):
-            session_dict[dict_item.text] = dict_item.id
-
-        _dict_id[session] = session_dict
-
-    return session_dict
-
 def get_lexicon(session):
     """Get a list of all strings known in the dictionary table"""
-    dict_cache = _get_dict_cache_for_session(session)
-    return dict_cache.keys()
+    return session.execute(select(DictionaryItem.text)).scalars().all()
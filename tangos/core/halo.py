@@ -262,7 +262,7 @@ class SimulationObjectBase(Base):
             self._setitem_property(key, obj)
 
     def _setitem_property(self, key, obj):
-        from . import Session
+        from . import Session, timestep_summary
         from .halo_data import HaloProperty
 
         session = Session.object_session(self)
@@ -271,7 +271,11 @@ class SimulationObjectBase(Base):
         if X is not None:
             X.data = obj
             X.creator = creator.get_creator(session)
+            timestep_summary.record_writes(session, [self.timestep_id])
         else:
+            if key.id is None:
+                session.flush() # the summary needs the id of the new dictionary item
+            timestep_summary.add_property_counts(session, [(self.timestep_id, self.object_typecode, self.id, key.id)])
             X = HaloProperty(self, key, obj)
             X.creator = creator.get_creator(session)
             session.add(X)
@@ -337,7 +341,7 @@ class SimulationObjectBase(Base):
 
     def plot(self, name, *args, **kwargs):
         from . import Session
-        name_id = get_dict_id(name, Session.object_session(self))
+        name_id = get_dict_id(name, session=Session.object_session(self))
         data = self.properties.filter_by(name_id=name_id).first()
         return data.plot(*args, **kwargs)
 
@@ -0,0 +1,221 @@
+"""Versioned upgrades of the database schema.
+
+Base.metadata.create_all creates any missing tables, but cannot change existing ones (e.g. adding columns or indexes).
+Such changes are instead made by the numbered migrations below, which are applied in order by upgrade. The version
+reached is recorded in the schemaversion table, so that once a database is up to date, checking it costs a single
+query.
+
+A new database is brought up to date when it is created. An existing database is only upgraded on request (with
+``tangos db-upgrade`` or init_db(upgrade=True)), since upgrading can take a long time for a large database and cannot
+be done through a read-only connection. Until then, the tables added by the upgrade (listed in tables_added_by_upgrade)
+may be missing, and the code that uses them must check first. Opening an existing database only makes the changes that
+are needed for it to be read at all (see check).
+
+Migrations must be idempotent, since a newly created database may already have some of their changes (and parallel
+processes may try to apply them at the same time). Each migration may provide a downgrade, for benchmarking or
+reverting a change by hand.
+"""
+
+import datetime
+
+import sqlalchemy.exc
+from sqlalchemy import Column, DateTime, Integer, Text, func, inspect, select, text
+
+from .. import log
+from . import Base
+
+
+class SchemaVersion(Base):
+    __tablename__ = 'schemaversion'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    description = Column(Text)
+    applied = Column(DateTime)
+
+    def __repr__(self):
+        return f"<SchemaVersion {self.version}: {self.description}>"
+
+
+class Migration:
+    def __init__(self, version, description, upgrade, downgrade=None):
+        self.version = version
+        self.description = description
+        self.upgrade = upgrade
+        self.downgrade = downgrade
+
+_migrations = []
+
+def migration(version, description):
+    """Decorator registering a function(connection) as the upgrade to the specified schema version"""
+    def register(upgrade):
+        assert version == len(_migrations)+1, "Migrations must be numbered consecutively"
+        _migrations.append(Migration(version, description, upgrade))
+        return upgrade
+    return register
+
+def downgrade_for(version):
+    """Decorator registering a function(connection) which reverts the migration to the specified schema version"""
+    def register(downgrade):
+        _migrations[version-1].downgrade = downgrade
+        return downgrade
+    return register
+
+# tables which are created by upgrade, rather than when an existing database is opened
+tables_added_by_upgrade = ['schemaversion', 'timestepsummaries', 'timestepwritecounters']
+
+def latest_version():
+    return len(_migrations)
+
+def get_version(connection):
+    """Return the schema version of the database, or 0 if no migrations have been recorded"""
+    if not inspect(connection).has_table(SchemaVersion.__tablename__):
+        return 0
+    return connection.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+
+def create(engine):
+    """Create the tables for a new database, at the latest schema version"""
+    Base.metadata.create_all(engine)
+    upgrade(engine)
+
+def check(engine, finder_offset_colname='finder_offset'):
+    """Make the changes that are essential for an existing database to be read.
+
+    If the database cannot be written to, the changes are skipped with a warning."""
+    try:
+        with engine.begin() as connection:
+            _add_finder_offset(connection, finder_offset_colname)
+        Base.metadata.create_all(engine, tables=[table for table in Base.metadata.sorted_tables
+                                                 if table.name not in tables_added_by_upgrade])
+    except sqlalchemy.exc.OperationalError as e:
+        log.logger.warning("Unable to check the database schema, possibly because the database is read-only (%s)",
+                           e.orig)
+
+def warn_if_out_of_date(engine):
+    with engine.connect() as connection:
+        version = get_version(connection)
+    if version < latest_version():
+        log.logger.warning("The database schema is out of date (version %d; the latest is %d). Run 'tangos db-upgrade' "
+                           "to bring it up to date.", version, latest_version())
+
+def upgrade(engine, target_version=None):
+    """Create any missing tables, then apply, in order, each migration the database has not yet had, up to
+    target_version (default: latest)"""
+    if target_version is None:
+        target_version = latest_version()
+
+    Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        version = get_version(connection)
+        if version >= target_version:
+            return
+        # a database with no halos is new, or at least has no data to upgrade, so there is no need to report progress
+        report = connection.execute(select(text("1")).select_from(text("halos")).limit(1)).first() is not None
+
+    for m in _migrations[version:target_version]:
+        if report:
+            log.logger.info("Upgrading database schema to version %d: %s", m.version, m.description)
+        with engine.begin() as connection:
+            m.upgrade(connection)
+            connection.execute(SchemaVersion.__table__.insert().values(version=m.version, description=m.description,
+                                                                         applied=datetime.datetime.now()))
+
+def downgrade(engine, target_version):
+    """Revert, in reverse order, each migration after target_version"""
+    with engine.connect() as connection:
+        version = get_version(connection)
+
+    for m in reversed(_migrations[target_version:version]):
+        if m.downgrade is None:
+            raise ValueError(f"Schema version {m.version} ({m.description}) cannot be reverted")
+        log.logger.info("Reverting database schema version %d: %s", m.version, m.description)
+        with engine.begin() as connection:
+            m.downgrade(connection)
+            connection.execute(SchemaVersion.__table__.delete().where(SchemaVersion.version >= m.version))
+
+
+def _dialect_name(connection):
+    return connection.dialect.name
+
+def _index_exists(connection, table, name):
+    return name in [index['name'] for index in inspect(connection).get_indexes(table)]
+
+def _create_covering_index(connection, name, table, key_columns, covered_columns):
+    """Create an index on key_columns from which covered_columns can also be read, without visiting the table.
+
+    On PostgreSQL (version 11 or later), the covered columns are stored in the index with INCLUDE. Other databases
+    append them to the key columns instead. (SQLite and MySQL/InnoDB indexes already contain the integer primary key.)
+    """
+    if _index_exists(connection, table, name):
+        return
+    if _dialect_name(connection) == 'postgresql' and connection.dialect.server_version_info >= (11,):
+        ddl = f"CREATE INDEX {name} ON {table} ({', '.join(key_columns)}) INCLUDE ({', '.join(covered_columns)})"
+    else:
+        covered_columns = [c for c in covered_columns if c != 'id']
+        ddl = f"CREATE INDEX {name} ON {table} ({', '.join(key_columns + covered_columns)})"
+
+    savepoint = connection.begin_nested()
+    try:
+        connection.execute(text(ddl))
+    except Exception:
+        savepoint.rollback()
+        if not _index_exists(connection, table, name):
+            raise
+        # another process created the index at the same time
+    else:
+        savepoint.commit()
+
+    if _dialect_name(connection) == 'sqlite' and inspect(connection).has_table('sqlite_stat1'):
+        # if the database has been analyzed, the query planner prefers indexes that have statistics, so the new index
+        # would not be used until the next ANALYZE
+        connection.execute(text(f"ANALYZE {name}"))
+
+def _drop_index(connection, table, name):
+    if not _index_exists(connection, table, name):
+        return
+    if _dialect_name(connection) == 'mysql':
+        connection.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        connection.execute(text(f"DROP INDEX {name}"))
+
+
+@migration(1, "Add finder_offset column to halos")
+def _add_finder_offset(connection, colname='finder_offset'):
+    cols = inspect(connection).get_columns('halos')
+    if colname in [c['name'] for c in cols]:
+        return
+    log.logger.warning("The database uses an old schema, missing the finder_offset column from halos. Attempting to update.")
+    connection.execute(text(f"alter table halos add column {colname} integer;"))
+    connection.execute(text(f"update halos set {colname} = finder_id;"))
+    log.logger.warning("The database update appeared to complete without any problems.")
+
+
+_covering_indexes = [
+    # property lookups by halo and name, as made by HaloPropertyGetter.get_from_session and the joins in
+    # Calculation.supplement_halo_query (which do not filter on deprecated, so the index is not partial)
+    ("haloproperties_covering_index", "haloproperties", ["halo_id", "name_id"],
+     ["id", "deprecated", "data_float", "data_int", "creator_id"]),
+    # link traversal from a halo, as made by the joins in Calculation.supplement_halo_query and by link queries
+    ("halolink_covering_index", "halolink", ["halo_from_id", "relation_id"],
+     ["id", "halo_to_id", "weight", "creator_id"])
+]
+
+@migration(2, "Add covering indexes for property and link lookups")
+def _add_covering_indexes(connection):
+    for name, table, key_columns, covered_columns in _covering_indexes:
+        _create_covering_index(connection, name, table, key_columns, covered_columns)
+
+@downgrade_for(2)
+def _drop_covering_indexes(connection):
+    for name, table, _, _ in _covering_indexes:
+        _drop_index(connection, table, name)
+
+@migration(3, "Add per-timestep write counters")
+def _add_write_counters(connection):
+    from .timestep_summary import TimeStepWriteCounter
+    TimeStepWriteCounter.__table__.create(connection, checkfirst=True)
+
+@downgrade_for(3)
+def _drop_write_counters(connection):
+    from .timestep_summary import TimeStepWriteCounter
+    TimeStepWriteCounter.__table__.drop(connection, checkfirst=True)
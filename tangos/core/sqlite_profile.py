@@ -0,0 +1,84 @@
+"""The read-optimised SQLite profile, enabled by config.sqlite_read_optimised.
+
+By default, SQLite uses a rollback journal, in which a process committing a write blocks every other process from
+reading. Parallel tangos ranks therefore guard their reads with an application-level SharedLock, so that reads and
+writes take turns. In the read-optimised profile:
+
+* the database uses write-ahead logging (WAL), so that readers see the last committed state of the database while a
+  write is in progress, rather than waiting for it;
+* each connection memory-maps the database file and keeps a larger page cache;
+* SELECT statements are sent to a separate read-only connection, until anything is written in the current
+  transaction. Queries therefore never start a read transaction on the writing connection that would later need to be
+  upgraded to a write (which, in WAL mode, fails immediately if another process has committed in the meantime).
+  Once a transaction has written, its queries use the writing connection so that they see its own changes.
+
+Reads no longer need to be guarded by the application-level lock (see reads_need_lock). WAL relies on shared memory
+between processes, so the profile must only be used for databases on local disks, not network filesystems."""
+
+import os
+
+import sqlalchemy
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from .. import config
+
+
+def is_applicable(db_uri):
+    """Return True if the database URI refers to an SQLite database file (rather than an in-memory database)"""
+    url = sqlalchemy.engine.make_url(db_uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+def _set_pragmas(dbapi_connection, read_only):
+    cursor = dbapi_connection.cursor()
+    try:
+        if not read_only:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL") # in WAL mode, still safe against corruption
+        cursor.execute("PRAGMA mmap_size=%d" % int(config.sqlite_mmap_size))
+        cursor.execute("PRAGMA cache_size=%d" % -int(config.sqlite_cache_size // 1024))
+    finally:
+        cursor.close()
+
+def configure_engine(engine):
+    """Set up the writing engine to use WAL journaling, memory-mapping and a larger cache"""
+    event.listen(engine, "connect", lambda dbapi_connection, _: _set_pragmas(dbapi_connection, False))
+
+def create_read_only_engine(db_uri, timeout, verbose):
+    """Create an engine opening read-only connections to the same SQLite database file"""
+    url = sqlalchemy.engine.make_url(db_uri)
+    url = url.set(database="file:" + os.path.abspath(url.database), query={"mode": "ro", "uri": "true"})
+    # tangos opens many short-lived sessions, not all of which are explicitly closed, so a bounded pool could be
+    # exhausted. Opening a read-only SQLite connection is cheap, and since the file is memory-mapped, pages are read
+    # straight from the operating system's cache rather than being lost with each connection.
+    engine = create_engine(url, echo=verbose, connect_args={"timeout": timeout},
+                           poolclass=sqlalchemy.pool.NullPool)
+    event.listen(engine, "connect", lambda dbapi_connection, _: _set_pragmas(dbapi_connection, True))
+    return engine
+
+
+class ReadWriteSplitSession(Session):
+    """A session that sends SELECT statements to a read-only engine, unless the current transaction has written"""
+
+    def __init__(self, *args, read_only_bind=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not isinstance(self.bind, sqlalchemy.engine.Engine):
+            # the session has been bound to a specific connection (e.g. by testing.autorevert), which might have
+            # uncommitted changes that would not be visible to the read-only engine
+            read_only_bind = None
+        self._read_only_bind = read_only_bind
+        self._has_written = False
+        event.listen(self, "after_transaction_end", self._after_transaction_end)
+
+    def _after_transaction_end(self, session, transaction):
+        if transaction.parent is None:
+            self._has_written = False
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._read_only_bind is not None and not self._has_written and not self._flushing \
+                and isinstance(clause, sqlalchemy.sql.Select):
+            return self._read_only_bind
+        # anything else (flushes, DML, DDL, or requests for the connection itself e.g. to create temporary tables)
+        # goes to the writing engine, and all subsequent statements in the transaction must follow it
+        self._has_written = True
+        return super().get_bind(mapper, clause=clause, **kwargs)
@@ -131,6 +131,10 @@ class TimeStep(Base):
                          every object.
 
         :param order_by_halo_number: if True, order by halo number; otherwise by database ID (default)
+
+        :param use_column_export: if True, and all the requested properties are plain stored properties, read them
+                                  from the column export written by tangos export-columns, provided that it is up to
+                                  date with the database. Defaults to config.use_column_export.
         """
 
         from .. import live_calculation
@@ -151,6 +155,15 @@ class TimeStep(Base):
         else:
             property_description = live_calculation.parser.parse_property_names(*plist)
 
+        if kwargs.get('use_column_export', config.use_column_export):
+            from ..util import column_export
+            names = column_export.stored_property_names(property_description)
+            if names is not None:
+                results = column_export.calculate_all_from_export(self, names, object_typecode, limit, sanitize,
+                                                                  order_by_halo_number)
+                if results is not None:
+                    return results
+
         # must be performed in its own session as we intentionally load in a lot of
         # objects with incomplete lazy-loaded properties
         session = Session()
@@ -0,0 +1,296 @@
+"""Precomputed per-timestep object counts and property availability.
+
+Counting the objects in a timestep, or the number of objects that have a given property, requires scanning the halos
+and haloproperties tables. For large databases those scans are too slow to run on every web request or command-line
+listing, so the tools that add objects or write/delete properties keep a small summary table up to date for the
+timesteps they touch. Writing properties adds to the stored counts (see add_property_counts) rather than recounting,
+so that the cost does not grow with the size of the timestep.
+
+Each row of the summary table gives a count for one timestep and object type. Rows with a null name_id count the
+objects themselves; rows with a name_id count the objects that have a (non-deprecated) property of that name.
+A timestep is regarded as summarised once it has object-count rows. For timesteps that have never been summarised
+(e.g. in databases created by older versions of tangos), the readers fall back to counting live. The same applies if
+the database does not yet have the summary table, which is created by ``tangos db-upgrade``; until then, the writers
+do nothing. The whole table can be rebuilt with ``tangos refresh-summaries``.
+
+The same writers also increment a counter for each timestep they write to (see record_writes). Anything derived from
+the objects or properties of a timestep (e.g. a column export) can record the counter, and later compare it with the
+current value to tell cheaply whether the timestep has since been written to. Writes made other than through tangos
+(e.g. by SQL) are not counted.
+"""
+
+import weakref
+
+import sqlalchemy
+from sqlalchemy import Column, ForeignKey, Integer, delete, exists, func, insert, literal, select, update
+from sqlalchemy.orm import backref, relationship
+
+from . import Base, get_engine_for_session
+from .dictionary import DictionaryItem
+from .halo import SimulationObjectBase
+from .halo_data import HaloProperty
+from .timestep import TimeStep
+
+
+class TimeStepSummary(Base):
+    __tablename__ = 'timestepsummaries'
+
+    id = Column(Integer, primary_key=True)
+    timestep_id = Column(Integer, ForeignKey('timesteps.id'))
+    timestep = relationship(TimeStep, backref=backref('summaries', cascade_backrefs=False, lazy='dynamic'),
+                            cascade='')
+    object_typecode = Column(Integer, nullable=False)
+    name_id = Column(Integer, ForeignKey('dictionary.id'), nullable=True) # null for rows counting the objects themselves
+    name = relationship(DictionaryItem)
+    count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        if self.name_id is None:
+            what = "objects"
+        else:
+            what = repr(self.name.text)
+        return "<TimeStepSummary timestep_id=%d typecode=%d %s: %d>"%(self.timestep_id, self.object_typecode,
+                                                                      what, self.count)
+
+
+class TimeStepWriteCounter(Base):
+    __tablename__ = 'timestepwritecounters'
+
+    timestep_id = Column(Integer, ForeignKey('timesteps.id'), primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return "<TimeStepWriteCounter timestep_id=%d: %d>"%(self.timestep_id, self.count)
+
+
+_engines_with_table = {} # maps table name -> set of engines known to have the table
+
+def _has_table(session, table_name):
+    engine = get_engine_for_session(session)
+    engines = _engines_with_table.setdefault(table_name, weakref.WeakSet())
+    if engine not in engines:
+        if not sqlalchemy.inspect(engine).has_table(table_name):
+            return False
+        engines.add(engine) # the tables are never removed, so need not be checked again
+    return True
+
+def is_available(session):
+    """Return True if the database has the summary table (see migrations.tables_added_by_upgrade)"""
+    return _has_table(session, TimeStepSummary.__tablename__)
+
+def record_writes(session, timesteps=None):
+    """Increment the write counters of the specified timesteps (or all timesteps if None).
+
+    The caller is responsible for committing the session."""
+    if not _has_table(session, TimeStepWriteCounter.__tablename__):
+        return
+    timestep_ids = _timestep_ids(timesteps)
+    table = TimeStepWriteCounter.__table__
+    session.execute(update(table).where(_filter_in(table.c.timestep_id, timestep_ids)).
+                    values(count=table.c.count + 1))
+    session.execute(insert(table).from_select(['timestep_id', 'count'],
+                                              select(TimeStep.id, literal(1)).
+                                              where(_filter_in(TimeStep.id, timestep_ids),
+                                                    ~exists().where(table.c.timestep_id == TimeStep.id))))
+
+def get_write_count(session, timestep):
+    """Return the number of writes recorded for the timestep, or None if the database cannot record them"""
+    if not _has_table(session, TimeStepWriteCounter.__tablename__):
+        return None
+    timestep_id, = _timestep_ids([timestep])
+    return session.execute(select(TimeStepWriteCounter.count).
+                           where(TimeStepWriteCounter.timestep_id == timestep_id)).scalar() or 0
+
+def _filter_in(column, ids):
+    if ids is None:
+        return sqlalchemy.true()
+    else:
+        return column.in_(list(ids))
+
+def _live_object_counts(timestep_ids):
+    return select(SimulationObjectBase.timestep_id, SimulationObjectBase.object_typecode,
+                  func.count(SimulationObjectBase.id)).\
+        where(_filter_in(SimulationObjectBase.timestep_id, timestep_ids)).\
+        group_by(SimulationObjectBase.timestep_id, SimulationObjectBase.object_typecode)
+
+def _live_property_counts(timestep_ids, name_ids=None):
+    return select(SimulationObjectBase.timestep_id, SimulationObjectBase.object_typecode, HaloProperty.name_id,
+                  func.count(sqlalchemy.distinct(HaloProperty.halo_id))).\
+        select_from(HaloProperty).\
+        join(SimulationObjectBase, HaloProperty.halo_id == SimulationObjectBase.id).\
+        where(HaloProperty.deprecated == False,
+              _filter_in(SimulationObjectBase.timestep_id, timestep_ids),
+              _filter_in(HaloProperty.name_id, name_ids)).\
+        group_by(SimulationObjectBase.timestep_id, SimulationObjectBase.object_typecode, HaloProperty.name_id)
+
+def _timestep_ids(timesteps):
+    if timesteps is None:
+        return None
+    return [ts.id if isinstance(ts, TimeStep) else int(ts) for ts in timesteps]
+
+def refresh_object_counts(session, timesteps=None):
+    """Recompute the stored object counts for the specified timesteps (or all timesteps if None).
+
+    Timesteps that were not previously summarised also have their property counts computed.
+
+    The caller is responsible for committing the session."""
+    record_writes(session, timesteps)
+    if not is_available(session):
+        return
+    timestep_ids = _timestep_ids(timesteps)
+    table = TimeStepSummary.__table__
+    previously_summarised = _summarised_timestep_ids(session, timestep_ids)
+    session.execute(delete(table).where(table.c.name_id.is_(None),
+                                        _filter_in(table.c.timestep_id, timestep_ids)))
+    session.execute(insert(table).from_select(['timestep_id', 'object_typecode', 'count'],
+                                              _live_object_counts(timestep_ids)))
+    newly_summarised = _summarised_timestep_ids(session, timestep_ids) - previously_summarised
+    if len(newly_summarised)>0:
+        refresh_property_counts(session, newly_summarised)
+
+def refresh_property_counts(session, timesteps=None, name_ids=None):
+    """Recompute the stored property counts for the specified timesteps and names (or all, if None).
+
+    The caller is responsible for committing the session."""
+    record_writes(session, timesteps)
+    if not is_available(session):
+        return
+    timestep_ids = _timestep_ids(timesteps)
+    table = TimeStepSummary.__table__
+    session.execute(delete(table).where(table.c.name_id.is_not(None),
+                                        _filter_in(table.c.timestep_id, timestep_ids),
+                                        _filter_in(table.c.name_id, name_ids)))
+    session.execute(insert(table).from_select(['timestep_id', 'object_typecode', 'name_id', 'count'],
+                                              _live_property_counts(timestep_ids, name_ids)))
+
+_max_ids_per_query = 5000
+
+def add_property_counts(session, new_properties):
+    """Add properties that are about to be written to the stored counts, without recounting existing properties.
+
+    This must be called before the new properties are flushed or inserted, so that objects which already have a
+    property of the same name are not counted twice. Timesteps that have not been summarised are skipped, since they
+    are counted live. The caller is responsible for committing the session.
+
+    :param new_properties: an iterable of (timestep_id, object_typecode, object_id, name_id), one for each
+                           non-deprecated property to be written
+    """
+    objects_by_key = {} # maps (timestep_id, object_typecode, name_id) -> set of object ids
+    for timestep_id, object_typecode, object_id, name_id in new_properties:
+        objects_by_key.setdefault((timestep_id, object_typecode, name_id), set()).add(object_id)
+    if len(objects_by_key)==0:
+        return
+
+    with session.no_autoflush:
+        record_writes(session, {key[0] for key in objects_by_key})
+    if not is_available(session):
+        return
+
+    table = TimeStepSummary.__table__
+    with session.no_autoflush:
+        summarised = _summarised_timestep_ids(session, {key[0] for key in objects_by_key})
+        objects_by_key = {key: ids for key, ids in objects_by_key.items() if key[0] in summarised}
+
+        object_ids = list(set().union(*objects_by_key.values()))
+        name_ids = list({key[2] for key in objects_by_key})
+        existing = set()
+        for i in range(0, len(object_ids), _max_ids_per_query):
+            existing.update(session.execute(
+                select(HaloProperty.halo_id, HaloProperty.name_id).distinct().
+                where(HaloProperty.halo_id.in_(object_ids[i:i+_max_ids_per_query]),
+                      HaloProperty.name_id.in_(name_ids), HaloProperty.deprecated == False)).all())
+
+        for (timestep_id, object_typecode, name_id), ids in objects_by_key.items():
+            increment = sum(1 for object_id in ids if (object_id, name_id) not in existing)
+            if increment==0:
+                continue
+            key_condition = (table.c.timestep_id == timestep_id) & (table.c.object_typecode == object_typecode) & \
+                            (table.c.name_id == name_id)
+            result = session.execute(update(table).where(key_condition).values(count=table.c.count + increment))
+            if result.rowcount==0:
+                session.execute(insert(table).values(timestep_id=timestep_id, object_typecode=object_typecode,
+                                                     name_id=name_id, count=increment))
+
+def refresh(session, timesteps=None):
+    """Recompute all stored counts for the specified timesteps (or the entire database if None)"""
+    refresh_object_counts(session, timesteps)
+    refresh_property_counts(session, timesteps)
+
+def remove(session, timesteps):
+    """Remove the summary and write counters for the specified timesteps, e.g. because they are about to be deleted"""
+    timestep_ids = _timestep_ids(timesteps)
+    if _has_table(session, TimeStepWriteCounter.__tablename__):
+        table = TimeStepWriteCounter.__table__
+        session.execute(delete(table).where(_filter_in(table.c.timestep_id, timestep_ids)))
+    if not is_available(session):
+        return
+    table = TimeStepSummary.__table__
+    session.execute(delete(table).where(_filter_in(table.c.timestep_id, timestep_ids)))
+
+
+def get_object_counts_for_timesteps(session, timesteps):
+    """Return a dictionary mapping timestep id -> {object_typecode: count}
+
+    Timesteps that have not been summarised are counted live."""
+    timestep_ids = _timestep_ids(timesteps)
+    result = {ts_id: {} for ts_id in timestep_ids}
+    if is_available(session):
+        stored = session.execute(select(TimeStepSummary.timestep_id, TimeStepSummary.object_typecode,
+                                        TimeStepSummary.count).
+                                 where(TimeStepSummary.name_id.is_(None),
+                                       TimeStepSummary.timestep_id.in_(timestep_ids)))
+        for ts_id, typecode, count in stored:
+            result[ts_id][typecode] = count
+
+    unsummarised = [ts_id for ts_id, counts in result.items() if len(counts)==0]
+    if len(unsummarised)>0:
+        for ts_id, typecode, count in session.execute(_live_object_counts(unsummarised)):
+            result[ts_id][typecode] = count
+
+    return result
+
+def get_object_counts(session, timestep):
+    """Return a dictionary mapping object_typecode -> number of objects of that type in the timestep"""
+    return get_object_counts_for_timesteps(session, [timestep])[_timestep_ids([timestep])[0]]
+
+def _is_summarised(session, timestep_id):
+    if not is_available(session):
+        return False
+    return session.execute(select(TimeStepSummary.id).where(TimeStepSummary.name_id.is_(None),
+                                                             TimeStepSummary.timestep_id == timestep_id).
+                           limit(1)).first() is not None
+
+def _summarised_timestep_ids(session, timestep_ids):
+    if not is_available(session):
+        return set()
+    return set(session.execute(select(TimeStepSummary.timestep_id).distinct().
+                               where(TimeStepSummary.name_id.is_(None),
+                                     _filter_in(TimeStepSummary.timestep_id, timestep_ids))).scalars())
+
+def get_property_counts(session, timestep, object_typecode=None):
+    """Return a dictionary mapping property name -> number of objects in the timestep that have the property
+
+    :param object_typecode: if specified, only count objects of this type; otherwise count objects of all types
+    """
+    timestep_id, = _timestep_ids([timestep])
+
+    if _is_summarised(session, timestep_id):
+        rows = session.execute(select(TimeStepSummary.object_typecode, TimeStepSummary.name_id,
+                                      TimeStepSummary.count).
+                               where(TimeStepSummary.name_id.is_not(None),
+                                     TimeStepSummary.timestep_id == timestep_id))
+    else:
+        rows = ((typecode, name_id, count) for _, typecode, name_id, count in
+                session.execute(_live_property_counts([timestep_id])))
+
+    counts_by_name_id = {}
+    for typecode, name_id, count in rows:
+        if object_typecode is None or typecode == object_typecode:
+            counts_by_name_id[name_id] = counts_by_name_id.get(name_id, 0) + count
+
+    if len(counts_by_name_id)==0:
+        return {}
+
+    names = dict(session.execute(select(DictionaryItem.id, DictionaryItem.text).
+                                 where(DictionaryItem.id.in_(list(counts_by_name_id.keys())))).all())
+    return {names[name_id]: count for name_id, count in counts_by_name_id.items()}
@@ -71,7 +71,7 @@ class TrackData(Base):
         return "<TrackData %d of %s, len=%d" % (self.halo_number, repr(self.simulation), len(self.particles))
 
     def create_objects(self, class_=Tracker, first_timestep=None):
-        from . import Session
+        from . import Session, timestep_summary
         session = Session.object_session(self)
 
         timesteps = self.simulation.timesteps
@@ -94,6 +94,8 @@ class TrackData(Base):
             else:
                 logger.debug("This tracker is already present in %r",ts)
 
+        session.flush()
+        timestep_summary.refresh_object_counts(session, timesteps)
         session.commit()
 
     def create_links(self, class_=Tracker):
@@ -114,6 +114,27 @@ class HandlerBase:
         statfile = self.get_stat_file(ts_extension, object_typetag)
         yield from statfile.iter_rows(*property_names)
 
+    def read_object_properties_for_timestep(self, ts_extension, object_typetag, property_names):
+        """Read pre-computed data for all objects of specified type at once, as columns.
+
+        Returns a list of numpy arrays with one entry per object: the finder offsets, the finder ids, and then the
+        values of each requested property. Values that are not plain numbers (such as proxy objects, lists, arrays or
+        None) are held in arrays of dtype object.
+
+        The default implementation collects the rows from iterate_object_properties_for_timestep, unless that is
+        itself the stat file implementation above, in which case the columns are read from the stat file directly.
+        Handlers able to read entire columns more efficiently may override this method.
+        """
+        if type(self).iterate_object_properties_for_timestep is HandlerBase.iterate_object_properties_for_timestep:
+            return self.get_stat_file(ts_extension, object_typetag).read_columns(*property_names)
+
+        from .halo_stat_files import translations
+        rows = list(self.iterate_object_properties_for_timestep(ts_extension, object_typetag, property_names))
+        for row in rows:
+            if len(row)!=2+len(property_names):
+                raise RuntimeError(f"Incorrect length of row returned from iterate_object_properties_for_timestep. Check implementation of {type(self)}.")
+        return [translations.array_from_values([row[i] for row in rows]) for i in range(2+len(property_names))]
+
 
     def load_timestep(self, ts_extension, mode=None):
         """Returns an object that connects to the data for a timestep on disk -- possibly a version cached in
@@ -169,6 +190,23 @@ class HandlerBase:
         :arg mode - sets a method for loading the tracked region; see load_object mode for more information"""
         raise NotImplementedError
 
+    def match_objects_symmetric(self, ts1, ts2, halo_min, halo_max, dm_only=False, threshold=0.005,
+                                object_typetag='halo', output_handler_for_ts2=None, low_memory=False):
+        """Match objects in both directions between two timesteps.
+
+        Returns a tuple (forward, backward) where forward is the result of match_objects from ts1 to ts2 and backward
+        is the result from ts2 to ts1. This default implementation simply calls match_objects twice; subclasses
+        may override it to derive both directions from a single pass over the particles.
+
+        If low_memory is True, handlers that support it read only the particle ids and object membership rather
+        than bridging the full snapshots. Other handlers ignore the flag."""
+        output_handler_for_ts2 = output_handler_for_ts2 or self
+        forward = self.match_objects(ts1, ts2, halo_min, halo_max, dm_only, threshold, object_typetag,
+                                     output_handler_for_ts2=output_handler_for_ts2)
+        backward = output_handler_for_ts2.match_objects(ts2, ts1, halo_min, halo_max, dm_only, threshold,
+                                                        object_typetag, output_handler_for_ts2=self)
+        return forward, backward
+
 
     @classmethod
     def handler_class_name(cls):
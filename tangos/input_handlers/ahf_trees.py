@@ -24,75 +24,115 @@ class AHFTree:
             raise OSError("Cannot infer path of merger tree files")
 
     def _load_fid(self, ts):
-        self._fid = np.array([x.finder_id for x in ts.halos.all()])
+        self._fid = np.sort(np.array([x.finder_id for x in ts.halos.all()]))
+
+    @property
+    def _sidecar_path(self):
+        return self._path + ".tangos.npz"
 
     def _load_raw_links(self):
         """
         There is at least two different file formats for the AHF mtree files. One includes information about the particles shared across haloes,
         the other not and simply orders the progenitors by a merit function.
         This little function is to decide which file format we are dealing with.
+
+        The parsed links are stored in a .npz sidecar file next to the mtree file, so that subsequent runs need not
+        parse the text file again.
         """
 
-        try:
-            self._load_mtree_file_standard()
-        except:
-            logger.info("Could not load AHF mtree file in standard format. Trying the non-standard form.")
+        links = self._load_sidecar()
+        if links is None:
             try:
-                self._load_mtree_file_cropped()
+                links = self._load_mtree_file_standard()
             except:
-                logger.info("Could not load AHF mtree file in non-standard format either. Make sure mtree files exist.")
-                raise OSError("Could not load merger tree files")
-
+                logger.info("Could not load AHF mtree file in standard format. Trying the non-standard form.")
+                try:
+                    links = self._load_mtree_file_cropped()
+                except:
+                    logger.info("Could not load AHF mtree file in non-standard format either. Make sure mtree files exist.")
+                    raise OSError("Could not load merger tree files")
+            self._save_sidecar(links)
+
+        # check if the progenitor was loaded in case a minimum number of particles different to AHF was used to load
+        # halos into DB. Keep in mind finder id and AHF id have an offset of 1
+        in_database = np.isin(links['id_this'], self._fid)
+        self.links = {k: v[in_database] for k, v in links.items()}
+
+    def _source_signature(self):
+        stat = os.stat(self._path)
+        return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+    def _load_sidecar(self):
+        try:
+            with np.load(self._sidecar_path) as f:
+                if not np.array_equal(f['source_signature'], self._source_signature()):
+                    return None
+                return {k: f[k] for k in ('id_this', 'id_desc', 'f_share')}
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_sidecar(self, links):
+        temp_path = self._sidecar_path + ".tmp.%d" % os.getpid()
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, source_signature=self._source_signature(), **links)
+            os.replace(temp_path, self._sidecar_path)
+        except OSError:
+            logger.warning("Unable to write AHF merger tree cache %s", self._sidecar_path)
+
+    @staticmethod
+    def _header_positions(nprogen_at, first_header, entries_per_header, nentries):
+        """Find the positions of the header entries, given a list with the number of progenitors following the header
+        at each position. Only the headers are visited, not the progenitor entries."""
+        positions = []
+        i = first_header
+        while i < nentries:
+            positions.append(i)
+            i += nprogen_at[i] + entries_per_header
+        return np.array(positions, dtype=np.int64)
 
     def _load_mtree_file_standard(self):
         """
         read in the AHF mtree file containing the indices of halos and its progenitors as well as information about the shared particles.
         We establish symmetric links since for AHF any progenitor can have several descendants cause of mass transfer.
         """
-        filename = os.path.join(self._path)
-        results = {'id_this':np.asarray([],dtype=np.int64), 'id_desc':np.asarray([],dtype=np.int64), 'f_share':np.asarray([],dtype=np.float64)} #np.empty((0,), dtype=np.dtype([('id_this', np.int64), ('id_desc', np.int64), ('Mvir', np.float32)]))
-
-        data = np.genfromtxt(filename,comments="#",dtype="int")
-        i=0
-        while i < len(data):
-            for j in range(data[i][2]):
-                idx = i+1+j
-                if data[idx][1] in self._fid: # check if this halo was loaded in case a minimum number of particles different to AHF was used to load halos into DB
-                # keep in mind finder id and AHF id have an offset of 1
-                    results['id_desc'] = np.append(results['id_desc'],data[i][0])
-                    results['id_this'] = np.append(results['id_this'],data[idx][1])
-                    results['f_share'] = np.append(results['f_share'], float(data[idx][0] * data[idx][0]) / (data[i][1] * data[idx][2]) )
-            i += data[i][2] + 1
-
-        self.links = results
+        data = np.loadtxt(self._path, comments="#", dtype=np.int64, ndmin=2)
+
+        headers = self._header_positions(data[:,2].tolist(), 0, 1, len(data))
+        nprogen = data[headers,2]
+        is_progenitor = np.ones(len(data), dtype=bool)
+        is_progenitor[headers] = False
+        progenitors = data[is_progenitor]
+        descendants = np.repeat(data[headers], nprogen, axis=0)
+
+        return {'id_this': progenitors[:,1],
+                'id_desc': descendants[:,0],
+                'f_share': progenitors[:,0].astype(np.float64)**2 / (descendants[:,1] * progenitors[:,2])}
 
     def _load_mtree_file_cropped(self):
         """
         read in the AHF mtree file containing only the indices of halos and its progenitors and assume progenitors are ordered in descending weight.
         """
-        filename = self._path
-        results = {'id_this':np.asarray([],dtype=np.int64), 'id_desc':np.asarray([],dtype=np.int64), 'f_share':np.asarray([],dtype=np.float64)} #'Mvir':np.asarray([],dtype=np.float64),
-
-        f = open(filename)
-        lines = f.readlines()
-        nhalos = int(lines[0])
-        skip = 1 #skip lines already read
-        i=0
-        while i < nhalos:
-            i += 1
-            _tmp = np.fromstring(lines[skip], dtype=np.dtype(int,int), sep=' ')
-            _id = int(_tmp[0])
-            nprogen = int(_tmp[1])
-            skip += 1 # increment the skip of lines for the line read above
-            if nprogen > 0:
-                for n in range(nprogen):
-                    _this_id = int(lines[skip+n]) # rip off the timestep which is encoded as the first 3 digits
-                    if _this_id in self._fid: # check if the halo exists in the database, this is needed if db was created with a minimum particle number per halo which does not agree with AHF definition
-                        results['id_desc'] = np.append(results['id_desc'],np.asarray([_id],dtype=np.int64))
-                        results['id_this'] = np.append(results['id_this'],np.asarray([_this_id],dtype=np.int64))
-                        results['f_share'] = np.append(results['f_share'], np.asarray([(nprogen-n)/nprogen],dtype=np.float64))
-            skip += nprogen   # increment line skip by already read lines
-        self.links = results
+        with open(self._path) as f:
+            tokens = np.array(f.read().split(), dtype=np.int64)
+
+        # the file starts with the number of halos; each halo then has an entry "id nprogen" followed by nprogen ids
+        nhalos = tokens[0]
+        headers = self._header_positions(tokens[1:].tolist(), 1, 2, len(tokens))
+        assert len(headers)==nhalos
+        nprogen = tokens[headers+1]
+        is_progenitor = np.ones(len(tokens), dtype=bool)
+        is_progenitor[0] = False
+        is_progenitor[headers] = False
+        is_progenitor[headers+1] = False
+
+        # rank of each progenitor within its list, counting from zero
+        rank = np.arange(is_progenitor.sum()) - np.repeat(np.cumsum(nprogen)-nprogen, nprogen)
+        nprogen_per_progenitor = np.repeat(nprogen, nprogen)
+
+        return {'id_this': tokens[is_progenitor],
+                'id_desc': np.repeat(tokens[headers], nprogen),
+                'f_share': (nprogen_per_progenitor-rank)/nprogen_per_progenitor}
 
     def _load_major_progenitor_branch(self):
         """
@@ -112,3 +152,11 @@ class AHFTree:
         merger_ratios = self.links['f_share']
 
         return list(zip(ids_this_snap, zip(ids_next_snap, merger_ratios)))
+
+    def get_link_arrays_for_snapshot(self):
+        """Get the links from snapshot ts to its immediate successor, as arrays.
+
+        Returns a tuple of the finder IDs at this snapshot, the corresponding IDs at the subsequent snapshot, and
+        the fraction of shared particles.
+        """
+        return self.links['id_this'], self.links['id_desc'], self.links['f_share']
@@ -1,16 +1,28 @@
+import json
 import os
 import re
+import shutil
+import tempfile
 
 import numpy as np
 
+from .. import config
 from ..log import logger
 
 
 class BHLogData:
-    """Class to load a Changa BH log files, either simname.BlackHoles or the (now deprecated) simname.shortened.orbit"""
+    """Class to load a Changa BH log files, either simname.BlackHoles or the (now deprecated) simname.shortened.orbit
+
+    The first time a log is parsed, the unit-converted columns are written as a binary cache next to the log file
+    (see config.bh_log_cache), together with indexes by BH id and by step. Subsequent loads in any process
+    memory-map the cache instead of re-parsing the ASCII log."""
     _cache = {}
     _n_cols = 0
 
+    _cache_format_version = 1
+    _columns = ('bhid', 'step', 'x', 'y', 'z', 'vx', 'vy', 'vz', 'mdot', 'mdotmean', 'mass', 'time', 'dM')
+    _index_columns = ('step_order', 'sorted_step', 'bhid_order', 'sorted_bhid')
+
     @classmethod
     def can_load(cls, filename):
         simname, stepnum = re.match(r"^(.*)\.(0[0-9]*)$", filename).groups()
@@ -45,11 +57,18 @@ class BHLogData:
         raise NotImplementedError
 
     def __init__(self, filename):
+        name, stepnum = re.match(r"^(.*)\.(0[0-9]*)$", filename).groups()
+        log_filename = self.filename(name)
+        if not (config.bh_log_cache and self._load_binary_cache(log_filename)):
+            self._parse(filename, log_filename)
+            if config.bh_log_cache:
+                self._write_binary_cache(log_filename)
+
+    def _parse(self, filename, log_filename):
         import pynbody
         f = pynbody.load(filename)
         self.boxsize = float(f.properties['boxsize'].in_units('kpc', a=f.properties['a']))
-        name, stepnum = re.match(r"^(.*)\.(0[0-9]*)$", filename).groups()
-        wrapped_ars = self.read_data(self.filename(name), f)
+        wrapped_ars = self.read_data(log_filename, f)
         iord, time, step, mass, x, y, z, vx, vy, vz, mdot, mdotmean, dMaccum, scalefac = wrapped_ars
 
         logger.info("Loaded a BH log with %d entries", len(time))
@@ -98,39 +117,139 @@ class BHLogData:
                      'vx': vx, 'vy': vy, 'vz': vz, 'mdot': mdot, 'mdotmean': mdotmean,'mass': mass,
                      'time': time, 'dM': dMaccum}
 
+        # indexes allowing lookups by step, and by BH id then step, using binary searches
+        self.step_order = np.argsort(np.asarray(step), kind='stable')
+        self.sorted_step = np.asarray(step)[self.step_order]
+        self.bhid_order = np.lexsort((np.asarray(step), np.asarray(iord)))
+        self.sorted_bhid = np.asarray(iord)[self.bhid_order]
+
+    @staticmethod
+    def _binary_cache_dirname(log_filename):
+        return log_filename + ".tangos-cache"
+
+    @staticmethod
+    def _source_signature(log_filename):
+        stat = os.stat(log_filename)
+        return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+    def _load_binary_cache(self, log_filename):
+        """Memory-map the binary cache for the given log, if it exists and is up to date. Returns True on success."""
+        import pynbody
+        cache_dirname = self._binary_cache_dirname(log_filename)
+        try:
+            with open(os.path.join(cache_dirname, "header.json")) as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if header.get('version') != self._cache_format_version or \
+                {k: header.get(k) for k in ('source_size', 'source_mtime_ns')} != self._source_signature(log_filename):
+            logger.info("Binary cache for BH log %s is out of date", log_filename)
+            return False
+
+        try:
+            self.vars = {}
+            for name in self._columns:
+                array = np.load(os.path.join(cache_dirname, name + ".npy"), mmap_mode='r').view(pynbody.array.SimArray)
+                if header['units'][name] is not None:
+                    array.units = header['units'][name]
+                self.vars[name] = array
+            for name in self._index_columns:
+                setattr(self, name, np.load(os.path.join(cache_dirname, name + ".npy"), mmap_mode='r'))
+        except (OSError, ValueError):
+            logger.warning("Binary cache for BH log %s could not be read", log_filename)
+            return False
+
+        self.boxsize = header['boxsize']
+        logger.info("Loaded a BH log with %d entries from its binary cache", len(self.vars['time']))
+        return True
+
+    def _write_binary_cache(self, log_filename):
+        import pynbody
+        cache_dirname = self._binary_cache_dirname(log_filename)
+        header = {'version': self._cache_format_version, 'boxsize': self.boxsize, 'units': {}}
+        header.update(self._source_signature(log_filename))
+        try:
+            # write into a temporary directory which is then renamed into place, so that other processes never see
+            # an incomplete cache
+            temp_dirname = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(log_filename)),
+                                            prefix=os.path.basename(cache_dirname) + ".")
+        except OSError:
+            logger.warning("Unable to write a binary cache for BH log %s", log_filename)
+            return
+
+        try:
+            for name in self._columns:
+                array = self.vars[name]
+                np.save(os.path.join(temp_dirname, name + ".npy"), np.asarray(array))
+                units = getattr(array, 'units', None)
+                header['units'][name] = None if units is None or isinstance(units, pynbody.units.NoUnit) else str(units)
+            for name in self._index_columns:
+                np.save(os.path.join(temp_dirname, name + ".npy"), getattr(self, name))
+            with open(os.path.join(temp_dirname, "header.json"), "w") as f:
+                json.dump(header, f)
+
+            shutil.rmtree(cache_dirname, ignore_errors=True)
+            os.rename(temp_dirname, cache_dirname)
+        except OSError:
+            # most likely another process has written the cache at the same time
+            logger.warning("Unable to write a binary cache for BH log %s", log_filename)
+            shutil.rmtree(temp_dirname, ignore_errors=True)
+
+    def _select(self, indices):
+        return {k: v[indices] for k, v in self.vars.items()}
+
+    def _bhid_range(self, bhid):
+        return np.searchsorted(self.sorted_bhid, bhid, side='left'), np.searchsorted(self.sorted_bhid, bhid, side='right')
+
     def get_at_stepnum(self, stepnum):
-        mask = self.vars['step'] == stepnum
-        return {k: v[mask] for k, v in self.vars.items()}
+        start = np.searchsorted(self.sorted_step, stepnum, side='left')
+        end = np.searchsorted(self.sorted_step, stepnum, side='right')
+        return self._select(self.step_order[start:end])
+
+    def get_all_entries_for_id(self, bhid):
+        """Return all log entries for the given BH, in order of step"""
+        start, end = self._bhid_range(bhid)
+        return self._select(self.bhid_order[start:end])
 
     def get_at_stepnum_for_id(self, stepnum, bhid):
-        vars = self.get_at_stepnum(stepnum)
-        try:
-            index = np.where(vars['bhid']==bhid)[0][0]
-        except IndexError:
+        start, end = self._bhid_range(bhid)
+        this_bh = self.bhid_order[start:end]
+        # entries for one BH are sorted by step
+        this_bh_steps = np.asarray(self.vars['step'][this_bh])
+        index = np.searchsorted(this_bh_steps, stepnum)
+        if index==len(this_bh) or this_bh_steps[index]!=stepnum:
             raise ValueError("BH %d not found in step %d"%(bhid,stepnum))
-        vars_this = {k:v[index] for k, v in vars.items()}
-        return vars_this
+        return {k: v[this_bh[index]] for k, v in self.vars.items()}
 
     def get_last_entry_for_id(self, bhid):
-        mask = self.vars['bhid'] == bhid
-        if mask.sum()==0:
+        start, end = self._bhid_range(bhid)
+        if end==start:
             raise ValueError("No entries for BH %d"%bhid)
-        ilast = np.argmax(self.vars['time'][mask])
-        return {k: v[mask][ilast] for k, v in self.vars.items()}
+        # restore the original order, so that ties in time resolve as they would in the log file
+        this_bh = np.sort(self.bhid_order[start:end])
+        ilast = this_bh[np.argmax(self.vars['time'][this_bh])]
+        return {k: v[ilast] for k, v in self.vars.items()}
 
     def determine_merger_ratio(self, bhid_eaten, bhid_survivor):
+        """Return the ratio of the mass of the eaten BH to that of the survivor, at the last step the eaten BH was
+        logged"""
         eaten_entries = self.get_last_entry_for_id(bhid_eaten)
         eaten_mass = eaten_entries['mass']
         survivor_entries = self.get_at_stepnum_for_id(eaten_entries['step'], bhid_survivor)
         survivor_premerger_mass = survivor_entries['mass']
         return eaten_mass/survivor_premerger_mass
 
-
     def get_for_named_snapshot(self, filename):
         name, stepnum = re.match(r"^(.*)\.(0[0-9]*)$", filename).groups()
         stepnum = int(stepnum)
         return self.get_at_stepnum(stepnum)
 
+    def get_for_named_snapshot_for_id(self, filename, bhid):
+        name, stepnum = re.match(r"^(.*)\.(0[0-9]*)$", filename).groups()
+        stepnum = int(stepnum)
+        return self.get_at_stepnum_for_id(stepnum, bhid)
+
 class BlackHolesLog(BHLogData):
     _n_cols = 18
     _col_types = [int, float, float, float, float, float,
@@ -107,13 +107,21 @@ class ConsistentTrees:
 
         Negative values indicate phantom halos, i.e. halos that were not present in the finder output"""
 
+        ids_this_snap, ids_next_snap, merger_ratios = self.get_link_arrays_for_snapshot(snapnum)
+        return dict(zip(ids_this_snap, zip(ids_next_snap, merger_ratios)))
+
+    def get_link_arrays_for_snapshot(self, snapnum):
+        """Get the links from snapshot snapnum to its immediate successor, as arrays.
+
+        Returns a tuple of the finder IDs at the given snapnum, the corresponding IDs at the subsequent snapshot,
+        and the merger ratios. As for get_links_for_snapshot, negative IDs indicate phantom halos."""
         this_snap_mask = self._snap_nums == snapnum
         ids_this_snap = self._id_to_finder_id[self.links['id_this'][this_snap_mask]]
         ids_next_snap = self._id_to_finder_id[self.links['id_desc'][this_snap_mask]]
 
         merger_ratios = self._get_merger_ratio_array(ids_next_snap, snapnum)
 
-        return dict(zip(ids_this_snap, zip(ids_next_snap, merger_ratios)))
+        return ids_this_snap, ids_next_snap, merger_ratios
 
     def get_finder_id_to_tree_id_for_snapshot(self, snapnum):
         """Get the internal consistent-trees ids for each original halo-finder ID"""
@@ -1,6 +1,7 @@
 import copy
 import glob
 import os
+import warnings
 
 import numpy as np
 
@@ -81,41 +82,123 @@ class HaloStatFile:
                     yield col_data
                     cnt += 1
 
-    def iter_rows(self, *args):
+    def read_columns_raw(self, *args):
         """
-        Yield the requested column values from the halo catalog stat file, as well as the finder_offset (index associated
-        with halo's position within the catalog) and finder_id (raw halo id listed in the stat file).
+        Read the requested columns for all halos in the stat file, without any emulation.
 
-        Returned halo properties are emulated when necessary. For example, AHF stat files do not contain n_dm; however,
-        its value can be automatically inferred by this function. Meanwhile IDL .amiga.stat files rename n_gas as N_gas.
+        The file is parsed in bulk, with the type of each column inferred from the first row. If any value does not
+        fit the inferred type, the file is instead parsed row by row using iter_rows_raw.
 
         :param args: strings for the column names
-        :return: finder_offset, finder_id, arg1, arg2, arg3 where argN is the value of the Nth named column
+        :return: finder_offset, finder_id, column1, column2, ... where each is a numpy array, except that columns not
+        present in the file are returned as None
+        """
+        try:
+            return self._read_columns_raw_in_bulk(args)
+        except ValueError:
+            return self._read_columns_raw_by_row(args)
+
+    def _read_columns_raw_in_bulk(self, args):
+        with open(self.filename) as f:
+            header = self._read_column_names(f)
+            column_ids = [0]+[header.index(a) if a in header else None for a in args]
+            read_ids = sorted({c for c in column_ids if c is not None})
+
+            first_data_position = f.tell()
+            first_row = f.readline()
+            while first_row.startswith("#"):
+                first_data_position = f.tell()
+                first_row = f.readline()
+            first_row = first_row.split()
+            if len(first_row)==0:
+                num_rows = 0
+                data = {c: np.array([]) for c in read_ids}
+            else:
+                dtype = [("c%d"%c, self._guess_column_dtype(first_row[c])) for c in read_ids]
+                try:
+                    table = self._load_table(f, first_data_position, read_ids, dtype)
+                except ValueError:
+                    # a column that looked like integers may contain floats further down; the finder ids are kept
+                    # as integers so as not to lose precision
+                    dtype = [(name, np.float64 if name!="c0" else t) for name, t in dtype]
+                    table = self._load_table(f, first_data_position, read_ids, dtype)
+                num_rows = len(table)
+                data = {c: table["c%d"%c] for c in read_ids}
+
+        columns = [None if c is None else data[c] for c in column_ids]
+        return [np.arange(num_rows)+self._finder_offset_start] + columns
+
+    @staticmethod
+    def _load_table(f, position, read_ids, dtype):
+        f.seek(position)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # numpy warns if there is no data
+            return np.loadtxt(f, comments="#", usecols=read_ids, dtype=dtype, ndmin=1)
+
+    @staticmethod
+    def _guess_column_dtype(example_str):
+        # follows the rules in _get_values_for_columns
+        if "." in example_str or "e" in example_str:
+            guess_type = float
+        else:
+            guess_type = int
+        guess_type(example_str) # raises ValueError if the column is not numeric
+        return np.float64 if guess_type is float else np.int64
+
+    def _read_columns_raw_by_row(self, args):
+        rows = list(self.iter_rows_raw(*args))
+        columns = [translations.array_from_values([row[i] for row in rows]) for i in range(len(args)+2)]
+        for i, a in enumerate(args):
+            if all(row[i+2] is None for row in rows):
+                columns[i+2] = None
+        return columns
+
+    def read_columns(self, *args):
         """
+        Read the requested columns for all halos in the stat file, as well as the finder_offset and finder_id.
+
+        Returned halo properties are emulated when necessary, as described in iter_rows.
 
+        :param args: strings for the column names
+        :return: finder_offset, finder_id, arg1, arg2, arg3 where each is a numpy array with one entry per halo
+        """
         raw_args = []
         for arg in args:
             if arg in self._column_translations:
                 raw_args+=self._column_translations[arg].inputs()
             else:
                 raw_args.append(arg)
-        for raw_values in self.iter_rows_raw(*raw_args):
-            values = [raw_values[0], raw_values[1]]
-            for arg in args:
-                if arg in self._column_translations:
-                    values.append(self._column_translations[arg](raw_args, raw_values[2:]))
-                else:
-                    values.append(raw_values[2:][raw_args.index(arg)])
-            yield values
+        raw_columns = self.read_columns_raw(*raw_args)
+        num_rows = len(raw_columns[0])
+        columns = [raw_columns[0], raw_columns[1]]
+        for arg in args:
+            if arg in self._column_translations:
+                column = self._column_translations[arg].columns(raw_args, raw_columns[2:], num_rows)
+            else:
+                column = raw_columns[2:][raw_args.index(arg)]
+            if column is None:
+                column = translations.array_from_values([None]*num_rows)
+            columns.append(column)
+        return columns
+
+    def iter_rows(self, *args):
+        """
+        Yield the requested column values from the halo catalog stat file, as well as the finder_offset (index associated
+        with halo's position within the catalog) and finder_id (raw halo id listed in the stat file).
+
+        Returned halo properties are emulated when necessary. For example, AHF stat files do not contain n_dm; however,
+        its value can be automatically inferred by this function. Meanwhile IDL .amiga.stat files rename n_gas as N_gas.
+
+        :param args: strings for the column names
+        :return: finder_offset, finder_id, arg1, arg2, arg3 where argN is the value of the Nth named column
+        """
+        columns = [c.tolist() for c in self.read_columns(*args)]
+        for values in zip(*columns):
+            yield list(values)
 
     def read(self, *args):
         """Read the halo ID and requested columns from the entire file, returning each column as a separate array"""
-        return_values = [[] for _ in range(len(args)+2)]
-        for row in self.iter_rows(*args):
-            for return_array, value in zip(return_values, row):
-                return_array.append(value)
-
-        return [np.array(x) for x in return_values]
+        return self.read_columns(*args)
 
     def _get_values_for_columns(self, columns, line):
         results = []
@@ -149,8 +232,9 @@ class AHFStatFile(HaloStatFile):
 
     _column_translations = {'n_gas': translations.DefaultValue('n_gas', 0),
                             'n_star': translations.DefaultValue('n_star', 0),
-                            'n_dm': translations.Function(lambda ngas, nstar, npart: npart - (ngas or 0) - (nstar or 0),
-                                                          'n_gas', 'n_star', 'npart'),
+                            'n_dm': translations.Function(lambda ngas, nstar, npart: npart - (0 if ngas is None else ngas)
+                                                                                             - (0 if nstar is None else nstar),
+                                                          'n_gas', 'n_star', 'npart', vectorised=True),
                             'hostHalo': translations.Function(
                                 lambda id: None if id==-1 else proxy_object.IncompleteProxyObjectFromFinderId(id, 'halo'),
                                 'hostHalo')}
@@ -180,7 +264,8 @@ class AHFStatFile(HaloStatFile):
     def _calculate_children(self):
         # use hostHalo column to calculate virtual childHalo entries
         self._children_map = {}
-        for c_id, f_id, host_f_id in self.iter_rows_raw("hostHalo"):
+        _, f_ids, host_f_ids = self.read_columns_raw("hostHalo")
+        for f_id, host_f_id in zip(f_ids.tolist(), host_f_ids.tolist()):
             if host_f_id!=-1:
                 cmap = self._children_map.get(host_f_id, [])
                 cmap.append(proxy_object.IncompleteProxyObjectFromFinderId(f_id,'halo'))
@@ -205,11 +290,11 @@ class RockstarStatFile(HaloStatFile):
                                      'n_gas': translations.Value(0),
                                      'n_star': translations.Value(0),
                                      'npart': translations.Rename('Np'),
-                                     'Mvir_Msun': translations.Function(lambda Mvir: Mvir/self.cosmo_h, 'Mvir'),
-                                     'Rvir_kpc': translations.Function(lambda Rvir: Rvir*self.cosmo_a/self.cosmo_h, 'Rvir'),
-                                     'X_Mpc': translations.Function(lambda X: X*self.cosmo_a/self.cosmo_h, 'X'),
-                                     'Y_Mpc': translations.Function(lambda Y: Y*self.cosmo_a/self.cosmo_h, 'Y'),
-                                     'Z_Mpc': translations.Function(lambda Z: Z*self.cosmo_a/self.cosmo_h, 'Z')}
+                                     'Mvir_Msun': translations.Function(lambda Mvir: Mvir/self.cosmo_h, 'Mvir', vectorised=True),
+                                     'Rvir_kpc': translations.Function(lambda Rvir: Rvir*self.cosmo_a/self.cosmo_h, 'Rvir', vectorised=True),
+                                     'X_Mpc': translations.Function(lambda X: X*self.cosmo_a/self.cosmo_h, 'X', vectorised=True),
+                                     'Y_Mpc': translations.Function(lambda Y: Y*self.cosmo_a/self.cosmo_h, 'Y', vectorised=True),
+                                     'Z_Mpc': translations.Function(lambda Z: Z*self.cosmo_a/self.cosmo_h, 'Z', vectorised=True)}
 
     @classmethod
     def filename(cls, timestep_filename):
@@ -254,7 +339,7 @@ class AmigaIDLStatFile(HaloStatFile):
                             'n_gas': translations.Rename('N_gas'),
                             'n_star': translations.Rename("N_star"),
                             'npart': translations.Function(lambda ngas, nstar, ndark: ngas + nstar + ndark,
-                                                           "N_dark", "N_gas", "N_star")}
+                                                           "N_dark", "N_gas", "N_star", vectorised=True)}
 
     @classmethod
     def filename(cls, timestep_filename):
@@ -274,3 +359,8 @@ class AmigaIDLStatFile(HaloStatFile):
         for row in super().iter_rows_raw(*args):
             row[0] = row[1]  # sequential catalog index not right in this case; overwrite to match finder id
             yield row
+
+    def read_columns_raw(self, *args):
+        columns = super().read_columns_raw(*args)
+        columns[0] = columns[1].copy() # as in iter_rows_raw, the finder_offset matches the finder id
+        return columns
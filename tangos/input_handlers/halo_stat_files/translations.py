@@ -1,18 +1,44 @@
-"""Helper classes for defining translations between .stat file of different formats."""
+"""Helper classes for defining translations between .stat file of different formats.
+
+Each translation can be applied either to the values for a single row (by calling it), or to entire columns
+(by calling its columns method). In the latter case, a column that is absent from the file is passed as None."""
+
+import numbers
 
 import numpy as np
 
 
+def array_from_values(values):
+    """Convert a list of per-row values into a column, keeping non-numeric values (e.g. None, lists) as objects"""
+    if all(isinstance(v, numbers.Number) for v in values):
+        return np.array(values)
+    result = np.empty(len(values), dtype=object)
+    for i, v in enumerate(values):
+        result[i] = v
+    return result
+
 class Function:
-    """Define a column which is actually a function of other columns"""
-    def __init__(self, fn, *input_arg_names):
+    """Define a column which is actually a function of other columns
+
+    If vectorised is True, the function may be called with entire numpy columns as its inputs. Otherwise, when
+    columns are requested, it is called separately for each row."""
+    def __init__(self, fn, *input_arg_names, vectorised=False):
         self.fn = fn
         self.input_arg_names = input_arg_names
+        self.vectorised = vectorised
 
     def __call__(self, raw_input_names, raw_input_values):
         input_args = [raw_input_values[raw_input_names.index(name)] for name in self.input_arg_names]
         return self.fn(*input_args)
 
+    def columns(self, raw_input_names, raw_input_columns, num_rows):
+        input_columns = [raw_input_columns[raw_input_names.index(name)] for name in self.input_arg_names]
+        if self.vectorised:
+            return self.fn(*input_columns)
+        input_columns = [[None]*num_rows if c is None else c.tolist() for c in input_columns]
+        return array_from_values([self.fn(*args) for args in zip(*input_columns)] if len(input_columns)>0
+                                 else [self.fn() for _ in range(num_rows)])
+
     def inputs(self):
         return self.input_arg_names
 
@@ -24,6 +50,9 @@ class Rename:
     def __call__(self, raw_input_names, raw_input_values):
         return raw_input_values[raw_input_names.index(self.name)]
 
+    def columns(self, raw_input_names, raw_input_columns, num_rows):
+        return raw_input_columns[raw_input_names.index(self.name)]
+
     def inputs(self):
         return [self.name]
 
@@ -35,6 +64,9 @@ class Value:
     def __call__(self, raw_input_names, raw_input_values):
         return self.value
 
+    def columns(self, raw_input_names, raw_input_columns, num_rows):
+        return array_from_values([self.value]*num_rows)
+
     def inputs(self):
         return []
 
@@ -51,5 +83,12 @@ class DefaultValue:
         else:
             return val
 
+    def columns(self, raw_input_names, raw_input_columns, num_rows):
+        column = raw_input_columns[raw_input_names.index(self.name)]
+        if column is None:
+            return array_from_values([self.default_value]*num_rows)
+        else:
+            return column
+
     def inputs(self):
         return [self.name]
@@ -28,10 +28,17 @@ class TestInputHandler(HandlerBase):
         return result
 
     def enumerate_timestep_extensions(self, parallel=False):
-        if parallel:
-            raise NotImplementedError("Parallel enumeration not implemented for this test handler")
         pre_extension_length = len(os.path.join(config.base, self.basename))
-        steps = glob.glob(os.path.join(config.base, self.basename, "step.*"))
+
+        def find_steps():
+            return sorted(glob.glob(os.path.join(config.base, self.basename, "step.*")))
+
+        if parallel:
+            from ..parallel_tasks import jobs
+            steps = jobs.generate_task_list_and_parallel_iterate(find_steps)
+        else:
+            steps = find_steps()
+
         for i in steps:
             yield self.strip_slashes(i[pre_extension_length:])
 
@@ -0,0 +1,134 @@
+"""Matching of objects between two snapshots by counting the particles they have in common.
+
+The central object is a sparse matrix whose (i, j) entry is the number of particles shared between object index i in
+the first catalogue and object index j in the second. Both the forward (first to second) and backward (second to
+first) fuzzy-match catalogues can be derived from the same matrix, by normalising its rows or its columns
+respectively."""
+
+import numpy as np
+import scipy.sparse
+
+from .. import config
+
+
+def particles_in_common_from_group_arrays(group1, group2, shape):
+    """Count the particles in common between objects, given per-particle object indices.
+
+    :param group1: for each particle, the index of the object it belongs to in the first catalogue (or -1 for none)
+    :param group2: for the same particles in the same order, the index of the object in the second catalogue
+    :param shape: the number of objects in the first and second catalogues
+    :return: a scipy.sparse.csr_matrix of the given shape
+    """
+    group1 = np.asarray(group1)
+    group2 = np.asarray(group2)
+    valid = (group1>=0) & (group1<shape[0]) & (group2>=0) & (group2<shape[1])
+    # duplicate (i,j) entries are summed on conversion to CSR
+    return scipy.sparse.coo_matrix((np.ones(np.count_nonzero(valid), dtype=np.int64),
+                                    (group1[valid], group2[valid])), shape=shape).tocsr()
+
+def particles_in_common_from_members(ids1, group1, ids2, group2, shape):
+    """Count the particles in common between objects, given lists of (particle id, object index) memberships.
+
+    Unlike particles_in_common_from_group_arrays, the two membership lists need not be aligned, and a particle may
+    be a member of more than one object (e.g. of both a halo and its subhalo).
+
+    :param ids1: particle ids of the members of objects in the first catalogue
+    :param group1: for each entry in ids1, the index of the object it belongs to
+    :param ids2: particle ids of the members of objects in the second catalogue
+    :param group2: for each entry in ids2, the index of the object it belongs to
+    :param shape: the number of objects in the first and second catalogues
+    :return: a scipy.sparse.csr_matrix of the given shape
+    """
+    ids2 = np.asarray(ids2)
+    order2 = np.argsort(ids2, kind='stable')
+    ids2 = ids2[order2]
+    group2 = np.asarray(group2)[order2]
+
+    # each entry in ids1 matches the (possibly empty) run ids2[start:end]
+    start = np.searchsorted(ids2, ids1, side='left')
+    end = np.searchsorted(ids2, ids1, side='right')
+    num_matches = end - start
+    total = num_matches.sum()
+
+    run_offset = np.arange(total) - np.repeat(np.cumsum(num_matches) - num_matches, num_matches)
+    matched_group1 = np.repeat(np.asarray(group1), num_matches)
+    matched_group2 = group2[np.repeat(start, num_matches) + run_offset]
+    return particles_in_common_from_group_arrays(matched_group1, matched_group2, shape)
+
+def particles_in_common_by_merge_join(ids1, group1, ids2, group2, shape, chunk_size=None):
+    """Count the particles in common between objects, given per-particle ids and object indices for two snapshots.
+
+    Each snapshot's arrays need only be the particle ids (which must be unique within the snapshot) and the object
+    index of each particle (-1 for none), in any order. Particles outside any object are discarded, the remainder
+    sorted by id, and the two lists merge-joined chunk_size ids at a time. The peak memory use is therefore
+    proportional to the id arrays, plus a chunk-sized working set.
+
+    :return: a scipy.sparse.csr_matrix of the given shape
+    """
+    if chunk_size is None:
+        chunk_size = config.low_memory_matching_chunk_size
+
+    ids1, group1 = _sorted_members(ids1, group1)
+    ids2, group2 = _sorted_members(ids2, group2)
+
+    result = scipy.sparse.csr_matrix(shape, dtype=np.int64)
+    if len(ids2)==0:
+        return result
+
+    for start in range(0, len(ids1), chunk_size):
+        chunk_ids = ids1[start:start+chunk_size]
+        position = np.minimum(np.searchsorted(ids2, chunk_ids), len(ids2)-1)
+        found = ids2[position]==chunk_ids
+        result += particles_in_common_from_group_arrays(group1[start:start+chunk_size][found],
+                                                        group2[position[found]], shape)
+    return result
+
+def _sorted_members(ids, group):
+    group = np.asarray(group)
+    in_object = group>=0
+    ids = np.asarray(ids)[in_object]
+    group = group[in_object]
+    order = np.argsort(ids)
+    return ids[order], group[order]
+
+def catalogs_from_particles_in_common(matrix, numbers1, numbers2, threshold,
+                                      normalisation1=None, normalisation2=None):
+    """Convert a particles-in-common matrix into forward and backward fuzzy-match catalogues.
+
+    :param matrix: sparse matrix of particles in common, as returned by the functions above
+    :param numbers1: array mapping each object index in the first catalogue to the number stored in the catalogue
+    :param numbers2: the same for the second catalogue
+    :param threshold: the minimum fraction of particles that must be transferred for a match to be included
+    :param normalisation1: the number of particles to divide by for each object in the first catalogue. By default,
+                           this is the total number of its particles that are found in any object of the second
+                           catalogue (i.e. the row sum).
+    :param normalisation2: the same for the second catalogue (by default, the column sum)
+    :return: (forward, backward), each a dictionary mapping an object number to a list of (number, weight) tuples in
+             decreasing order of weight, in the format returned by match_objects
+    """
+    matrix = scipy.sparse.csr_matrix(matrix)
+    if normalisation1 is None:
+        normalisation1 = np.asarray(matrix.sum(axis=1)).ravel()
+    if normalisation2 is None:
+        normalisation2 = np.asarray(matrix.sum(axis=0)).ravel()
+    forward = _fuzzy_catalog_from_rows(matrix, numbers1, numbers2, threshold, normalisation1)
+    backward = _fuzzy_catalog_from_rows(matrix.T.tocsr(), numbers2, numbers1, threshold, normalisation2)
+    return forward, backward
+
+def _fuzzy_catalog_from_rows(matrix, row_numbers, column_numbers, threshold, normalisation):
+    output = {}
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row+1]
+        this_row_matches = []
+        if end>start and normalisation[row]>0:
+            fraction = matrix.data[start:end] / normalisation[row]
+            columns = matrix.indices[start:end]
+            above_threshold = np.where(fraction > threshold)[0]
+            above_threshold = above_threshold[np.argsort(fraction[above_threshold], kind='stable')[::-1]]
+            this_row_matches = [(column_numbers[columns[i]], fraction[i]) for i in above_threshold]
+        output[row_numbers[row]] = this_row_matches
+    return output
+
+def restrict_catalog(catalog, number_min, number_max):
+    """Remove entries from a catalog whose source number falls outside the given (inclusive) range"""
+    return {k: v for k, v in catalog.items() if number_min <= k <= number_max}
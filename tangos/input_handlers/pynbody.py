@@ -19,7 +19,7 @@ from typing import TYPE_CHECKING
 
 from .. import config
 from ..log import logger
-from . import HandlerBase, finding
+from . import HandlerBase, finding, particle_matching
 
 if TYPE_CHECKING:
     import pynbody
@@ -232,15 +232,7 @@ class PynbodyInputHandler(finding.PatternBasedFileDiscovery, HandlerBase):
         return h  # pynbody.halo.AmigaGrpCatalogue(f)
 
 
-    def match_objects(self, ts1, ts2, halo_min, halo_max,
-                      dm_only=False, threshold=0.005, object_typetag='halo',
-                      output_handler_for_ts2=None,
-                      fuzzy_match_kwa={}):
-        if dm_only:
-            only_family=pynbody.family.dm
-        else:
-            only_family=None
-
+    def _load_for_matching(self, ts1, ts2, object_typetag, output_handler_for_ts2):
         f1 = self.load_timestep(ts1)
         h1 = self.get_catalogue(ts1, object_typetag)
 
@@ -252,6 +244,19 @@ class PynbodyInputHandler(finding.PatternBasedFileDiscovery, HandlerBase):
             f2 = self.load_timestep(ts2)
             h2 = self.get_catalogue(ts2, object_typetag)
 
+        return f1, h1, f2, h2
+
+    def match_objects(self, ts1, ts2, halo_min, halo_max,
+                      dm_only=False, threshold=0.005, object_typetag='halo',
+                      output_handler_for_ts2=None,
+                      fuzzy_match_kwa={}):
+        if dm_only:
+            only_family=pynbody.family.dm
+        else:
+            only_family=None
+
+        f1, h1, f2, h2 = self._load_for_matching(ts1, ts2, object_typetag, output_handler_for_ts2)
+
         if halo_max is None:
             halo_max = max(len(h2), len(h1))
 
@@ -270,6 +275,72 @@ class PynbodyInputHandler(finding.PatternBasedFileDiscovery, HandlerBase):
 
         return matches
 
+    def match_objects_symmetric(self, ts1, ts2, halo_min, halo_max, dm_only=False, threshold=0.005,
+                                object_typetag='halo', output_handler_for_ts2=None, low_memory=False):
+        """Match objects in both directions, bridging the two timesteps only once.
+
+        The particles in common between each pair of objects are counted into a sparse matrix; the forward and
+        backward catalogues are then its row- and column-normalised versions. The results are the same as calling
+        match_objects in each direction.
+
+        With low_memory, no bridge is built: only the iord array and the catalogue's group membership are read for
+        each timestep, and these are merge-joined on particle id (see
+        particle_matching.particles_in_common_by_merge_join)."""
+        if dm_only:
+            only_family=pynbody.family.dm
+        else:
+            only_family=None
+
+        f1, h1, f2, h2 = self._load_for_matching(ts1, ts2, object_typetag, output_handler_for_ts2)
+
+        if halo_max is None:
+            halo_max = max(len(h2), len(h1))
+
+        if low_memory:
+            in_common = particle_matching.particles_in_common_by_merge_join(
+                self._get_iord_for_matching(f1, only_family), h1.get_group_array(family=only_family, use_index=True),
+                self._get_iord_for_matching(f2, only_family), h2.get_group_array(family=only_family, use_index=True),
+                (len(h1), len(h2)))
+        else:
+            in_common = self._count_particles_in_common(self.create_bridge(f1, f2), h1, h2, only_family)
+
+        forward, backward = particle_matching.catalogs_from_particles_in_common(
+            in_common, h1.number_mapper.index_to_number(np.arange(len(h1))),
+            h2.number_mapper.index_to_number(np.arange(len(h2))), threshold)
+
+        return particle_matching.restrict_catalog(forward, halo_min, halo_max), \
+               particle_matching.restrict_catalog(backward, halo_min, halo_max)
+
+    @staticmethod
+    def _get_iord_for_matching(f, only_family):
+        if only_family:
+            f = f[only_family]
+        return f['iord']
+
+    @staticmethod
+    def _count_particles_in_common(bridge, h1, h2, only_family):
+        """Sparse equivalent of pynbody's Bridge.count_particles_in_common"""
+        start, end = bridge._get_ends()
+        if only_family:
+            start = start[only_family]
+            end = end[only_family]
+
+        # map back and forth to get only the particles held in common, in corresponding order
+        restricted_start = bridge(bridge(start))
+        restricted_end = bridge(restricted_start)
+
+        start_indices = restricted_start.get_index_list(start.ancestor)
+        end_indices = restricted_end.get_index_list(end.ancestor)
+
+        # group arrays for a family are indexed relative to the start of that family
+        start_indices -= start.ancestor._get_family_slice(only_family).start
+        end_indices -= end.ancestor._get_family_slice(only_family).start
+
+        g1 = h1.get_group_array(family=only_family, use_index=True)[start_indices]
+        g2 = h2.get_group_array(family=only_family, use_index=True)[end_indices]
+
+        return particle_matching.particles_in_common_from_group_arrays(g1, g2, (len(h1), len(h2)))
+
 
     @classmethod
     def create_bridge(cls, f1, f2):
@@ -547,6 +618,16 @@ class Gadget4HBTPlusInputHandler(Gadget4HDFSubfindInputHandler):
             return super().match_objects(ts1, ts2, halo_min, halo_max, dm_only, threshold, object_typetag,
                                          output_handler_for_ts2, fuzzy_match_kwa)
 
+    def match_objects_symmetric(self, ts1, ts2, halo_min, halo_max, dm_only=False, threshold=0.005,
+                                object_typetag='halo', output_handler_for_ts2=None, low_memory=False):
+        if object_typetag=='halo' and output_handler_for_ts2 is self:
+            # track ids, rather than particles, are matched; see match_objects
+            return HandlerBase.match_objects_symmetric(self, ts1, ts2, halo_min, halo_max, dm_only, threshold,
+                                                       object_typetag, output_handler_for_ts2)
+        else:
+            return super().match_objects_symmetric(ts1, ts2, halo_min, halo_max, dm_only, threshold,
+                                                   object_typetag, output_handler_for_ts2, low_memory)
+
 
 
 class GadgetRockstarInputHandler(PynbodyInputHandler):
@@ -591,6 +672,27 @@ class RamsesCatalogueMixin:
             output_handler_for_ts2=output_handler_for_ts2
         )
 
+    def match_objects_symmetric(self, ts1, ts2, halo_min, halo_max, dm_only=True, threshold=0.005,
+                                object_typetag="halo", output_handler_for_ts2=None, low_memory=False):
+        if not dm_only:
+            logger.warning(
+                "`match_objects_symmetric` was called with dm_only=%s, but %s only supports DM-only"
+                " catalogues at the moment. Falling back to DM-only.", dm_only, self.__class__.__name__
+            )
+            dm_only = True
+
+        return super().match_objects_symmetric(
+            ts1,
+            ts2,
+            halo_min,
+            halo_max,
+            dm_only=dm_only,
+            threshold=threshold,
+            object_typetag=object_typetag,
+            output_handler_for_ts2=output_handler_for_ts2,
+            low_memory=low_memory
+        )
+
 
 class AHFInputHandler(PynbodyInputHandler):
     pynbody_halo_class_name = "AHFCatalogue"
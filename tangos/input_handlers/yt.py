@@ -9,7 +9,7 @@ import numpy as np
 from .. import config
 from ..log import logger
 from ..util.read_datasets_file import read_datasets
-from . import HandlerBase, finding
+from . import HandlerBase, finding, particle_matching
 
 
 class YtInputHandler(finding.PatternBasedFileDiscovery, HandlerBase):
@@ -132,6 +132,41 @@ class YtInputHandler(finding.PatternBasedFileDiscovery, HandlerBase):
 
         return cat
 
+    def match_objects_symmetric(self, ts1, ts2, halo_min, halo_max, dm_only=False, threshold=0.005,
+                                object_typetag="halo", output_handler_for_ts2=None, low_memory=False):
+        """Match objects in both directions from a single sparse count of the particles each pair has in common.
+
+        Weights are normalised by the total number of members of the source halo, as in match_objects. Both
+        catalogues are returned as dictionaries keyed by the tangos halo index. Only member ids are ever read, so
+        low_memory makes no difference."""
+        if halo_min is None:
+            halo_min = 0
+        if halo_max is None:
+            halo_max = np.inf
+
+        h1, _ = self._load_halo_cat(ts1, object_typetag)
+        h2, _ = (output_handler_for_ts2 or self)._load_halo_cat(ts2, object_typetag)
+
+        def members_and_indices(h):
+            members = [h.halo("halos", i).member_ids for i in h.r["particle_identifier"].astype(int)]
+            sizes = np.array([len(m) for m in members], dtype=np.int64)
+            indices = np.arange(len(members))
+            in_range = (indices >= halo_min) & (indices <= halo_max)
+            ids = np.concatenate([m for m, keep in zip(members, in_range) if keep] + [np.zeros(0, dtype=np.int64)])
+            return ids, np.repeat(indices[in_range], sizes[in_range]), sizes
+
+        ids1, halo1, sizes1 = members_and_indices(h1)
+        ids2, halo2, sizes2 = members_and_indices(h2)
+
+        in_common = particle_matching.particles_in_common_from_members(ids1, halo1, ids2, halo2,
+                                                                       (len(sizes1), len(sizes2)))
+        forward, backward = particle_matching.catalogs_from_particles_in_common(
+            in_common, np.arange(len(sizes1)), np.arange(len(sizes2)), threshold,
+            normalisation1=sizes1, normalisation2=sizes2)
+
+        return particle_matching.restrict_catalog(forward, halo_min, halo_max), \
+               particle_matching.restrict_catalog(backward, halo_min, halo_max)
+
     def enumerate_objects(self, ts_extension, object_typetag="halo", min_halo_particles=config.min_halo_particles):
         if object_typetag!="halo":
             return
@@ -2,6 +2,7 @@
 
 For more overview information, see live_calculation.md. """
 
+import copy
 import warnings
 
 import numpy as np
@@ -22,7 +23,7 @@ from tangos.live_calculation.query_masking import QueryMask
 from tangos.live_calculation.query_multivalue_folding import QueryMultivalueFolding
 from tangos.util import consistent_collection
 
-from .. import core, temporary_halolist as thl
+from .. import config, core, temporary_halolist as thl
 
 
 class UnknownValue:
@@ -301,6 +302,20 @@ class Calculation:
         """Return a placeholder value for this calculation"""
         raise NotImplementedError
 
+    def explain(self):
+        """Return a human-readable description of how this calculation will be evaluated"""
+        return "\n".join(self._explain_lines())
+
+    def _explain_lines(self):
+        return ["evaluate %s" % str(self)]
+
+    def _shared_link_key(self):
+        """Return a key identifying the link target set of this calculation, or None if it is not a link.
+
+        Sub-calculations of a MultiCalculation that return the same key follow exactly the same links, so that
+        the targets can be resolved once and shared between them."""
+        return None
+
     @staticmethod
     def _add_entries_for_duplicates(target_objs, target_ids):
         """Given a list of target_objs and their target_ids, the latter of which may contain duplicates, return the full list of objects
@@ -328,19 +343,81 @@ class MultiCalculation(Calculation):
     def __str__(self):
         return "("+(", ".join(str(x) for x in self.calculations))+")"
 
+    def _plan(self):
+        """Work out the order of evaluation, merging sub-calculations that follow the same link.
+
+        Returns a list of (indices, calculation) tuples. Each tuple gives the indices of the sub-calculations
+        that are computed together by the given calculation. Where several sub-calculations are links with the
+        same target (e.g. later(5).Mvir, later(5).Vmax), they are replaced by a single Link whose property is
+        a MultiCalculation, so that the targets are resolved once and all their properties fetched in a single
+        query."""
+        if not hasattr(self, "_plan_cached"):
+            steps = []
+            steps_by_key = {}
+            for i, c in enumerate(self.calculations):
+                key = c._shared_link_key()
+                if key is not None and key in steps_by_key:
+                    steps_by_key[key].append(i)
+                else:
+                    indices = [i]
+                    steps.append(indices)
+                    if key is not None:
+                        steps_by_key[key] = indices
+
+            self._plan_cached = []
+            for indices in steps:
+                if len(indices)==1:
+                    calculation = self.calculations[indices[0]]
+                else:
+                    first_link = self.calculations[indices[0]]
+                    calculation = Link(first_link.locator,
+                                       MultiCalculation(*[self.calculations[i].property for i in indices]))
+                self._plan_cached.append((indices, calculation))
+        return self._plan_cached
+
+    def _explain_lines(self):
+        lines = []
+        for indices, calculation in self._plan():
+            if len(indices)==1:
+                lines += calculation._explain_lines()
+            else:
+                shared_by = ", ".join(str(self.calculations[i]) for i in indices)
+                lines.append(f"resolve link {calculation.locator} once, shared by {shared_by}")
+                lines += ["  "+l for l in calculation.property._explain_lines()]
+        return lines
+
     def values_and_description(self, halos):
         results = np.empty((self.n_columns(),len(halos)), dtype=object)
-        c_column = 0
+        column_offsets = np.cumsum([0]+[c.n_columns() for c in self.calculations])
         halos = np.asarray(halos, dtype=object)
         mask = QueryMask()
         mask.mark_nones_as_masked(halos)
-        for c in self.calculations:
-            values, description = c.values_and_description(mask.mask(halos))
-            results[c_column:c_column+c.n_columns()] = mask.unmask(values)
+
+        shared_values = {}
+        for indices, calculation in self._plan():
+            if len(indices)>1:
+                # evaluate the merged calculation now, on all halos still in play; the values are unpacked
+                # into the individual columns when each is reached below
+                values, description = calculation.values_and_description(mask.mask(halos))
+                values = mask.unmask(values)
+                c_column = 0
+                for i in indices:
+                    n_columns = self.calculations[i].n_columns()
+                    shared_values[i] = values[c_column:c_column+n_columns], description
+                    c_column += n_columns
+
+        for i, c in enumerate(self.calculations):
+            if i in shared_values:
+                values, description = shared_values.pop(i)
+                values = mask.remask(values)
+                masked_values = mask.mask(values.T).T
+            else:
+                masked_values, description = c.values_and_description(mask.mask(halos))
+                values = mask.unmask(masked_values)
+            results[column_offsets[i]:column_offsets[i+1]] = values
             # TODO: in principle this masking should _not_ occur unless we know the user has called values_sanitized
             # - other calls should not cross-contaminate columns in this way
-            mask.mark_nones_as_masked(values)
-            c_column+=c.n_columns()
+            mask.mark_nones_as_masked(masked_values)
 
         # TODO - problem: there is no good description of multiple properties
         return results, description
@@ -388,7 +465,10 @@ class FixedNumericInput(FixedInput):
 class LiveProperty(Calculation):
     """Represents a calculation that is achieved by executing the live_calculate method of a Properties instance"""
     def __new__(cls, *tokens):
-        if BuiltinFunction.has_function(str(tokens[0])):
+        if len(tokens)==0:
+            # being reconstructed, e.g. by copy.deepcopy
+            return object.__new__(cls)
+        elif BuiltinFunction.has_function(str(tokens[0])):
             return object.__new__(BuiltinFunction)
         else:
             return object.__new__(LiveProperty)
@@ -536,6 +616,16 @@ class BuiltinFunction(LiveProperty):
             if f is not None:
                 self._func = f
 
+    def __deepcopy__(self, memo):
+        # An initialisation function may return a closure referring to the inputs, so the copy must be made by
+        # re-running the initialisation on copies of the inputs rather than by copying the closure.
+        result = type(self)(self._name, *copy.deepcopy(self._inputs, memo))
+        memo[id(self)] = result
+        for k, v in self.__dict__.items():
+            if k not in result.__dict__ or k=='_extraction_pattern':
+                result.__dict__[k] = copy.deepcopy(v, memo)
+        return result
+
     def _get_input_option(self, input_id, option):
         default = self.__default_args[option]
         if input_id in self._info:
@@ -589,6 +679,15 @@ class Link(Calculation):
     def name(self):
         return self.property.name()
 
+    def _shared_link_key(self):
+        if self._multi_selection_basis=='first' and len(self._constraints_columns)==0:
+            return str(self.locator)
+        else:
+            return None
+
+    def _explain_lines(self):
+        return [f"resolve link {self.locator}"] + ["  "+l for l in self.property._explain_lines()]
+
     def proxy_value(self):
         """Return a placeholder value for this calculation"""
         return UnknownValue(self)
@@ -656,15 +755,22 @@ class Link(Calculation):
         # a different set of properties has been loaded into all_properties
 
         try:
-            with thl.temporary_halolist_table(new_session, target_halo_ids) as tab:
-                target_halos_supplemented = self.property.supplement_halo_query(thl.halo_query(tab)).all()
+            if len(set(target_halo_ids)) <= config.max_ids_for_in_clause:
+                query = thl.halo_query_for_ids(new_session, target_halo_ids)
+                target_halos_supplemented = self.property.supplement_halo_query(query).all()
+                target_obj_from_id = {t.id: t for t in target_halos_supplemented}
+                target_halos_supplemented_with_duplicates = [target_obj_from_id[t_id] for t_id in target_halo_ids]
+                values, description = self.property.values_and_description(target_halos_supplemented_with_duplicates)
+            else:
+                with thl.pooled_temporary_halolist_table(new_session, target_halo_ids) as tab:
+                    target_halos_supplemented = self.property.supplement_halo_query(thl.halo_query(tab)).all()
 
-                # sqlalchemy's deduplication means we are now missing any halos that appear more than once in
-                # target_halo_ids. But we actually want the duplication.
-                target_halos_supplemented_with_duplicates = \
-                    self._add_entries_for_duplicates(target_halos_supplemented, target_halo_ids)
+                    # sqlalchemy's deduplication means we are now missing any halos that appear more than once in
+                    # target_halo_ids. But we actually want the duplication.
+                    target_halos_supplemented_with_duplicates = \
+                        self._add_entries_for_duplicates(target_halos_supplemented, target_halo_ids)
 
-                values, description = self.property.values_and_description(target_halos_supplemented_with_duplicates)
+                    values, description = self.property.values_and_description(target_halos_supplemented_with_duplicates)
         finally:
             new_session.connection().close()
         return values, description
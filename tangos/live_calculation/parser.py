@@ -1,3 +1,4 @@
+import copy
 import functools
 import threading
 
@@ -95,10 +96,25 @@ array_element << ((live_calculation_property | stored_property) + element_identi
 property_complete = pp.stringStart()+value_or_property_name+pp.stringEnd()
 
 
-def parse_property_name( name):
+@functools.lru_cache(maxsize=1024)
+def _parse_property_name_cached(name):
     with _parsing_lock:
         return property_complete.parseString(name)[0]
 
+def parse_property_name( name):
+    """Parse the given expression into a Calculation.
+
+    Parsed expressions are cached; each call returns an independent copy of the cached tree, so that state set
+    during evaluation is never shared between callers."""
+    return copy.deepcopy(_parse_property_name_cached(name))
+
+def parse_cache_info():
+    """Return the hits, misses, maxsize and currsize of the parsed expression cache"""
+    return _parse_property_name_cached.cache_info()
+
+def clear_parse_cache():
+    _parse_property_name_cached.cache_clear()
+
 def parse_property_name_if_required(name):
     if isinstance(name, Calculation):
         return name
@@ -108,4 +124,5 @@ def parse_property_name_if_required(name):
 def parse_property_names(*names):
     return MultiCalculation(*[parse_property_name(n) for n in names])
 
-__all__ = ["parse_property_name", "parse_property_name_if_required", "parse_property_names"]
+__all__ = ["parse_property_name", "parse_property_name_if_required", "parse_property_names",
+           "parse_cache_info", "clear_parse_cache"]
@@ -55,6 +55,11 @@ class QueryMask:
         rval[address_tuple] = input
         return rval
 
+    def remask(self, input):
+        """Replace with None any entries of an unmasked array that correspond to rows that are now masked"""
+        self._check_ready()
+        return self.unmask(input[..., self.results_target[0]])
+
     def _check_ready(self):
         if self.N is None:
             raise RuntimeError("The query mask has not yet been configured")
@@ -7,7 +7,7 @@ from importlib.metadata import entry_points
 
 import numpy as np
 
-from .. import input_handlers, parallel_tasks
+from .. import input_handlers
 from ..log import logger
 from ..util import timing_monitor
 
@@ -88,7 +88,8 @@ class PropertyCalculation(metaclass=PropertyCalculationMetaClass):
 
         This is safe to call even if the database might be locked.
         """
-        with parallel_tasks.lock.SharedLock("insert_list"):
+        from ..cached_writer import read_lock
+        with read_lock():
             return self.__simulation.get(name, default)
 
     @classmethod
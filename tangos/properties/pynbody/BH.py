@@ -37,10 +37,9 @@ class BH(PynbodyPropertyCalculation):
             raise RuntimeError("No proxies, please")
         boxsize = self.log.boxsize
 
-        vars = self.log.get_for_named_snapshot(self.filename)
-
-        mask = vars['bhid'] == properties.halo_number
-        if (mask.sum() == 0):
+        try:
+            vars = self.log.get_for_named_snapshot_for_id(self.filename, properties.halo_number)
+        except ValueError:
             raise RuntimeError("Can't find BH in .orbit file")
 
         # work out who's the main halo
@@ -65,12 +64,9 @@ class BH(PynbodyPropertyCalculation):
             except KeyError:
                 main_halo_ssc = None
 
-        entry = np.where(mask)[0]
-
-        print("target entry is", entry)
         final = {}
         for t in 'x', 'y', 'z', 'vx', 'vy', 'vz', 'mdot', 'mass', 'mdotmean':
-            final[t] = float(vars[t][entry])
+            final[t] = float(vars[t])
 
         if main_halo_ssc is None:
             offset = np.array((0, 0, 0))
@@ -118,12 +114,12 @@ class BHAccHistogram(TimeChunkedProperty):
         if halo['tform'][0] > 0:
             raise RuntimeError("Not a BH!")
 
-        mask = self.log.vars['bhid'] == halo['iord']
-        if (mask.sum() == 0):
+        vars = self.log.get_all_entries_for_id(halo['iord'][0])
+        if len(vars['time']) == 0:
             raise RuntimeError("Can't find BH in .orbit file")
 
-        t_orbit = self.log.vars['time'][mask]
-        Mdot_orbit = self.log.vars['mdotmean'][mask]
+        t_orbit = vars['time']
+        Mdot_orbit = vars['mdotmean']
         order = np.argsort(t_orbit)
 
         t_max = properties.timestep.time_gyr
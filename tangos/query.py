@@ -1,7 +1,67 @@
-from sqlalchemy import and_
+import collections
+import threading
+import weakref
 
-from tangos import Base, Creator, get_default_session
-from tangos.core import HaloProperty, Simulation, SimulationObjectBase, TimeStep
+from sqlalchemy import and_, event, or_
+
+from tangos import Base, Creator, config, get_default_session
+from tangos.core import (
+    HaloProperty,
+    Simulation,
+    SimulationObjectBase,
+    TimeStep,
+    get_engine_for_session,
+)
+
+
+class _PathCache:
+    """Maps simulation and timestep names (or patterns) to database IDs for one database, discarding the least recently
+    used once there are more than config.path_cache_size"""
+
+    def __init__(self):
+        self._ids = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._ids.get(key, None)
+            if result is not None:
+                self._ids.move_to_end(key)
+            return result
+
+    def set(self, key, value):
+        with self._lock:
+            self._ids[key] = value
+            self._ids.move_to_end(key)
+            while len(self._ids) > config.path_cache_size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+_path_caches = weakref.WeakKeyDictionary() # maps engine -> _PathCache
+_path_caches_lock = threading.Lock()
+
+def _get_path_cache(session):
+    engine = get_engine_for_session(session)
+    with _path_caches_lock:
+        cache = _path_caches.get(engine, None)
+        if cache is None:
+            cache = _path_caches[engine] = _PathCache()
+        return cache
+
+def _clear_path_caches(*args):
+    with _path_caches_lock:
+        caches = list(_path_caches.values())
+    for cache in caches:
+        cache.clear()
+
+# A name may match a different simulation or timestep once these are added, renamed or deleted. Deletions made by other
+# processes (or by bulk DELETE statements) are instead noticed when the cached ID no longer exists.
+for _cls in Simulation, TimeStep:
+    for _event_name in 'after_insert', 'after_update', 'after_delete':
+        event.listen(_cls, _event_name, _clear_path_caches)
 
 
 def all_simulations(session=None):
@@ -14,70 +74,182 @@ def all_creators():
     return get_default_session().query(Creator).all()
 
 
+def _simulation_match_clause(id):
+    assert "/" not in id, "Replace '/' with '_' in input string."
+    if "%" in id or "_" in id:
+        return Simulation.basename.like(id)
+    else:
+        return Simulation.basename == id
+
 def get_simulation(id, session=None):
     if session is None:
         session = get_default_session()
-    if isinstance(id, str) or isinstance(id, str):
-        assert "/" not in id, "Replace '/' with '_' in input string."
-        if "%" in id or "_" in id:
-            match_clause = Simulation.basename.like(id)
-        else:
-            match_clause = Simulation.basename == id
-        res = session.query(Simulation).filter(match_clause)
-        num = res.count()
-        if num == 0:
+    if isinstance(id, str):
+        match_clause = _simulation_match_clause(id)
+        cache = _get_path_cache(session)
+        sim_id = cache.get(("simulation", id))
+        if sim_id is not None:
+            sim = session.get(Simulation, sim_id)
+            if sim is not None:
+                return sim
+
+        res = session.query(Simulation).filter(match_clause).limit(2).all()
+        if len(res) == 0:
             raise RuntimeError("No simulation matches %r" % id)
-        elif num > 1:
+        elif len(res) > 1:
+            num = session.query(Simulation).filter(match_clause).count()
             raise RuntimeError("Multiple (%d) matches for %r" % (num, id))
         else:
-            return res.first()
+            cache.set(("simulation", id), res[0].id)
+            return res[0]
 
     else:
         return session.query(Simulation).filter_by(id=int(id)).first()
 
 
+def _timestep_query(session, sim, ts):
+    """Query for timesteps matching the extension ts, in the simulation named by sim (or in the Simulation sim)"""
+    query = session.query(TimeStep).filter(TimeStep.extension.like(ts))
+    if isinstance(sim, str):
+        return query.join(TimeStep.simulation).filter(_simulation_match_clause(sim))
+    else:
+        return query.filter(TimeStep.simulation_id == sim.id)
+
+def _timestep_cache_key(sim, ts):
+    return ("timestep", sim if isinstance(sim, str) else sim.id, ts)
+
+def _raise_timestep_not_unique(session, sim, ts, id):
+    """Raise an exception explaining why there is not exactly one timestep matching sim and ts"""
+    if isinstance(sim, str):
+        sim = get_simulation(sim, session) # raises if the simulation itself is not unique
+    num = _timestep_query(session, sim, ts).count()
+    if num == 0:
+        raise RuntimeError("No timestep matches for %r" % id)
+    else:
+        raise RuntimeError("Multiple (%d) matches for timestep %r of simulation %r" % (
+            num, ts, sim))
+
 def get_timestep(id, session=None, sim=None):
     if session is None:
         session = get_default_session()
-    if isinstance(id, str) or isinstance(id, str):
+    if isinstance(id, str):
         if sim is None:
             sim, ts = id.split("/")
-            sim = get_simulation(sim, session)
         else:
             ts = id
-        res = session.query(TimeStep).filter(
-            and_(TimeStep.extension.like(ts), TimeStep.simulation_id == sim.id))
-        num = res.count()
-        if num == 0:
-            raise RuntimeError("No timestep matches for %r" % id)
-        elif num > 1:
-            raise RuntimeError("Multiple (%d) matches for timestep %r of simulation %r" % (
-                num, ts, sim))
-        else:
-            return res.first()
+        cache = _get_path_cache(session)
+        ts_id = cache.get(_timestep_cache_key(sim, ts))
+        if ts_id is not None:
+            timestep = session.get(TimeStep, ts_id)
+            if timestep is not None:
+                return timestep
+
+        # a single query, which only fails if there is not exactly one matching timestep
+        res = _timestep_query(session, sim, ts).limit(2).all()
+        if len(res) != 1:
+            _raise_timestep_not_unique(session, sim, ts, id)
+        cache.set(_timestep_cache_key(sim, ts), res[0].id)
+        return res[0]
     else:
         return session.query(TimeStep).filter_by(id=int(id)).first()
 
 
+def _object_query(session, timestep_id, halo):
+    object_typecode, object_number = SimulationObjectBase.typecode_and_number_from_human_identifier(halo)
+    return session.query(SimulationObjectBase).filter_by(timestep_id=timestep_id, halo_number=object_number,
+                                                         object_typecode=object_typecode)
+
 def get_object(id, session=None):
     """Get an object from an ID or an identifying string
 
     Optionally, use the specified session.
 
+    Once a simulation/timestep path has been seen, its timestep ID is cached, so that further objects from the same
+    timestep are found with a single query.
+
     :rtype: SimulationObjectBase
     """
     if session is None:
         session = get_default_session()
 
-    if isinstance(id, str) or isinstance(id, str):
+    if isinstance(id, str):
         sim, ts, halo = id.split("/")
-        ts = get_timestep(sim + "/" + ts, session)
-        return ts[halo]
+        cache = _get_path_cache(session)
+        ts_id = cache.get(_timestep_cache_key(sim, ts))
+        if ts_id is not None:
+            obj = _object_query(session, ts_id, halo).first()
+            if obj is not None or session.get(TimeStep, ts_id) is not None:
+                return obj
+
+        # resolve the whole path with a single joined query
+        object_typecode, object_number = SimulationObjectBase.typecode_and_number_from_human_identifier(halo)
+        res = _timestep_query(session, sim, ts).with_entities(TimeStep.id, SimulationObjectBase).outerjoin(
+            SimulationObjectBase, and_(SimulationObjectBase.timestep_id == TimeStep.id,
+                                       SimulationObjectBase.halo_number == object_number,
+                                       SimulationObjectBase.object_typecode == object_typecode)
+        ).order_by(TimeStep.id, SimulationObjectBase.id).limit(2).all()
+        if len({ts_id for ts_id, _ in res}) != 1:
+            _raise_timestep_not_unique(session, sim, ts, sim + "/" + ts)
+        cache.set(_timestep_cache_key(sim, ts), res[0][0])
+        return res[0][1]
     else:
         return session.query(SimulationObjectBase).filter_by(id=int(id)).first()
 
 get_halo = get_object # old naming convention - to be deprecated
 
+_max_objects_per_query = 5000 # keeps the number of bound parameters well within database limits
+
+def get_objects(paths, session=None):
+    """Get objects from a list of identifying strings, e.g. ["sim/ts1/halo_1", "sim/ts2/BH_3"]
+
+    The objects are found with a single query (for up to 5000 distinct objects at a time), plus one for each
+    simulation/timestep path not resolved previously (see get_object). Returns a list of the same length, with None
+    for any object that does not exist.
+
+    Optionally, use the specified session.
+    """
+    if session is None:
+        session = get_default_session()
+
+    cache = _get_path_cache(session)
+    keys = []
+    for path in paths:
+        sim, ts, halo = path.split("/")
+        ts_id = cache.get(_timestep_cache_key(sim, ts))
+        if ts_id is None:
+            ts_id = get_timestep(sim + "/" + ts, session).id
+        keys.append((ts_id,) + tuple(SimulationObjectBase.typecode_and_number_from_human_identifier(halo)))
+
+    objects = _get_objects_by_key(session, set(keys))
+
+    if len(objects) < len(set(keys)):
+        # check that missing objects are not the result of a timestep having been deleted since its ID was cached
+        missing_ts_ids = {key[0] for key in keys if key not in objects}
+        existing_ts_ids = {ts_id for ts_id, in session.query(TimeStep.id).filter(TimeStep.id.in_(missing_ts_ids))}
+        if existing_ts_ids != missing_ts_ids:
+            cache.clear()
+            return get_objects(paths, session)
+
+    return [objects.get(key, None) for key in keys]
+
+def _get_objects_by_key(session, keys):
+    """Return a dictionary mapping (timestep id, object typecode, halo number) -> object, for those keys that exist"""
+    keys = sorted(keys)
+    objects = {}
+    for start in range(0, len(keys), _max_objects_per_query):
+        numbers_by_timestep_and_type = collections.defaultdict(list)
+        for ts_id, object_typecode, object_number in keys[start:start+_max_objects_per_query]:
+            numbers_by_timestep_and_type[(ts_id, object_typecode)].append(object_number)
+
+        condition = or_(*[and_(SimulationObjectBase.timestep_id == ts_id,
+                               SimulationObjectBase.object_typecode == object_typecode,
+                               SimulationObjectBase.halo_number.in_(numbers))
+                          for (ts_id, object_typecode), numbers in numbers_by_timestep_and_type.items()])
+
+        for obj in session.query(SimulationObjectBase).filter(condition).order_by(SimulationObjectBase.id):
+            objects.setdefault((obj.timestep_id, obj.object_typecode, obj.halo_number), obj)
+    return objects
+
 def get_item(path, session=None):
     c = path.count("/")
     if c == 0:
@@ -120,4 +292,4 @@ def getdb(cl) :
 
 
 __all__ = ['all_simulations', 'all_creators', 'get_simulation', 'get_timestep',
-           'get_halo', 'get_object', 'get_item' ,'get_haloproperty', 'get_items', 'getdb']
+           'get_halo', 'get_object', 'get_objects', 'get_item' ,'get_haloproperty', 'get_items', 'getdb']
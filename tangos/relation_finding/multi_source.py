@@ -2,7 +2,7 @@ import sqlalchemy
 from sqlalchemy import orm
 
 from .. import core
-from ..util import consistent_collection
+from ..util import bulk_insert, consistent_collection
 from .multi_hop import MultiHopStrategy
 from .one_hop import HopStrategy
 
@@ -64,12 +64,9 @@ class MultiSourceMultiHopStrategy(MultiHopStrategy):
 
 
     def _seed_temp_table(self):
-        insert_dictionaries = []
-        for i,halo_from in enumerate(self._all_halo_from):
-            insert_dictionaries.append({'halo_from_id': halo_from.id, 'halo_to_id': halo_from.id, 'weight': 1.0,
-                                        'nhops': 0, 'source_id': i})
-
-        self._connection.execute(self._table.insert(), insert_dictionaries)
+        rows = [(halo_from.id, halo_from.id, 1.0, 0, i) for i, halo_from in enumerate(self._all_halo_from)]
+        bulk_insert.bulk_insert(self._connection, self._table,
+                                ['halo_from_id', 'halo_to_id', 'weight', 'nhops', 'source_id'], rows)
 
     def _generate_next_level_prelim_links(self, from_nhops=0):
         if self._should_halt():
@@ -2,10 +2,9 @@
 
 import argparse
 import sys
-from textwrap import dedent
 
 import numpy as np
-from sqlalchemy import text
+from sqlalchemy import exists, text
 
 import tangos as db
 from tangos import config, core, parallel_tasks
@@ -15,6 +14,7 @@ from tangos.input_handlers import get_named_handler_class
 from tangos.log import logger
 from tangos.query import get_halo, get_simulation
 from tangos.tools.add_simulation import SimulationAdderUpdater
+from tangos.util.chunked_delete import delete_in_chunks
 
 
 def _add_simulation_timesteps(options):
@@ -42,52 +42,31 @@ def flag_duplicates_deprecated(opts):
     session.commit()
 
 def remove_duplicates(options):
+    # For each group of duplicates, the row with the highest id (i.e. the most recently added) is kept. The rows to
+    # delete are selected by a correlated EXISTS on the same table; since chunked_delete selects ids before deleting
+    # them by primary key, this avoids MySQL's restriction on selecting from the table being deleted from.
+    engine = core.get_default_engine()
+    core.get_default_session().commit()
 
-    session = db.core.get_default_session()
+    properties = core.HaloProperty.__table__
+    newer_property = properties.alias()
+    count = delete_in_chunks(engine, properties,
+                             exists().where(newer_property.c.halo_id == properties.c.halo_id,
+                                            newer_property.c.name_id == properties.c.name_id,
+                                            newer_property.c.id > properties.c.id),
+                             "Removing duplicate properties")
+
+    links = core.HaloLink.__table__
+    newer_link = links.alias()
+    count_links = delete_in_chunks(engine, links,
+                                   exists().where(newer_link.c.halo_from_id == links.c.halo_from_id,
+                                                  newer_link.c.halo_to_id == links.c.halo_to_id,
+                                                  newer_link.c.relation_id == links.c.relation_id,
+                                                  newer_link.c.id > links.c.id),
+                                   "Removing duplicate links")
 
-    # Note: the MySQL documentation states that “You cannot delete from a table and
-    # select from the same table in a subquery.”. You can however circumvent this
-    # limitation by creating an implicit temporary table.
-    # See https://dev.mysql.com/doc/refman/5.6/en/delete.html
-    # and https://stackoverflow.com/a/45498/2601223
-    # Another approach would have been to use an inner join but unfortunately
-    # SQLite does not support them in deletes, so we have to resort to this approach.
-    # With MySQL 5.7.6 onwards, this implicit temporary tables may be optimized away
-    # leading to the very same error we are trying to avoid. This can be fixed by
-    # setting the optimizer_switch off for the query.
-    # See https://dev.mysql.com/doc/relnotes/mysql/5.7/en/news-5-7-6.html#mysqld-5-7-6-optimizer
-    dialect = session.connection().engine.dialect.dialect_description.split("+")[0].lower()
-    if dialect == 'mysql':
-        session.execute(text("SET @__optimizations = @@SESSION.optimizer_switch"))
-        session.execute(text("SET @@SESSION.optimizer_switch = 'derived_merge=off'"))
-
-    count = session.execute(text(dedent("""
-        DELETE FROM haloproperties
-        WHERE id NOT IN (
-            SELECT * FROM (
-                SELECT MAX(id)
-                FROM haloproperties
-                GROUP BY halo_id, name_id
-            ) as t
-        )
-    """))).rowcount
-
-    count_links = session.execute(text(dedent("""
-        DELETE FROM halolink
-        WHERE id NOT IN (
-            SELECT * FROM (
-                SELECT MAX(id)
-                FROM halolink
-                GROUP BY halo_from_id, halo_to_id, relation_id
-            ) as t
-        )
-    """))).rowcount
-
-    if dialect == 'mysql':
-        session.execute(text("SET @@SESSION.optimizer_switch = @__optimizations"))
     print("Deleted %d rows" % count)
     print("Deleted %d links" % count_links)
-    session.commit()
 
 
 
@@ -212,10 +191,21 @@ def list_recent_runs(opts):
 
 
 def _erase_run_content(run):
+    session = core.get_default_session()
+    affected_timestep_ids = {r[0] for r in
+                             session.query(core.SimulationObjectBase.timestep_id).filter_by(creator_id=run.id).distinct()}
+    affected_timestep_ids |= {r[0] for r in
+                              session.query(core.SimulationObjectBase.timestep_id).
+                              join(core.HaloProperty, core.HaloProperty.halo_id == core.SimulationObjectBase.id).
+                              filter(core.HaloProperty.creator_id == run.id).distinct()}
+    removed_timestep_ids = {ts.id for ts in run.timesteps}
+
     run.halolinks.delete()
     run.halos.delete()
     run.properties.delete()
+    core.timestep_summary.remove(session, removed_timestep_ids)
     run.timesteps.delete()
+    core.timestep_summary.refresh(session, affected_timestep_ids - removed_timestep_ids)
     for s in run.simulations:
         core.get_default_session().delete(s)
     core.get_default_session().commit()
@@ -308,6 +298,51 @@ def list_available_properties(options):
             print(" "*30+" | %.15s | %s"%(format_handler_name(additional_class),
                                           format_class_name(additional_class)))
 
+def refresh_summaries(options):
+    session = core.get_default_session()
+    if options.sims is not None and len(options.sims)>0:
+        timesteps = [ts for sim in options.sims for ts in get_simulation(sim, session).timesteps]
+        print("Refreshing summaries for %d timesteps" % len(timesteps))
+    else:
+        timesteps = None
+        print("Refreshing summaries for entire database")
+    core.timestep_summary.refresh(session, timesteps)
+    session.commit()
+    print("Done")
+
+def db_upgrade(options):
+    engine = core.get_default_engine()
+    with engine.connect() as connection:
+        version = core.migrations.get_version(connection)
+    if version >= core.migrations.latest_version():
+        print("The database schema is already up to date (version %d)" % version)
+        return
+    print("Upgrading the database schema from version %d to %d" % (version, core.migrations.latest_version()))
+    core.migrations.upgrade(engine)
+    print("Done. Summaries of existing timesteps can now be built with 'tangos refresh-summaries'.")
+
+def list_stored_properties(options):
+    session = core.get_default_session()
+    ts = db.get_timestep(options.timestep, session)
+    if options.type is None:
+        typecode = None
+    else:
+        typecode = core.SimulationObjectBase.object_typecode_from_tag(options.type)
+
+    object_counts = core.timestep_summary.get_object_counts(session, ts)
+    for object_typecode, count in sorted(object_counts.items()):
+        if typecode is None or typecode == object_typecode:
+            typetag = core.SimulationObjectBase.object_typetag_from_code(object_typecode)
+            print("%s: %d objects" % (typetag, count))
+
+    property_counts = core.timestep_summary.get_property_counts(session, ts, typecode)
+    if len(property_counts)>0:
+        longest_name = max(len(name) for name in property_counts)
+        print("{} | {}".format("name".rjust(longest_name), "number of objects"))
+        print("-"*longest_name+"-+-"+"-"*17)
+        for name, count in sorted(property_counts.items()):
+            print("%s | %d" % (name.rjust(longest_name), count))
+
 def diff(options):
     from ..testing import db_diff
     differ = db_diff.TangosDbDiff(options.uri1, options.uri2, ignore_keys=options.ignore_value_of)
@@ -436,4 +471,21 @@ def get_argument_parser_and_subparsers():
     subparse_list_available_properties = subparse.add_parser("list-possible-properties",
                                                              help="List all the object properties that can be calculated by the currently available modules")
     subparse_list_available_properties.set_defaults(func=list_available_properties)
+
+    subparse_list_stored_properties = subparse.add_parser("list-stored-properties",
+                                                          help="List the properties stored for objects in a timestep, and how many objects have each")
+    subparse_list_stored_properties.add_argument("timestep", type=str, help="The timestep to list, as simulation/timestep")
+    subparse_list_stored_properties.add_argument("--type", type=str, default=None,
+                                                 help="Only count objects of the specified type (e.g. halo, group or BH)")
+    subparse_list_stored_properties.set_defaults(func=list_stored_properties)
+
+    subparse_refresh_summaries = subparse.add_parser("refresh-summaries",
+                                                     help="Rebuild the stored per-timestep object and property counts (e.g. for databases created by older versions of tangos)")
+    subparse_refresh_summaries.add_argument("--sims", "--for", nargs="*", type=str, default=None,
+                                            help="Only rebuild the summaries for the specified simulations")
+    subparse_refresh_summaries.set_defaults(func=refresh_summaries)
+
+    subparse_db_upgrade = subparse.add_parser("db-upgrade",
+                                              help="Upgrade a database created by an older version of tangos to the latest schema (e.g. adding indexes), which may take some time for a large database")
+    subparse_db_upgrade.set_defaults(func=db_upgrade)
     return parser, subparse
@@ -6,8 +6,11 @@ import sqlalchemy
 from sqlalchemy import Column, Integer, Table
 
 from . import core
+from .util import bulk_insert
 
 _temp_sessions = {}
+_pooled_metadata = sqlalchemy.MetaData() # kept apart from core.Base.metadata, as pooled tables outlive any one query
+_POOL_INFO_KEY = 'tangos_halolist_pool'
 
 def _create_temp_halolist(session):
     global _temp_sessions
@@ -32,15 +35,51 @@ def _delete_temp_halolist(table):
     core.Base.metadata.remove(table)
     del _temp_sessions[id(table)]
 
+def _get_pool_for(session):
+    # The pool is stored alongside the DBAPI connection, so that it lives exactly as long as the temporary tables
+    return session.connection().connection.info.setdefault(_POOL_INFO_KEY, [])
+
+def _pooled_table_exists(session, table):
+    connection = session.connection()
+    if connection.dialect.name == 'mysql':
+        # MySQL temporary tables are unaffected by transaction rollbacks
+        return True
+    # elsewhere, a rollback may have undone the table creation
+    return sqlalchemy.inspect(connection).has_table(table.name)
+
+def _checkout_pooled_temp_halolist(session):
+    pool = _get_pool_for(session)
+    while len(pool)>0:
+        table = pool.pop()
+        if _pooled_table_exists(session, table):
+            break
+        _pooled_metadata.remove(table)
+    else:
+        rstr = ''.join(random.choice(string.ascii_lowercase) for _ in range(10))
+        table = Table(
+            'halolist_pooled_'+rstr,
+            _pooled_metadata,
+            Column('id', Integer, primary_key=True),
+            Column('halo_id', Integer),
+            prefixes=["TEMPORARY"]
+        )
+        table.create(bind=session.connection())
+
+    _temp_sessions[id(table)] = session
+    return table
+
+def _return_pooled_temp_halolist(table):
+    session = _get_session_for(table)
+    session.connection().execute(table.delete())
+    _get_pool_for(session).append(table)
+    del _temp_sessions[id(table)]
+
 def _insert_into_temp_halolist(table, ids):
     connection = _get_connection_for(table)
     if isinstance(ids, sqlalchemy.orm.query.Query):
         connection.execute(table.insert().from_select(['halo_id'], ids))
     else:
-        connection.execute(
-            table.insert(),
-            [{'halo_id': id} for id in ids]
-        )
+        bulk_insert.bulk_insert(connection, table, ['halo_id'], [(id,) for id in ids])
 
 def _get_session_for(table):
     global _temp_sessions
@@ -83,3 +122,28 @@ def temporary_halolist_table(session, ids=None, callback=None):
     _delete_temp_halolist(table)
     if callback is not None:
         callback()
+
+@contextlib.contextmanager
+def pooled_temporary_halolist_table(session, ids=None):
+    """As temporary_halolist_table, but re-using a table from a per-connection pool where possible.
+
+    On exit, the table is emptied and returned to the pool rather than being dropped, saving the cost of
+    creating and dropping a table for each query."""
+    table = _checkout_pooled_temp_halolist(session)
+    try:
+        if ids is not None:
+            _insert_into_temp_halolist(table, ids)
+        yield table
+    except:
+        # the state of the table is unknown; leave it to be cleaned up when the connection closes
+        del _temp_sessions[id(table)]
+        _pooled_metadata.remove(table)
+        raise
+    _return_pooled_temp_halolist(table)
+
+def halo_query_for_ids(session, ids):
+    """Query that returns all halos with the given ids, for sets small enough to pass directly as an IN clause.
+
+    The halos are returned in order of id, and duplicates are not returned."""
+    return session.query(core.halo.SimulationObjectBase).filter(
+        core.halo.SimulationObjectBase.id.in_(set(ids))).order_by(core.halo.SimulationObjectBase.id)
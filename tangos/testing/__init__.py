@@ -117,17 +117,23 @@ class SqlExecutionTracker:
     def __init__(self, conn=None):
         if conn is None:
             conn = core.get_default_engine()
+            # with the read-optimised SQLite profile, queries are sent to a separate engine
+            self._extra_conns = [core._read_only_engine] if core._read_only_engine is not None else []
+        else:
+            self._extra_conns = []
 
         self.conn = conn
         self._queries = []
         self._stacks = []
 
     def __enter__(self):
-        sqlalchemy.event.listen(self.conn, 'after_execute', self.callback)
+        for conn in [self.conn] + self._extra_conns:
+            sqlalchemy.event.listen(conn, 'after_execute', self.callback)
         return self
 
     def __exit__(self, *_):
-        sqlalchemy.event.remove(self.conn, 'after_execute', self.callback)
+        for conn in [self.conn] + self._extra_conns:
+            sqlalchemy.event.remove(conn, 'after_execute', self.callback)
 
     @property
     def count(self):
@@ -182,10 +188,12 @@ def init_blank_db_for_testing(**init_kwargs):
     if testing_db_backend == "sqlite":
         db_name = f"test_dbs/%s.db"%testing_db_name
         if erase_if_exists:
-            try:
-                os.remove(db_name)
-            except OSError:
-                pass
+            # a stale write-ahead log (left by the read-optimised SQLite profile) must not be applied to the new file
+            for filename in (db_name, db_name+"-wal", db_name+"-shm"):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
             db_is_blank = True
         else:
             db_is_blank = not os.path.exists(db_name)
@@ -26,9 +26,6 @@ class SimulationGeneratorForTests:
                 NDM_halo = 1000-i*100
             else:
                 NDM_halo = NDM[i-1]
-            halo = core.halo.SimulationObjectBase(ts, i, i, i, NDM_halo, 0, 0, 0)
-            halo.object_typecode = object_typecode
-
             halo = core.halo.SimulationObjectBase(ts, i, i, i, NDM_halo, 0, 0, object_typecode=object_typecode)
             cl = core.halo.SimulationObjectBase.class_from_tag(
                 core.halo.SimulationObjectBase.object_typetag_from_code(object_typecode)
@@ -38,6 +35,8 @@ class SimulationGeneratorForTests:
             # so we better stick with it.
             returned_halos.append(halo)
         self.session.add_all(returned_halos)
+        self.session.flush()
+        core.timestep_summary.refresh_object_counts(self.session, [ts])
 
         self.session.commit()
         return returned_halos
@@ -67,6 +67,7 @@ from . import (
     add_simulation,
     ahf_merger_tree_importer,
     changa_bh_importer,
+    column_exporter,
     consistent_trees_importer,
     crosslink,
     db_importer,
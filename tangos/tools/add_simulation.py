@@ -5,6 +5,7 @@ import numpy as np
 from .. import config, core, parallel_tasks as pt
 from ..core import Simulation, TimeStep
 from ..log import logger
+from ..util import bulk_insert
 
 
 class SimulationAdderUpdater:
@@ -58,13 +59,34 @@ class SimulationAdderUpdater:
 
         for ts_filename in self.simulation_output.enumerate_timestep_extensions(parallel=self.parallel):
             if not self.timestep_exists_for_extension(ts_filename):
-                ts = self.add_timestep(ts_filename)
-                self.add_timestep_properties(ts)
-                self.add_objects_to_timestep(ts, core.halo.Halo)
-                self.add_objects_to_timestep(ts, core.halo.Group)
+                self.add_timestep_with_objects(ts_filename)
             else:
                 logger.warning("Timestep already exists %r", ts_filename)
 
+    def add_timestep_with_objects(self, ts_extension):
+        """Add a timestep together with its properties, halos and groups.
+
+        All reading from the simulation output (headers, halo catalogues) and renumbering happens before the database
+        write lock is taken, so that when running in parallel only the final insert is serialised between ranks."""
+        properties = self.simulation_output.get_timestep_properties(ts_extension)
+        objects = [(create_class, self._read_objects(ts_extension, create_class))
+                   for create_class in (core.halo.Halo, core.halo.Group)]
+        simulation = self._get_simulation()
+
+        logger.info("Add timestep %r to simulation %r", ts_extension, self.basename)
+        ts = TimeStep(simulation, ts_extension)
+        for key, value in properties.items():
+            setattr(ts, key, value)
+
+        with pt.ExclusiveLock("db_write_lock"):
+            self.session.add(ts)
+            self.session.flush()
+            for create_class, prepared in objects:
+                self._insert_objects(ts, create_class, prepared)
+            core.timestep_summary.refresh_object_counts(self.session, [ts])
+            self.session.commit()
+        return ts
+
     def simulation_exists(self):
         num_matches = self.session.query(Simulation).filter_by(basename=self.basename).count()
         assert num_matches<2, "Consistency problem - more than one simulation with this name exists"
@@ -121,38 +143,58 @@ class SimulationAdderUpdater:
                     yield result
         return adapted
 
+    _object_dtype = np.dtype([('catalog_id', np.int64), ('finder_id', np.int64),
+                              ('NDM', np.int64), ('NStar', np.int64), ('NGas', np.int64)])
+
     def add_objects_to_timestep(self, ts, create_class=core.halo.Halo):
-        halos = []
-        n_tot = []
+        prepared = self._read_objects(ts.extension, create_class)
+        with pt.ExclusiveLock("db_write_lock"):
+            self._insert_objects(ts, create_class, prepared)
+            core.timestep_summary.refresh_object_counts(self.session, [ts])
+            self.session.commit()
+
+    def _read_objects(self, ts_extension, create_class):
+        """Enumerate, renumber and filter the objects of one type in a timestep, without touching the database.
+
+        Returns a list of columns in the order of _object_columns[:6]"""
         enumerator = self._autoadd_zeros(self.simulation_output.enumerate_objects)
+        objects = np.array([tuple(row) for row in enumerator(ts_extension, object_typetag=create_class.tag,
+                                                             min_halo_particles=self.min_halo_particles)],
+                           dtype=self._object_dtype)
 
-        for catalog_id, finder_id, NDM, Nstar, Ngas in enumerator(ts.extension, object_typetag=create_class.tag,
-                                                      min_halo_particles=self.min_halo_particles):
-            n_tot.append(NDM+Nstar+Ngas)
+        n_tot = objects['NDM'] + objects['NStar'] + objects['NGas']
 
         if self.renumber:
-            database_id = np.zeros(len(n_tot), dtype=int)
+            database_number = np.zeros(len(n_tot), dtype=np.int64)
 
             # Sort by total particle number, largest objects first. Use mergesort for sort stability.
-            database_id[np.argsort(-np.array(n_tot),kind='mergesort')] = np.arange(len(n_tot)) + 1
+            database_number[np.argsort(-n_tot,kind='mergesort')] = np.arange(len(n_tot)) + 1
         else:
-            database_id = [None]*len(n_tot)
-
-        for database_number, (catalog_id, finder_id, NDM, Nstar, Ngas) in zip(database_id,
-                                                                 enumerator(ts.extension, object_typetag=create_class.tag,
-                                                                            min_halo_particles=self.min_halo_particles)):
-            if database_number is None:
-                database_number = catalog_id
-
-            if (NDM+Nstar+Ngas >= self.min_halo_particles or NDM==0) \
-                    and (self.max_num_objects is None or database_number<=self.max_num_objects ):
-                h = create_class(ts, database_number, finder_id, catalog_id, NDM, Nstar, Ngas)
-                halos.append(h)
-
-        with pt.ExclusiveLock("db_write_lock"):
-            logger.info("Add %d %ss to timestep %r", len(halos), create_class.__name__, ts)
-            self.session.add_all(halos)
-            self.session.commit()
+            database_number = objects['catalog_id']
+
+        keep = (n_tot >= self.min_halo_particles) | (objects['NDM']==0)
+        if self.max_num_objects is not None:
+            keep &= database_number <= self.max_num_objects
+        objects = objects[keep]
+        database_number = database_number[keep]
+
+        return [database_number.tolist(), objects['finder_id'].tolist(), objects['catalog_id'].tolist(),
+                objects['NDM'].tolist(), objects['NStar'].tolist(), objects['NGas'].tolist()]
+
+    _object_columns = ['halo_number', 'finder_id', 'finder_offset', 'NDM', 'NStar', 'NGas',
+                       'timestep_id', 'creator_id', 'halo_type']
+
+    def _insert_objects(self, ts, create_class, columns):
+        """Insert objects prepared by _read_objects; must be called with the database write lock held"""
+        num_objects = len(columns[0])
+        object_typecode = create_class.__mapper_args__['polymorphic_identity']
+        # anything that may autoflush pending changes (e.g. timestep properties) must happen inside the lock
+        constant_columns = [[ts.id]*num_objects, [core.creator.get_creator_id()]*num_objects,
+                            [object_typecode]*num_objects]
+        rows = list(zip(*columns, *constant_columns))
+        logger.info("Add %d %ss to timestep %r", len(rows), create_class.__name__, ts)
+        bulk_insert.bulk_insert(self.session.connection(), core.halo.SimulationObjectBase.__table__,
+                                self._object_columns, rows)
 
     def add_timestep_properties(self, ts):
         for key, value in self.simulation_output.get_timestep_properties(ts.extension).items():
@@ -5,9 +5,9 @@ import tangos as db
 
 from .. import config
 from ..core import get_or_create_dictionary_item
-from ..core.halo_data import HaloLink, HaloProperty
 from ..input_handlers import ahf_trees as at
 from ..log import logger
+from ..util import link_writer
 from . import GenericTangosTool
 
 
@@ -35,28 +35,18 @@ class AHFTreeImporter(GenericTangosTool):
         else:
             raise ValueError("Unable to convert %s to snapshot number"%filename)
 
-    def create_timestep_halo_dictionary(self, ts):
-        halos = ts.halos.all()
-        out = {}
-        for h in halos:
-            out[h.finder_id] = h
-        return out
-
-    def create_links(self, ts, ts_next, link_dictionary):
+    def create_links(self, ts, ts_next, link_arrays):
         session = db.get_default_session()
         d_id = get_or_create_dictionary_item(session, "ahf_tree_link")
-        objs_this = self.create_timestep_halo_dictionary(ts)
-        objs_next = self.create_timestep_halo_dictionary(ts_next)
-        links = []
-        for this_id, (next_id, merger_ratio) in link_dictionary:
-            this_obj = objs_this.get(this_id, None)
-            next_obj = objs_next.get(next_id, None)
-            if this_obj is not None and next_obj is not None:
-                links.append(HaloLink(this_obj, next_obj, d_id, merger_ratio))
-                links.append(HaloLink(next_obj, this_obj, d_id, merger_ratio))
-        session.add_all(links)
+        halos_this = link_writer.FinderIdMapper(session, ts)
+        halos_next = link_writer.FinderIdMapper(session, ts_next)
+        ids_this, ids_next, merger_ratios = link_arrays
+        num_links, _ = link_writer.insert_links_by_finder_id(session, halos_this, halos_next,
+                                                             ids_this, ids_next, merger_ratios, d_id)
+        num_links_back, _ = link_writer.insert_links_by_finder_id(session, halos_next, halos_this,
+                                                                  ids_next, ids_this, merger_ratios, d_id)
         session.commit()
-        logger.info("%d links created between %s and %s",len(links), ts, ts_next)
+        logger.info("%d links created between %s and %s", num_links + num_links_back, ts, ts_next)
 
 
     def run_calculation_loop(self):
@@ -70,4 +60,4 @@ class AHFTreeImporter(GenericTangosTool):
                 if ts_prev is not None:
                     #additionally check if this is the first snapshot
                     tree = at.AHFTree(os.path.join(config.base,simulation.basename), ts)
-                    self.create_links(ts_prev, ts, tree.get_links_for_snapshot())
+                    self.create_links(ts_prev, ts, tree.get_link_arrays_for_snapshot())
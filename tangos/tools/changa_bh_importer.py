@@ -5,6 +5,7 @@ import numpy as np
 from .. import config, core, parallel_tasks, tracking
 from ..input_handlers.changa_bh import BlackHolesLog, ShortenedOrbitLog
 from ..log import logger
+from ..util import link_writer
 from ..util.check_deleted import check_deleted
 from . import GenericTangosTool
 
@@ -57,102 +58,130 @@ class ChangaBHImporter(GenericTangosTool):
                 logger.error("Found: %s", candidate_filenames)
                 return
             self._bhmerger_filename = candidate_filenames[0]
+            self._bh_mergers = self._read_bh_mergers(self._bhmerger_filename)
             with self._session.no_autoflush:
                 self._generate_halolinks(pairs)
 
+    _bh_merger_dtype = np.dtype([('dest', np.int64), ('src', np.int64), ('ratio', np.float64), ('time', np.float64)])
+
+    @classmethod
+    def _read_bh_mergers(cls, filename):
+        """Read the whole .BHmergers file, returning a structured array sorted by the time of each merger"""
+        mergers = np.loadtxt(filename, usecols=(0, 1, 4, 6), dtype=cls._bh_merger_dtype, ndmin=1)
+        logger.info("Read %d BH mergers from %s", len(mergers), filename)
+        return mergers[np.argsort(mergers['time'], kind='stable')]
+
+    def _get_bh_mergers_between(self, t_start, t_end):
+        """Return the BH mergers with t_start < time <= t_end"""
+        times = self._bh_mergers['time']
+        return self._bh_mergers[np.searchsorted(times, t_start, side='right'):
+                                np.searchsorted(times, t_end, side='right')]
+
+    @staticmethod
+    def _get_bh_log(ts):
+        if BlackHolesLog.can_load(ts.filename):
+            return BlackHolesLog.get_existing_or_new(ts.filename)
+        elif ShortenedOrbitLog.can_load(ts.filename):
+            return ShortenedOrbitLog.get_existing_or_new(ts.filename)
+        else:
+            logger.error("Warning! No orbit file found!")
+            return None
+
+    _link_key_dtype = np.dtype([('from', np.int64), ('to', np.int64)])
+
+    @classmethod
+    def _link_keys(cls, ids_from, ids_to):
+        """Combine pairs of database ids into a structured array, for fast membership tests with np.isin"""
+        ids_from = np.asarray(ids_from, dtype=np.int64)
+        keys = np.empty(len(ids_from), dtype=cls._link_key_dtype)
+        keys['from'] = ids_from
+        keys['to'] = np.asarray(ids_to, dtype=np.int64)
+        return keys
+
+    def _get_existing_link_keys(self, relation, from_timestep):
+        """Return the sorted keys (see _link_keys) of existing links with the given relation from objects in a timestep"""
+        SimulationObjectBase = core.halo.SimulationObjectBase
+        HaloLink = core.halo_data.HaloLink
+        pairs = self._session.query(HaloLink.halo_from_id, HaloLink.halo_to_id).\
+            join(SimulationObjectBase, HaloLink.halo_from_id == SimulationObjectBase.id).\
+            filter(SimulationObjectBase.timestep_id == from_timestep.id, HaloLink.relation_id == relation.id).all()
+        pairs = np.array(pairs, dtype=np.int64).reshape((-1, 2))
+        return np.sort(self._link_keys(pairs[:, 0], pairs[:, 1]))
+
     def _generate_halolinks(self, pairs):
         for ts1, ts2 in parallel_tasks.distributed(pairs):
-            if BlackHolesLog.can_load(ts2.filename):
-                bh_log = BlackHolesLog(ts2.filename)
-            elif ShortenedOrbitLog.can_load(ts2.filename):
-                bh_log = ShortenedOrbitLog(ts2.filename)
-            else:
-                logger.error("Warning! No orbit file found!")
-
-            links = []
-            mergers_links = []
-            bh_map = {}
+            bh_log = self._get_bh_log(ts2)
+
             logger.info("Gathering BH tracking information for steps %r and %r", ts1, ts2)
             with parallel_tasks.ExclusiveLock("bh"):
                 dict_obj = core.get_or_create_dictionary_item(self._session, "tracker")
                 dict_obj_next = core.get_or_create_dictionary_item(self._session, "BH_merger_next")
                 dict_obj_prev = core.get_or_create_dictionary_item(self._session, "BH_merger_prev")
+                self._session.commit()
 
-            track_links_n, idf_n, idt_n = tracking.get_tracker_links(self._session, dict_obj_next)
-            bh_objects_1, nums1, id1 = self._get_bh_objs_numbers_and_dbids(ts1)
-            bh_objects_2, nums2, id2 = self._get_bh_objs_numbers_and_dbids(ts2)
-            tracker_links, idf, idt = tracking.get_tracker_links(self._session, dict_obj)
-
-            idf_n = np.array(idf_n)
-            idt_n = np.array(idt_n)
+            nums1, id1 = self._get_bh_numbers_and_dbids(ts1)
+            nums2, id2 = self._get_bh_numbers_and_dbids(ts2)
 
             if len(nums1) == 0 or len(nums2) == 0:
                 logger.info("No BHs found in either step %r or %r... moving on", ts1, ts2)
                 continue
 
             logger.info("Generating BH tracker links between steps %r and %r", ts1, ts2)
-            o1 = np.where(np.in1d(nums1, nums2))[0]
-            o2 = np.where(np.in1d(nums2, nums1))[0]
-            if len(o1) == 0 or len(o2) == 0:
+            _, o1, o2 = np.intersect1d(nums1, nums2, assume_unique=True, return_indices=True)
+            if len(o1) == 0:
                 continue
-            with self._session.no_autoflush:
-                for ii, jj in zip(o1, o2):
-                    if nums1[ii] != nums2[jj]:
-                        raise RuntimeError("BH iords are mismatched")
-                    exists = np.where((idf == id1[ii]) & (idt == id2[jj]))[0]
-                    if len(exists) == 0:
-                        links.append(core.halo_data.HaloLink(bh_objects_1[ii], bh_objects_2[jj], dict_obj, 1.0))
-                        links.append(core.halo_data.HaloLink(bh_objects_2[jj], bh_objects_1[ii], dict_obj, 1.0))
-            logger.info("Generated %d tracker links between steps %r and %r", len(links), ts1, ts2)
+            new_link = ~np.isin(self._link_keys(id1[o1], id2[o2]), self._get_existing_link_keys(dict_obj, ts1))
+            track_from, track_to = id1[o1][new_link], id2[o2][new_link]
+            logger.info("Generated %d tracker links between steps %r and %r", 2*len(track_from), ts1, ts2)
 
             logger.info("Generating BH Merger information for steps %r and %r", ts1, ts2)
-            for l in open(self._bhmerger_filename):
-                l_split = l.split()
-                t = float(l_split[6])
-                bh_dest_id = int(l_split[0])
-                bh_src_id = int(l_split[1])
-                ratio = float(l_split[4])
-
+            bh_map = {}
+            for bh_dest_id, bh_src_id, ratio, t in self._get_bh_mergers_between(ts1.time_gyr, ts2.time_gyr).tolist():
                 # ratios in merger file are ambiguous (since major progenitor may be "source" rather than "destination")
                 # re-establish using the log file:
                 try:
+                    if bh_log is None:
+                        raise ValueError("No BH log")
                     ratio = bh_log.determine_merger_ratio(bh_src_id, bh_dest_id)
-                except (ValueError, AttributeError) as e:
+                except ValueError as e:
                     logger.debug(
                         "Could not calculate merger ratio for %d->%d from the BH log; assuming the .BHmergers-asserted value is accurate",
                         bh_src_id, bh_dest_id)
-
-                if t > ts1.time_gyr and t <= ts2.time_gyr:
-                    bh_map[bh_src_id] = (bh_dest_id, ratio)
+                bh_map[bh_src_id] = (bh_dest_id, ratio)
 
             self._resolve_multiple_mergers(bh_map)
             logger.info("Gathering BH merger links for steps %r and %r", ts1, ts2)
-            with self._session.no_autoflush:
-                for src, (dest, ratio) in bh_map.items():
-                    if src not in nums1 or dest not in nums2:
-                        logger.warning("Can't link BH %r -> %r; missing BH objects in database", src, dest)
-                        continue
-                    bh_src_before = bh_objects_1[nums1.index(src)]
-                    bh_dest_after = bh_objects_2[nums2.index(dest)]
-
-                    if ((idf_n == bh_src_before.id) & (idt_n == bh_dest_after.id)).sum() == 0:
-                        mergers_links.append(
-                            core.halo_data.HaloLink(bh_src_before, bh_dest_after, dict_obj_next, 1.0))
-                        mergers_links.append(
-                            core.halo_data.HaloLink(bh_dest_after, bh_src_before, dict_obj_prev, ratio))
+            index1 = {num: i for i, num in enumerate(nums1.tolist())}
+            index2 = {num: i for i, num in enumerate(nums2.tolist())}
+            merger_from, merger_to, merger_ratio = [], [], []
+            for src, (dest, ratio) in bh_map.items():
+                if src not in index1 or dest not in index2:
+                    logger.warning("Can't link BH %r -> %r; missing BH objects in database", src, dest)
+                    continue
+                merger_from.append(id1[index1[src]])
+                merger_to.append(id2[index2[dest]])
+                merger_ratio.append(ratio)
 
-            logger.info("Generated %d BH merger links for steps %r and %r", len(mergers_links), ts1, ts2)
+            new_link = ~np.isin(self._link_keys(merger_from, merger_to),
+                                self._get_existing_link_keys(dict_obj_next, ts1))
+            merger_from = np.asarray(merger_from, dtype=np.int64)[new_link]
+            merger_to = np.asarray(merger_to, dtype=np.int64)[new_link]
+            merger_ratio = np.asarray(merger_ratio, dtype=np.float64)[new_link]
+            logger.info("Generated %d BH merger links for steps %r and %r", 2*len(merger_from), ts1, ts2)
 
             with parallel_tasks.ExclusiveLock("bh"):
-                logger.info("Committing total %d BH links for steps %r and %r", len(mergers_links) + len(links), ts1,
-                            ts2)
-                self._session.add_all(links)
-                self._session.add_all(mergers_links)
+                logger.info("Committing total %d BH links for steps %r and %r",
+                            2*(len(track_from) + len(merger_from)), ts1, ts2)
+                link_writer.insert_links(self._session, track_from, track_to, 1.0, dict_obj)
+                link_writer.insert_links(self._session, track_to, track_from, 1.0, dict_obj)
+                link_writer.insert_links(self._session, merger_from, merger_to, 1.0, dict_obj_next)
+                link_writer.insert_links(self._session, merger_to, merger_from, merger_ratio, dict_obj_prev)
                 self._session.commit()
                 logger.info("Finished committing BH links for steps %r and %r", ts1, ts2)
 
     def _generate_missing_bh_objects(self, bh_iord, f, existing_obj_num):
         halo = []
+        existing_obj_num = set(existing_obj_num)
         for bhi in bh_iord:
             if bhi not in existing_obj_num:
                 halo.append(core.halo.BH(f, int(bhi)))
@@ -161,14 +190,12 @@ class ChangaBHImporter(GenericTangosTool):
 
     def _collect_bh_trackers(self, bh_iord, sim, existing_trackers):
         track = []
-        for bhi in bh_iord:
+        for bhi in np.asarray(bh_iord)[~np.isin(bh_iord, existing_trackers)]:
             bhi = int(bhi)
-            et = np.where(existing_trackers == bhi)[0]
-            if len(et) == 0:
-                tx = core.tracking.TrackData(sim, bhi)
-                tx.particles = [bhi]
-                tx.use_iord = True
-                track.append(tx)
+            tx = core.tracking.TrackData(sim, bhi)
+            tx.particles = [bhi]
+            tx.use_iord = True
+            track.append(tx)
         return track
 
     def _get_bh_halo_assignments(self, pynbody_snapshot):
@@ -274,58 +301,42 @@ class ChangaBHImporter(GenericTangosTool):
             host_dict_id = core.dictionary.get_or_create_dictionary_item(self._session, hostname)
         else:
             host_dict_id = None
+        self._session.flush()
 
         logger.info("Gathering %s links for step %r", linkname, timestep)
 
-        links, link_id_from, link_id_to = tracking.get_tracker_links(self._session, linkname_dict_id)
-        halos = timestep.halos.filter_by(object_typecode=0).all()
-
-        halo_nums = [h.halo_number for h in halos]
-        halo_catind = [h.finder_id for h in halos]
-        halo_ids = np.array([h.id for h in halos])
+        existing_links = self._get_existing_link_keys(linkname_dict_id, timestep)
+        halo_ids = link_writer.FinderIdMapper(self._session, timestep, 0)(np.asarray(bh_halo_assignment, dtype=np.int64))
 
         logger.info("Gathering bh halo information for %r", timestep)
         with parallel_tasks.lock.SharedLock("bh"):
-            bh_database_object, existing_bh_nums, bhobj_ids = self._get_bh_objs_numbers_and_dbids(timestep)
-
-        bh_links = []
-
-        with self._session.no_autoflush:
-            for bhi, haloi in zip(bh_iord, bh_halo_assignment):
-                haloi = int(haloi)
-                bhi = int(bhi)
-                if haloi not in halo_catind:
-                    logger.warning("Skipping BH in halo %d as no corresponding halo found in the database", haloi)
-                    continue
-                if bhi not in existing_bh_nums:
-                    logger.warning("Can't find the database object for BH %d", bhi)
-                    print(bhi)
-                    print(existing_bh_nums)
-                    continue
+            bh_ids = link_writer.FinderIdMapper(self._session, timestep, core.halo.BH.__mapper_args__['polymorphic_identity'])(
+                np.asarray(bh_iord, dtype=np.int64))
 
-                bh_index_in_list = existing_bh_nums.index(bhi)
-                halo_index_in_list = halo_catind.index(haloi)
-                bh_obj = bh_database_object[bh_index_in_list]
-                halo_obj = halos[halo_index_in_list]
+        for haloi in np.asarray(bh_halo_assignment)[halo_ids < 0]:
+            logger.warning("Skipping BH in halo %d as no corresponding halo found in the database", haloi)
+        for bhi in np.asarray(bh_iord)[(bh_ids < 0) & (halo_ids >= 0)]:
+            logger.warning("Can't find the database object for BH %d", bhi)
 
-                num_existing_links = ((link_id_from == halo_ids[halo_index_in_list]) & (
-                            link_id_to == bhobj_ids[bh_index_in_list])).sum()
-                if num_existing_links == 0:
-                    bh_links.append(core.halo_data.HaloLink(halo_obj, bh_obj, linkname_dict_id))
-                    if host_dict_id is not None:
-                        bh_links.append(core.halo_data.HaloLink(bh_obj, halo_obj, host_dict_id))
+        new_link = (halo_ids >= 0) & (bh_ids >= 0)
+        new_link[new_link] = ~np.isin(self._link_keys(halo_ids[new_link], bh_ids[new_link]), existing_links)
+        halo_ids = halo_ids[new_link]
+        bh_ids = bh_ids[new_link]
 
-        logger.info("Committing %d %s links for step %r...", len(bh_links), linkname, timestep)
+        num_links = len(halo_ids) * (1 if host_dict_id is None else 2)
+        logger.info("Committing %d %s links for step %r...", num_links, linkname, timestep)
         with parallel_tasks.ExclusiveLock("bh"):
-            self._session.add_all(bh_links)
+            link_writer.insert_links(self._session, halo_ids, bh_ids, 1.0, linkname_dict_id)
+            if host_dict_id is not None:
+                link_writer.insert_links(self._session, bh_ids, halo_ids, 1.0, host_dict_id)
             self._session.commit()
         logger.info("...done")
 
-    def _get_bh_objs_numbers_and_dbids(self, timestep):
-        bh_database_object = timestep.bhs.all()
-        existing_bh_nums = [x.halo_number for x in bh_database_object]
-        bhobj_ids = np.array([x.id for x in bh_database_object])
-        return bh_database_object, existing_bh_nums, bhobj_ids
+    def _get_bh_numbers_and_dbids(self, timestep):
+        BH = core.halo.BH
+        rows = self._session.query(BH.halo_number, BH.id).filter(BH.timestep_id == timestep.id).all()
+        rows = np.array(rows, dtype=np.int64).reshape((-1, 2))
+        return rows[:, 0], rows[:, 1]
 
     def _add_missing_trackdata_and_BH_objects(self, timestep, this_step_bh_iords, existing_bhobj_iords):
         with parallel_tasks.ExclusiveLock("bh"):
@@ -336,6 +347,8 @@ class ChangaBHImporter(GenericTangosTool):
 
             self._session.add_all(tracker_to_add)
             self._session.add_all(halo_to_add)
+            self._session.flush()
+            core.timestep_summary.refresh_object_counts(self._session, [timestep])
             self._session.commit()
         logger.info("Committed %d new trackdata and %d new BH objects for %r", len(tracker_to_add),
                     len(halo_to_add), timestep)
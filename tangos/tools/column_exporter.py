@@ -0,0 +1,54 @@
+from .. import core, parallel_tasks
+from ..log import logger
+from ..util import column_export
+from . import GenericTangosTool
+
+
+class ColumnExporter(GenericTangosTool):
+    tool_name = 'export-columns'
+    tool_description = 'Export stored properties to memory-mappable column files, one table per timestep'
+
+    @classmethod
+    def add_parser_arguments(self, parser):
+        parser.add_argument('--sims', '--for', action='store', nargs='*',
+                            metavar='simulation_name',
+                            help='Specify a simulation (or multiple simulations) to run on')
+
+        parser.add_argument('--output', action='store', type=str, default=None,
+                            help='The folder in which to write the export. Defaults to config.column_export_path, '
+                                 'which is where TimeStep.calculate_all looks for exports.')
+
+        parser.add_argument('--force', action='store_true',
+                            help='Rewrite exports even if they are already up to date with the database')
+
+        parser.add_argument('properties', action='store', nargs='*',
+                            help="The names of the properties to export; if not specified, all stored properties "
+                                 "are exported.")
+
+    def process_options(self, options):
+        self.options = options
+
+    def _export_is_current(self, session, ts):
+        try:
+            table = column_export.open_timestep(ts, self.options.output)
+        except (OSError, ValueError):
+            return False
+        if table is None or not table.is_current(session, ts):
+            return False
+        return len(self.options.properties)==0 or all(name in table for name in self.options.properties)
+
+    def run_calculation_loop(self):
+        session = core.get_default_session()
+        base_sim = core.sim_query_from_name_list(self.options.sims)
+        property_names = self.options.properties if len(self.options.properties)>0 else None
+
+        for x in base_sim:
+            timesteps = session.query(core.timestep.TimeStep).filter_by(simulation_id=x.id).\
+                order_by(core.timestep.TimeStep.time_gyr).all()
+
+            for ts in parallel_tasks.distributed(timesteps):
+                if not self.options.force and self._export_is_current(session, ts):
+                    logger.info("Export of %r is already up to date", ts)
+                    continue
+                exported = column_export.export_timestep(session, ts, self.options.output, property_names)
+                logger.info("Exported %d properties for %r", len(exported), ts)
@@ -8,10 +8,11 @@ import tangos as db
 
 from .. import config
 from ..core import get_or_create_dictionary_item
-from ..core.halo import PhantomHalo
-from ..core.halo_data import HaloLink, HaloProperty
+from ..core.halo import Halo, PhantomHalo
+from ..core.halo_data import HaloProperty
 from ..input_handlers import consistent_trees as ct
 from ..log import logger
+from ..util import link_writer
 from ..util.read_datasets_file import read_datasets
 from . import GenericTangosTool
 
@@ -76,6 +77,8 @@ class ConsistentTreesImporter(GenericTangosTool):
         session = db.core.get_default_session()
 
         session.add_all(new_phantoms)
+        session.flush()
+        db.core.timestep_summary.refresh_object_counts(session, [timestep])
         session.commit()
         logger.info("Add %d phantom halos to timestep %s", len(new_phantoms), timestep)
         logger.info("Total number of phantoms in tree %d; existing phantoms %d", n_phantoms, len(existing_phantoms))
@@ -90,21 +93,26 @@ class ConsistentTreesImporter(GenericTangosTool):
             out[-p.finder_id] = p
         return out
 
-    def create_links(self, ts, ts_next, link_dictionary):
+    def create_finder_id_mapper(self, ts):
+        """Return a function mapping finder ids onto database ids, with negative finder ids denoting phantoms"""
+        session = db.get_default_session()
+        halos = link_writer.FinderIdMapper(session, ts, Halo.__mapper_args__['polymorphic_identity'])
+        phantoms = link_writer.FinderIdMapper(session, ts, PhantomHalo.__mapper_args__['polymorphic_identity'])
+        def mapper(finder_ids):
+            finder_ids = np.asarray(finder_ids)
+            return np.where(finder_ids >= 0, halos(finder_ids), phantoms(-finder_ids))
+        return mapper
+
+    def create_links(self, ts, ts_next, link_arrays):
         session = db.get_default_session()
         d_id = get_or_create_dictionary_item(session, "consistent_trees_link")
-        objs_this = self.create_timestep_halo_dictionary(ts)
-        objs_next = self.create_timestep_halo_dictionary(ts_next)
-        links = []
-        for this_id, (next_id, merger_ratio) in link_dictionary.items():
-            this_obj = objs_this.get(this_id, None)
-            next_obj = objs_next.get(next_id, None)
-            if this_obj is not None and next_obj is not None:
-                links.append(HaloLink(this_obj, next_obj, d_id, 1.0))
-                links.append(HaloLink(next_obj, this_obj, d_id, merger_ratio))
-        session.add_all(links)
+        ids_this, ids_next, merger_ratios = link_arrays
+        ids_this = self.create_finder_id_mapper(ts)(ids_this)
+        ids_next = self.create_finder_id_mapper(ts_next)(ids_next)
+        num_links = link_writer.insert_links(session, ids_this, ids_next, 1.0, d_id)
+        num_links += link_writer.insert_links(session, ids_next, ids_this, merger_ratios, d_id)
         session.commit()
-        logger.info("%d links created between %s and %s",len(links), ts, ts_next)
+        logger.info("%d links created between %s and %s",num_links, ts, ts_next)
 
     def store_ids(self, ts, id_to_tree_id):
         session = db.get_default_session()
@@ -118,6 +126,8 @@ class ConsistentTreesImporter(GenericTangosTool):
                 tree_id = id_to_tree_id.get(o.finder_id, None)
             if tree_id is not None:
                 session.add(HaloProperty(o, dict_obj, tree_id))
+        session.flush()
+        db.core.timestep_summary.refresh_property_counts(session, [ts], [dict_obj.id])
         session.commit()
         logger.info("%d consistent tree IDs added to step %s", len(props), ts)
 
@@ -138,4 +148,4 @@ class ConsistentTreesImporter(GenericTangosTool):
                 if ts_next is not None:
                     n_phantoms = tree.get_num_phantoms_in_snapshot(snapnum+1)
                     self.create_phantoms(ts_next, n_phantoms)
-                    self.create_links(ts, ts_next, tree.get_links_for_snapshot(snapnum))
+                    self.create_links(ts, ts_next, tree.get_link_arrays_for_snapshot(snapnum))
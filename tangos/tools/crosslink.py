@@ -11,6 +11,7 @@ from tangos import core, parallel_tasks
 from tangos.log import logger
 
 from .. import config
+from ..util import link_writer
 from . import GenericTangosTool
 
 
@@ -37,6 +38,9 @@ class GenericLinker(GenericTangosTool):
                             help='Process in reverse order (low-z first)')
         parser.add_argument('--dmonly', action='store_true',
                             help='only match halos based on DM particles. Much more memory efficient, but currently only works for Rockstar halos')
+        parser.add_argument('--low-memory', action='store_true',
+                            help='match particles using only their ids and halo membership, compared in chunks, rather '
+                                 'than bridging the full snapshots. Use for snapshots too large to hold in memory')
 
     def run_calculation_loop(self):
         parallel_tasks.database.synchronize_creator_object()
@@ -53,7 +57,8 @@ class GenericLinker(GenericTangosTool):
         for s_x, s in pair_list:
             logger.info("Linking %r and %r",s_x,s)
             if self.args.force or self.need_crosslink_ts(s_x, s, object_type):
-                self.crosslink_ts(s_x, s, 0, self.args.hmax, self.args.dmonly, object_typecode=object_type)
+                self.crosslink_ts(s_x, s, 0, self.args.hmax, self.args.dmonly, object_typecode=object_type,
+                                  low_memory=self.args.low_memory)
 
     def _generate_timestep_pairs(self):
         raise NotImplementedError("No implementation found for generating the timestep pairs")
@@ -84,77 +89,76 @@ class GenericLinker(GenericTangosTool):
             return False
         return True
 
-    def create_db_objects_from_catalog(self, cat, finder_id_to_halos_1, finder_id_to_halos_2, same_d_id):
-        items = []
-        missing_db_object = 0
+    @staticmethod
+    def catalog_to_arrays(cat):
+        """Flatten a catalog returned by match_objects into arrays of finder_id_from, finder_id_to and weight"""
+        finder_ids_from, finder_ids_to, weights = [], [], []
         for i, possibilities in cat.items():
-            h1 = finder_id_to_halos_1.get(i, None)
             for cat_i, weight in possibilities:
-                h2 = finder_id_to_halos_2.get(cat_i, None)
-
-                if h1 is not None and h2 is not None:
-                    items.append(core.halo_data.HaloLink(h1, h2, same_d_id, weight))
-                else:
-                    missing_db_object += 1
-
-        if missing_db_object > 0:
-            logger.warning("%d link(s) could not be identified because the halo objects do not exist in the DB",
-                        missing_db_object)
-        return items
-
-    def make_finder_id_to_halo_map(self, ts, object_typecode):
-        halos = ts.objects.filter_by(object_typecode=object_typecode).all()
-        halos_map = {h.finder_id: h for h in halos}
-        return halos_map
-
-    def crosslink_ts(self, ts1, ts2, halo_min=0, halo_max=None, dmonly=False, threshold=config.default_linking_threshold, object_typecode=0):
+                finder_ids_from.append(i)
+                finder_ids_to.append(cat_i)
+                weights.append(weight)
+        return (np.array(finder_ids_from, dtype=np.int64), np.array(finder_ids_to, dtype=np.int64),
+                np.array(weights, dtype=np.float64))
+
+    def crosslink_ts(self, ts1, ts2, halo_min=0, halo_max=None, dmonly=False, threshold=config.default_linking_threshold, object_typecode=0,
+                     low_memory=False):
         """Link the halos of two timesteps together
 
+        If low_memory is True, the output handler is asked to match objects using only particle ids and membership,
+        and the snapshots are not kept alive once matching is complete.
+
         :type ts1 tangos.core.TimeStep
         :type ts2 tangos.core.TimeStep"""
         logger.info("Gathering halo information for %r and %r", ts1, ts2)
-        halos1 = self.make_finder_id_to_halo_map(ts1, object_typecode)
-        halos2 = self.make_finder_id_to_halo_map(ts2, object_typecode)
+        halos1 = link_writer.FinderIdMapper(self.session, ts1, object_typecode)
+        halos2 = link_writer.FinderIdMapper(self.session, ts2, object_typecode)
+        self.session.commit()
 
         same_d_id = self._get_linkname_dictionaryitem()
 
         output_handler_1 = ts1.simulation.get_output_handler()
         output_handler_2 = ts2.simulation.get_output_handler()
-        if type(output_handler_1).match_objects != type(output_handler_2).match_objects:
+        if type(output_handler_1).match_objects != type(output_handler_2).match_objects or \
+                type(output_handler_1).match_objects_symmetric != type(output_handler_2).match_objects_symmetric:
             logger.error("Timesteps %r and %r cannot be crosslinked; they are using incompatible file readers",
                          ts1, ts2)
             return
 
-        # keep the files alive throughout (so they are not garbage-collected after the first match_objects):
-        snap1 = ts1.load()
-        snap2 = ts2.load()
+        if not low_memory:
+            # keep the files alive throughout (so they are not garbage-collected during matching):
+            snap1 = ts1.load()
+            snap2 = ts2.load()
 
         try:
-            cat = output_handler_1.match_objects(ts1.extension, ts2.extension, halo_min, halo_max, dmonly, threshold,
-                                                 core.halo.SimulationObjectBase.object_typetag_from_code(object_typecode),
-                                                 output_handler_for_ts2=output_handler_2)
-            back_cat = output_handler_2.match_objects(ts2.extension, ts1.extension, halo_min, halo_max, dmonly, threshold,
-                                                      core.halo.SimulationObjectBase.object_typetag_from_code(object_typecode),
-                                                      output_handler_for_ts2= output_handler_1)
+            cat, back_cat = output_handler_1.match_objects_symmetric(
+                ts1.extension, ts2.extension, halo_min, halo_max, dmonly, threshold,
+                core.halo.SimulationObjectBase.object_typetag_from_code(object_typecode),
+                output_handler_for_ts2=output_handler_2, low_memory=low_memory)
         except Exception as e:
             if isinstance(e, KeyboardInterrupt):
                 raise
             logger.exception("Exception during attempt to crosslink timesteps %r and %r", ts1, ts2)
             return
 
-        with self.session.no_autoflush:
-            logger.info("Gathering links for %r and %r", ts1, ts2)
-            items = self.create_db_objects_from_catalog(cat, halos1, halos2, same_d_id)
-            logger.info("Identified %d links between %r and %r", len(items), ts1, ts2)
-            items_back = self.create_db_objects_from_catalog(back_cat, halos2, halos1, same_d_id)
-            logger.info("Identified %d links between %r and %r", len(items_back), ts2, ts1)
+        logger.info("Gathering links for %r and %r", ts1, ts2)
+        links = self.catalog_to_arrays(cat)
+        links_back = self.catalog_to_arrays(back_cat)
 
         with parallel_tasks.ExclusiveLock("create_db_objects_from_catalog"):
             logger.info("Preparing to commit links for %r and %r", ts1, ts2)
-            self.session.add_all(items)
-            self.session.add_all(items_back)
+            num_links, missing = link_writer.insert_links_by_finder_id(self.session, halos1, halos2, *links,
+                                                                       same_d_id)
+            logger.info("Identified %d links between %r and %r", num_links, ts1, ts2)
+            num_links_back, missing_back = link_writer.insert_links_by_finder_id(self.session, halos2, halos1,
+                                                                                 *links_back, same_d_id)
+            logger.info("Identified %d links between %r and %r", num_links_back, ts2, ts1)
             self.session.commit()
-        logger.info("Finished committing total of %d links for %r and %r", len(items)+len(items_back), ts1, ts2)
+
+        if missing + missing_back > 0:
+            logger.warning("%d link(s) could not be identified because the halo objects do not exist in the DB",
+                           missing + missing_back)
+        logger.info("Finished committing total of %d links for %r and %r", num_links+num_links_back, ts1, ts2)
 
     def _get_linkname_dictionaryitem(self):
         with parallel_tasks.ExclusiveLock("create_db_objects_from_catalog"):
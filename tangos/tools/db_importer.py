@@ -1,3 +1,4 @@
+import concurrent.futures
 import sys
 from typing import Optional
 
@@ -9,7 +10,12 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.schema import Column
 
 from tangos import Base, Creator, DictionaryItem, core
-from tangos.config import DB_IMPORT_CHUNK_SIZE
+from tangos.config import (
+    DB_IMPORT_CHUNK_BYTES,
+    DB_IMPORT_CHUNK_SIZE,
+    DB_IMPORT_MAX_CHUNK_SIZE,
+    DB_IMPORT_MAX_RETRIES,
+)
 from tangos.core import (
     HaloLink,
     HaloProperty,
@@ -17,8 +23,10 @@ from tangos.core import (
     SimulationObjectBase,
     SimulationProperty,
     TimeStep,
+    TimeStepSummary,
 )
 
+from ..util import bulk_insert, chunked_delete
 from . import GenericTangosTool
 
 
@@ -34,6 +42,10 @@ class DBImporter(GenericTangosTool):
         parser.add_argument("--exclude-properties", type=str, nargs="*", default=[],
                             help="Specify a property that should *excluded* from the copy. "
                                  "Useful if some properties are known to be large.")
+        parser.add_argument("--connections", type=int, default=1,
+                            help="Copy up to this many tables concurrently, each on its own database connection. "
+                                 "Ignored when importing into an SQLite database, which cannot be written "
+                                 "concurrently.")
 
     def process_options(self, options):
         self.options = options
@@ -55,16 +67,18 @@ class DBImporter(GenericTangosTool):
 
             exclude_dict_ids = [core.get_dict_id(x, session = ext_session) for x in self.options.exclude_properties]
             exclusion_information = {DictionaryItem.__table__.c.id: exclude_dict_ids}
-            _db_import_export(core.get_default_session(), ext_session, exclusion_information)
+            _db_import_export(core.get_default_session(), ext_session, exclusion_information,
+                              self.options.connections)
 
 
-def _db_import_export(target_session, from_session, exclusion_information = None):
+def _db_import_export(target_session, from_session, exclusion_information = None, num_connections = 1):
     """Copy all database entries from one session into another
 
     *args*:
     target_session: the session to copy into
     from_session: the session to copy from
     exclusion_information: a dictionary mapping from columns to ids within those columns that should be excluded
+    num_connections: the number of tables to copy concurrently (ignored for SQLite targets)
 
     This is a non-trivial operation. The following steps are taken:
 
@@ -78,15 +92,28 @@ def _db_import_export(target_session, from_session, exclusion_information = None
         * Any sqlalchemy filter expressions in sql_filters are applied. If the table being copied from
           does not have the relevant columns, even after translating primary to foreign keys,
           the filter is ignored.
+        * Since the id offsets are known in advance, the tables are independent of each other and may be
+          copied concurrently
+        * Each table is copied in chunks, which are committed as they go; see _copy_table
     4) The temporary dictionary table is de-duplicated, and the result copied back to the permanent dictionary table
     5) Indexes and foreign keys are recreated on the target
+
+    If copying fails, the rows copied so far are deleted again (see _delete_partial_import), so that the import can
+    simply be run again once the problem is fixed.
     """
 
     target_connection = target_session.connection()
     from_connection = from_session.connection()
 
     copy_classes = [Creator, Simulation, TimeStep, SimulationObjectBase, DictionaryItem, SimulationProperty,
-                    HaloLink, HaloProperty]
+                    HaloLink, HaloProperty, TimeStepSummary]
+
+    # databases created by older versions of tangos (or not yet upgraded; see core.migrations) may not have all the
+    # tables; in that case, the target simply falls back to its default behaviour for the missing information (e.g.
+    # counting objects live)
+    from_tables = sqlalchemy.inspect(from_connection).get_table_names()
+    target_tables = sqlalchemy.inspect(target_connection).get_table_names()
+    copy_classes = [c for c in copy_classes if c.__tablename__ in from_tables and c.__tablename__ in target_tables]
 
     print("Dropping foreign key constraints...")
     _drop_foreign_keys(target_session)
@@ -98,11 +125,17 @@ def _db_import_export(target_session, from_session, exclusion_information = None
     # this is necessary because the dictionary table has a unique constraint on the text column
     # which we temporarily need to violate
     temp_dict = _create_temporary_dictionary(target_connection)
+    # commit so that the temporary dictionary is visible to the connections used for copying
+    target_connection.commit()
 
 
     print("Copying tables...")
+    id_offsets = None
     try:
-        id_offsets = {}
+        id_offsets = _get_id_offsets(target_connection, copy_classes)
+        target_connection.commit()
+
+        copy_jobs = []
         for target in copy_classes:
             if target == DictionaryItem:
                 # special treatment to avoid unique constraint violation - insert into a temporary
@@ -110,14 +143,22 @@ def _db_import_export(target_session, from_session, exclusion_information = None
                 target_table = temp_dict
             else:
                 target_table = None
-            id_offsets = _copy_table(from_connection, target_connection, target, id_offsets, target_table,
-                                     exclusion_information)
+            copy_jobs.append((target, target_table))
+
+        _copy_tables(from_session.get_bind(), target_connection.engine, copy_jobs, id_offsets,
+                     exclusion_information, num_connections)
 
         _dedup_temp_dictionary_items(target_connection, temp_dict)
         _temporary_to_permanent_dictionary(target_connection, temp_dict)
 
         target_connection.commit()
 
+    except BaseException:
+        target_connection.rollback()
+        if id_offsets is not None:
+            _delete_partial_import(target_connection.engine, copy_classes, id_offsets)
+        raise
+
     finally:
         from_session.close()
         target_connection.rollback()
@@ -136,10 +177,63 @@ def _db_import_export(target_session, from_session, exclusion_information = None
         target_session.close()
 
 
-def _copy_table(from_connection, target_connection, orm_class, offsets, destination_table=None,
-                exclusion_information: Optional[dict[Column, list[int]]]=None):
-    import tqdm
-    from sqlalchemy import func, insert, select
+def _delete_partial_import(target_engine, copy_classes, offsets):
+    """Delete the rows copied by an import that failed part way through.
+
+    Since each table is committed chunk by chunk, the rows copied before the failure would otherwise remain, and
+    importing again would duplicate them. The copied rows are exactly those with ids above the offsets. If the
+    deletion itself fails, those rows must be deleted by hand before importing again."""
+    print("Import failed; deleting the rows copied so far...")
+    for orm_class in copy_classes:
+        if orm_class is DictionaryItem:
+            continue # copied into the temporary dictionary, which is dropped in any case
+        table = orm_class.__table__
+        chunked_delete.delete_in_chunks(target_engine, table, sqlalchemy.true(),
+                                        f"Deleting imported {orm_class.__name__}", start_after_id=offsets[table.c.id])
+
+def _get_id_offsets(target_connection, copy_classes):
+    """Return a dictionary mapping the id column of each table to the offset that will be added to imported ids.
+
+    The offset is the maximum id already in the target table, so that imported rows do not collide with existing
+    ones."""
+    from sqlalchemy import func, select
+    offsets = {}
+    for orm_class in copy_classes:
+        table = orm_class.__table__
+        # NB no query_filter should be applied here because we want to know the maximum id in the existing table
+        # which may include rows that would be excluded by the filter
+        offsets[table.c.id] = target_connection.execute(select(func.max(table.c.id))).scalar() or 0
+    return offsets
+
+def _copy_tables(from_engine, target_engine, copy_jobs, offsets, exclusion_information, num_connections=1):
+    """Copy each (orm_class, destination_table) in copy_jobs, using up to num_connections concurrent connections"""
+    if num_connections>1 and target_engine.dialect.name=='sqlite':
+        print("Note: SQLite databases cannot be written concurrently; copying one table at a time.")
+        num_connections = 1
+
+    if num_connections<=1:
+        for orm_class, destination_table in copy_jobs:
+            _copy_table(from_engine, target_engine, orm_class, offsets, destination_table, exclusion_information)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_connections) as executor:
+        futures = [executor.submit(_copy_table, from_engine, target_engine, orm_class, offsets, destination_table,
+                                   exclusion_information, progress_position=i)
+                   for i, (orm_class, destination_table) in enumerate(copy_jobs)]
+        for future in futures:
+            future.result()
+
+def _copy_table(from_engine, target_engine, orm_class, offsets, destination_table=None,
+                exclusion_information: Optional[dict[Column, list[int]]]=None, progress_position=0):
+    """Copy all rows of one table, adding the id offsets to primary and foreign keys.
+
+    The rows are read in order of id, in chunks sized by their data volume (see DB_IMPORT_CHUNK_BYTES). Each chunk is
+    inserted using the fastest method the target supports (see util.bulk_insert) and committed. If the connection
+    to the target is lost, a new connection is made and the copy resumes after the last committed row.
+
+    :return: the number of rows copied
+    """
+    from sqlalchemy import func, select
 
     table = orm_class.__table__
 
@@ -149,56 +243,73 @@ def _copy_table(from_connection, target_connection, orm_class, offsets, destinat
     if exclusion_information is None:
         exclusion_information = {}
 
-    tab = orm_class.__table__
-
-    query_filter = _get_sqlalchemy_filter_from_exclusion_information(exclusion_information, tab)
-
-    num_rows = from_connection.execute(select(func.count(table.c.id)).filter(query_filter)).scalar()
-
-    id_offset = target_connection.execute(select(func.max(table.c.id))).scalar()
-    # NB no query_filter should be applied here because we want to know the maximum id in the existing table
-    # which may include rows that would be excluded by the filter
-
-    if id_offset is None:
-        id_offset = 0
-
-    offsets[table.c.id] = id_offset
+    query_filter = _get_sqlalchemy_filter_from_exclusion_information(exclusion_information, table)
     cols_select = _get_import_columns_with_required_offsets(table, offsets)
-
+    column_names = [c.name for c in destination_table.c]
+    id_position = list(table.c).index(table.c.id)
+    id_offset = offsets.get(table.c.id, 0)
 
     num_done = 0
-
-    source_result = from_connection.execute(select(*cols_select).filter(query_filter))
-
+    last_id = None
+    chunk_size = DB_IMPORT_CHUNK_SIZE
     retries = 0
 
-    with tqdm.tqdm(total=num_rows, desc = f"Copying {orm_class.__name__}", unit="row", smoothing=0.1) as pbar:
-        while num_done < num_rows:
-            all_rows = source_result.fetchmany(DB_IMPORT_CHUNK_SIZE)
-            all_rows = [tuple(r) for r in all_rows]
-
-            try:
-                target_connection.execute(insert(destination_table).values(all_rows))
-            except sqlalchemy.exc.OperationalError as e:
-                if retries>=1:
-                    raise # if this line is hit, it may reflect a data limit in the server, e.g. max_allowed_packet in MySQL
-                    # Such limits result in the connection being dropped. In PostgreSQL an error is written in the
-                    # server log, but in MySQL it does not seem to be. Reducing CHUNK_SIZE may help, or increasing
-                    # the limit on the server.
-
-                print(f"Note: lost connection to database after {num_done} rows. Trying again.")
-                target_connection.rollback()
-                # create a new connection from the target connection's engine
-                target_connection = target_connection.engine.connect()
-                source_result = from_connection.execute(select(table).offset(num_done))
-                retries+=1
-                continue
-
-            num_done += len(all_rows)
-            pbar.update(len(all_rows))
-
-
-    return offsets
+    with from_engine.connect() as from_connection:
+        num_rows = from_connection.execute(select(func.count(table.c.id)).filter(query_filter)).scalar()
+        target_connection = target_engine.connect()
+        try:
+            with tqdm.tqdm(total=num_rows, desc = f"Copying {orm_class.__name__}", unit="row", smoothing=0.1,
+                           position=progress_position) as pbar:
+                while True:
+                    query = select(*cols_select).filter(query_filter)
+                    if last_id is not None:
+                        query = query.filter(table.c.id > last_id)
+                    all_rows = [tuple(r) for r in
+                                from_connection.execute(query.order_by(table.c.id).limit(chunk_size))]
+                    if len(all_rows)==0:
+                        break
+
+                    try:
+                        bulk_insert.bulk_insert(target_connection, destination_table, column_names, all_rows)
+                        target_connection.commit()
+                    except sqlalchemy.exc.OperationalError:
+                        if retries>=DB_IMPORT_MAX_RETRIES:
+                            raise # if this line is hit, it may reflect a data limit in the server, e.g. max_allowed_packet in MySQL
+                            # Such limits result in the connection being dropped. In PostgreSQL an error is written in the
+                            # server log, but in MySQL it does not seem to be. Reducing DB_IMPORT_CHUNK_BYTES may help,
+                            # or increasing the limit on the server.
+
+                        print(f"Note: lost connection to database after {num_done} rows of {orm_class.__name__}. "
+                              f"Reconnecting and resuming.")
+                        target_connection = _reconnect(target_connection, target_engine)
+                        # a smaller chunk may get through if the connection was dropped because of a server limit
+                        chunk_size = max(1, len(all_rows)//2)
+                        retries+=1
+                        continue
+
+                    retries = 0
+                    last_id = all_rows[-1][id_position] - id_offset
+                    num_done += len(all_rows)
+                    pbar.update(len(all_rows))
+                    chunk_size = _next_chunk_size(all_rows)
+        finally:
+            target_connection.close()
+
+    return num_done
+
+def _reconnect(connection, engine):
+    try:
+        connection.rollback()
+        connection.close()
+    except sqlalchemy.exc.SQLAlchemyError:
+        pass
+    return engine.connect()
+
+def _next_chunk_size(rows):
+    """Choose how many rows to fetch next, so that a chunk holds roughly DB_IMPORT_CHUNK_BYTES of data"""
+    num_bytes = sum(len(value) if isinstance(value, (bytes, str)) else 8 for row in rows for value in row)
+    bytes_per_row = max(num_bytes/len(rows), 1)
+    return int(min(max(DB_IMPORT_CHUNK_BYTES/bytes_per_row, 1), DB_IMPORT_MAX_CHUNK_SIZE))
 
 def _get_foreign_key_dictionary_for_table(table) -> dict[Column, Column]:
     """Return a dictionary mapping foreign columns to local columns for this table"""
@@ -220,7 +331,8 @@ def _get_sqlalchemy_filter_from_exclusion_information(exclusion_information: dic
         if column.table == table:
             filts.append(~column.in_(ids_to_exclude))
         elif column in fk_dict.keys():
-            filts.append(~fk_dict[column].in_(ids_to_exclude))
+            # a null foreign key does not refer to any excluded row, so must be kept
+            filts.append(fk_dict[column].is_(None) | ~fk_dict[column].in_(ids_to_exclude))
         else:
             # we can't (currently) handle the case where we are two foreign keys away from the condition,
             # which would necessitate a join. Note that only need to check for being two foreign keys
@@ -134,6 +134,7 @@ class MergerTreePatcher(GenericTangosTool):
         next = halo
 
         ts = halo.timestep.previous
+        phantom_timesteps = []
 
         while ts!=matched.timestep:
             phantom = core.halo.PhantomHalo(ts, halo.halo_number, 0)
@@ -145,10 +146,13 @@ class MergerTreePatcher(GenericTangosTool):
             session.add(core.HaloLink(phantom, next, d_id, 1.0))
 
             next = phantom
+            phantom_timesteps.append(ts)
             ts = ts.previous
 
         session.add(core.HaloLink(next, matched, d_id, 1.0))
         session.add(core.HaloLink(matched, next, d_id, 1.0))
+        session.flush()
+        core.timestep_summary.refresh_object_counts(session, phantom_timesteps)
         session.commit()
 
     _candidates_cache = {}
@@ -1,4 +1,7 @@
+from sqlalchemy import exists, func, select
+
 from .. import core, query
+from ..util import chunked_delete
 from . import GenericTangosTool
 
 
@@ -28,38 +31,54 @@ class PropertyDeleter(GenericTangosTool):
         session = core.get_default_session()
         dictids = [core.get_dict_id(p) for p in self.options.properties]
 
+        properties = core.HaloProperty.__table__
+        objects = core.SimulationObjectBase.__table__
+        timesteps = core.TimeStep.__table__
+        base_condition = properties.c.name_id.in_(dictids)
+
         if self.options.for_ is not None:
-            base_query = session.query(core.HaloProperty.id).filter(core.HaloProperty.name_id.in_(dictids))
             print(f"Delete {', '.join(self.options.properties)}")
-            queries = []
+            conditions = []
+            affected_timesteps = []
             for s in self.options.for_:
-                q = base_query
                 obj = query.get_item(s)
                 if isinstance(obj, core.Simulation):
-                    q = q.join(core.SimulationObjectBase).join(core.TimeStep).join(core.Simulation).filter(core.Simulation.id == obj.id)
+                    condition = base_condition & exists().where(objects.c.id == properties.c.halo_id,
+                                                                objects.c.timestep_id == timesteps.c.id,
+                                                                timesteps.c.simulation_id == obj.id)
+                    affected_timesteps += obj.timesteps
                 elif isinstance(obj, core.TimeStep):
-                    q = q.join(core.SimulationObjectBase).join(core.TimeStep).filter(core.TimeStep.id == obj.id)
+                    condition = base_condition & exists().where(objects.c.id == properties.c.halo_id,
+                                                                objects.c.timestep_id == obj.id)
+                    affected_timesteps.append(obj)
                 elif isinstance(obj, core.SimulationObjectBase):
-                    q = q.join(core.SimulationObjectBase).filter(core.SimulationObjectBase.id == obj.id)
-
-                print(f"  from {obj} ({q.count():d} total properties)")
+                    condition = base_condition & (properties.c.halo_id == obj.id)
+                    affected_timesteps.append(obj.timestep_id)
 
-                # it's not permitted to delete from an expression with a join, so now we need to create a wrapping query
-                q = session.query(core.HaloProperty).filter(core.HaloProperty.id.in_(session.query(q.subquery())))
-                queries.append(q)
+                print(f"  from {obj} ({self._count(session, condition):d} total properties)")
+                conditions.append(condition)
         else:
-            queries = [session.query(core.HaloProperty).filter(core.HaloProperty.name_id.in_(dictids))]
+            conditions = [base_condition]
+            affected_timesteps = None
             print(f"Delete {', '.join(self.options.properties)} from entire database "
-                  f"({queries[0].count()} total properties)")
+                  f"({self._count(session, base_condition)} total properties)")
 
         ok = self.options.force
         if not ok:
             print("""Type "yes" to continue""")
             ok = input(":").lower() == "yes"
         if ok:
-            for q in queries:
-                q.delete(synchronize_session=False)
+            # release any locks held by the session before deleting on separate transactions
+            session.commit()
+            for condition in conditions:
+                chunked_delete.delete_in_chunks(core.get_default_engine(), properties, condition,
+                                                "Deleting properties")
+            core.timestep_summary.refresh_property_counts(session, affected_timesteps, dictids)
             session.commit()
             print("Completed")
         else:
             print("Aborted")
+
+    @staticmethod
+    def _count(session, condition):
+        return session.execute(select(func.count()).select_from(core.HaloProperty.__table__).where(condition)).scalar()
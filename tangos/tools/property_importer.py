@@ -4,7 +4,7 @@ import numpy as np
 
 from .. import core, parallel_tasks
 from ..log import logger
-from ..util import proxy_object, timestep_object_cache
+from ..util import bulk_insert, link_writer, proxy_object, timestep_object_cache
 from . import GenericTangosTool
 
 
@@ -30,6 +30,17 @@ class PropertyImporter(GenericTangosTool):
     def process_options(self, options):
         self.options = options
 
+    def _is_importable_value(self, name, value):
+        """Return True if the value is a number or array of numbers; otherwise log a warning (unless it is None)"""
+        if isinstance(value, numbers.Number):
+            return True
+        elif isinstance(value, np.ndarray) and np.issubdtype(value.dtype, np.number):
+            return True
+        elif value is not None:
+            logger.warning("Ignoring stat file entry key='%s' value='%s' as the value is not a number or an array of numbers",
+                        name.text, value)
+        return False
+
     def _create_property(self, name, object, value):
         """Create a single database property corresponding to the given value
 
@@ -38,17 +49,8 @@ class PropertyImporter(GenericTangosTool):
             value = value.relative_to_timestep_cache(self._object_cache).resolve(self._session)
             if value is not None:
                 return core.halo_data.HaloLink(object, value, name)
-        elif isinstance(value, numbers.Number):
+        elif self._is_importable_value(name, value):
             return core.halo_data.HaloProperty(object, name, value)
-        elif isinstance(value, np.ndarray):
-            if np.issubdtype(value.dtype, np.number):
-                return core.halo_data.HaloProperty(object, name, value)
-            else:
-                logger.warning("Ignoring stat file entry key='%s' value='%s' as the value is not a number or an array of numbers",
-                        name.text, value)
-        elif value is not None:
-            logger.warning("Ignoring stat file entry key='%s' value='%s' as the value is not a number or an array of numbers",
-                        name.text, value)
         return None
 
     def _create_properties(self, name, object, values):
@@ -69,9 +71,14 @@ class PropertyImporter(GenericTangosTool):
 
         return filter(lambda x: x is not None, objects)
 
+    _property_columns = ['halo_id', 'name_id', 'creator_id', 'deprecated']
+
     def _import_properties_for_timestep(self, ts, property_names, object_typetag):
         """Import the named properties for a specific timestep
 
+        The handler returns whole columns, which are mapped onto database objects and written using bulk inserts
+        rather than through ORM objects.
+
         :arg ts: the database timestep
         :arg property_names: list of names to import, or empty list to import all available names
         :arg object_typetag: the type tag of the objects for which properties will be imported
@@ -89,21 +96,70 @@ class PropertyImporter(GenericTangosTool):
 
         property_db_names = [core.dictionary.get_or_create_dictionary_item(self._session, name) for name in
                              property_names]
-        rows_to_store = []
-        for values in self.handler.iterate_object_properties_for_timestep(ts.extension, object_typetag, property_names):
-            if len(values)!=2+len(property_db_names):
-                raise RuntimeError(f"Incorrect length of row returned from iterate_object_properties_for_timestep. Check implementation of {type(self.handler)}.")
-            db_object = self._object_cache.resolve_from_finder_offset(values[0], object_typetag)
-            if db_object is not None:
-                for db_name, value in zip(property_db_names, values[2:]):
-                    rows_to_store+=self._create_properties(db_name, db_object, value)
 
+        columns = self.handler.read_object_properties_for_timestep(ts.extension, object_typetag, property_names)
+        if len(columns)!=2+len(property_db_names):
+            raise RuntimeError(f"Incorrect number of columns returned from read_object_properties_for_timestep. Check implementation of {type(self.handler)}.")
 
-        logger.info("Add %d properties", len(rows_to_store))
+        object_typecode = core.halo.SimulationObjectBase.object_typecode_from_tag(object_typetag)
+        object_ids = link_writer.FinderIdMapper(self._session, ts, object_typecode, use_finder_offset=True)(columns[0])
+
+        property_rows = {} # maps attribute name (e.g. data_float) -> list of (object id, name, packed value)
+        link_rows = [] # list of (object id, linked object id, name)
+        for db_name, column in zip(property_db_names, columns[2:]):
+            self._collect_rows_for_column(db_name, object_ids, column, property_rows, link_rows)
+
+        num_properties = sum(len(rows) for rows in property_rows.values())
+        logger.info("Add %d properties", num_properties + len(link_rows))
         with parallel_tasks.ExclusiveLock("add_properties"):
-            self._session.add_all(rows_to_store)
+            self._session.flush()
+            self._insert_property_rows(property_rows)
+            self._insert_link_rows(link_rows)
+            core.timestep_summary.refresh_property_counts(self._session, [ts], [n.id for n in property_db_names])
             self._session.commit()
 
+    def _collect_rows_for_column(self, db_name, object_ids, column, property_rows, link_rows):
+        """Convert a column of values into rows to be inserted, skipping objects not in the database"""
+        column = np.asarray(column)
+        found = object_ids>=0
+        if column.ndim==1 and (np.issubdtype(column.dtype, np.integer) or np.issubdtype(column.dtype, np.floating)):
+            # plain numbers can be converted in one go
+            attribute_name = 'data_int' if np.issubdtype(column.dtype, np.integer) else 'data_float'
+            property_rows.setdefault(attribute_name, []).extend(
+                zip(object_ids[found].tolist(), [db_name]*int(np.count_nonzero(found)), column[found].tolist()))
+            return
+
+        for object_id, values in zip(object_ids[found].tolist(), column[found]):
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                if isinstance(value, proxy_object.ProxyObjectBase):
+                    value = value.relative_to_timestep_cache(self._object_cache).resolve(self._session)
+                    if value is not None:
+                        link_rows.append((object_id, value.id, db_name))
+                elif self._is_importable_value(db_name, value):
+                    attribute_name, packed = core.data_attribute_mapper.pack_data_of_unknown_type(value)
+                    property_rows.setdefault(attribute_name, []).append((object_id, db_name, packed))
+
+    def _insert_property_rows(self, property_rows):
+        """Insert rows collected by _collect_rows_for_column; must be called with the database write lock held"""
+        table = core.halo_data.HaloProperty.__table__
+        creator_id = core.creator.get_creator_id()
+        connection = self._session.connection()
+        for attribute_name, rows in property_rows.items():
+            rows = [(object_id, db_name.id, creator_id, False, value) for object_id, db_name, value in rows]
+            column_names = self._property_columns + [attribute_name]
+            bulk_insert.bulk_insert(connection, table, column_names, rows)
+
+    def _insert_link_rows(self, link_rows):
+        relations = {}
+        for object_id, linked_object_id, db_name in link_rows:
+            ids_from, ids_to = relations.setdefault(db_name, ([], []))
+            ids_from.append(object_id)
+            ids_to.append(linked_object_id)
+        for db_name, (ids_from, ids_to) in relations.items():
+            link_writer.insert_links(self._session, ids_from, ids_to, 1.0, db_name)
+
     def run_calculation_loop(self):
         base_sim = core.sim_query_from_name_list(self.options.sims)
 
@@ -11,10 +11,10 @@ import sqlalchemy.exc
 import sqlalchemy.orm
 
 from .. import config, core, live_calculation, parallel_tasks, properties
-from ..cached_writer import insert_list
+from ..cached_writer import insert_list, read_lock
 from ..log import logger
 from ..parallel_tasks import accumulative_statistics
-from ..util import proxy_object, terminalcontroller, timing_monitor
+from ..util import property_profiler, proxy_object, terminalcontroller, timing_monitor
 from ..util.check_deleted import check_deleted
 from . import GenericTangosTool
 
@@ -35,6 +35,7 @@ class PropertyWriter(GenericTangosTool):
         self._loaded_timestep = None
         self._loaded_halo_id = None
         self._loaded_halo = None
+        self.profiler = None
 
     @classmethod
     def add_parser_arguments(self, parser):
@@ -86,6 +87,11 @@ class PropertyWriter(GenericTangosTool):
                             help="Specify a filter that describes which objects the calculation should be executed for. Multiple filters may be specified, in which case they must all evaluate to true for the object to be included.")
         parser.add_argument('--explain-classes', action='store_true',
                             help="Log some explanation for why property classes are selected (when there is any ambiguity)")
+        parser.add_argument('--profile', action='store', nargs='?', type=str, const='tangos_profile', default=None,
+                            metavar='PREFIX',
+                            help="Profile each property class with cProfile, summarising the results in the log and writing them to PREFIX.<class>.pstats and PREFIX.speedscope.json (default prefix: tangos_profile)")
+        parser.add_argument('--profile-allocations', action='store_true',
+                            help="When profiling, also record the peak memory allocated by each property class (using tracemalloc, which slows the calculations further)")
 
     def _create_parser_obj(self):
         parser = argparse.ArgumentParser()
@@ -337,7 +343,7 @@ class PropertyWriter(GenericTangosTool):
         if self._current_timestep_id == db_timestep.id:
             return
 
-        with parallel_tasks.lock.SharedLock("insert_list"):
+        with read_lock():
             # don't want this to happen in parallel with a database write -- seems to lazily fetch
             # rows in the background
             self._unload_timestep()
@@ -418,7 +424,11 @@ class PropertyWriter(GenericTangosTool):
         with self.timing_monitor(property_calculator):
             try:
                 with self.redirect:
-                    result = property_calculator.calculate(snapshot_data, db_data)
+                    if self.profiler is None:
+                        result = property_calculator.calculate(snapshot_data, db_data)
+                    else:
+                        result = self.profiler.runcall(property_calculator, property_calculator.calculate,
+                                                       snapshot_data, db_data)
                     self.tracker.register_success()
             except Exception as e:
                 self.tracker.register_error()
@@ -510,7 +520,7 @@ class PropertyWriter(GenericTangosTool):
         if self.options.with_prerequisites:
             self._add_prerequisites_to_calculator_instances(db_timestep)
 
-        with parallel_tasks.lock.SharedLock("insert_list"):
+        with read_lock():
             logger.debug("Start halo list query")
             db_halos = self._build_halo_list(db_timestep)
             logger.debug("End halo list query")
@@ -564,6 +574,12 @@ class PropertyWriter(GenericTangosTool):
         # since creating them is a 'barrier'-like operation
         self.timing_monitor = timing_monitor.TimingMonitor(allow_parallel=True)
         self.tracker = CalculationSuccessTracker(allow_parallel=True)
+        if self.options.profile is not None:
+            self.profiler = property_profiler.PropertyProfiler(allow_parallel=True,
+                                                               output_prefix=self.options.profile,
+                                                               track_allocations=self.options.profile_allocations)
+        else:
+            self.profiler = None
 
         parallel_tasks.database.synchronize_creator_object()
 
@@ -575,6 +591,10 @@ class PropertyWriter(GenericTangosTool):
 
         self._commit_results_if_needed(True,True)
 
+        if self.profiler is not None:
+            # in parallel runs, the aggregated profile is logged and written out by the server process at exit
+            self.profiler.report_to_log_or_server(logger)
+
 
 class CalculationSuccessTracker(accumulative_statistics.StatisticsAccumulatorBase):
     def __init__(self, allow_parallel=False):
@@ -2,10 +2,9 @@ import re
 
 from .. import config, core
 from ..core import get_or_create_dictionary_item
-from ..core.halo_data import HaloLink, HaloProperty
 from ..input_handlers import pynbody
 from ..log import logger
-from ..util import timestep_object_cache
+from ..util import link_writer, timestep_object_cache
 from . import GenericTangosTool
 
 
@@ -33,15 +32,16 @@ class SubfindTreeImporter(GenericTangosTool):
         obj_cache = timestep_object_cache.TimestepObjectCache(ts)
         obj_cache_next = timestep_object_cache.TimestepObjectCache(ts_next)
 
-        links = self._create_links(ts, obj_cache_next, d_id, "Desc")
-        links += self._create_links(ts_next, obj_cache, d_id, "Prog")
-        session.add_all(links)
+        num_links = link_writer.insert_links(session, *self._create_links(ts, obj_cache_next, "Desc"), d_id)
+        num_links += link_writer.insert_links(session, *self._create_links(ts_next, obj_cache, "Prog"), d_id)
         session.commit()
-        logger.info("%d links created between %s and %s",len(links), ts, ts_next)
+        logger.info("%d links created between %s and %s",num_links, ts, ts_next)
 
-    def _create_links(self, starting_timestep, object_cache_other_timestep, dictionary_item, subfind_link_type):
-        """Follow the SubFind linked list of descendants or progenitors"""
-        links = []
+    def _create_links(self, starting_timestep, object_cache_other_timestep, subfind_link_type):
+        """Follow the SubFind linked list of descendants or progenitors.
+
+        Returns lists of the database ids to link from and to, and the link weights."""
+        ids_from, ids_to, weights = [], [], []
         for high_z_halo in starting_timestep.halos.all():
 
             this_properties = high_z_halo.load(mode='subfind-properties')
@@ -66,11 +66,13 @@ class SubfindTreeImporter(GenericTangosTool):
 
                 ratio = min(properties_of_linked_subhalo['SubhaloMass'] / this_mass, 1.0)
 
-                links.append(HaloLink(high_z_halo, this_descendant_tangos_obj, dictionary_item, ratio))
+                ids_from.append(high_z_halo.id)
+                ids_to.append(this_descendant_tangos_obj.id)
+                weights.append(ratio)
 
                 # now move onto next descendant
                 link_to_finder_id = properties_of_linked_subhalo['Next'+subfind_link_type+'SubhaloNr']
-        return links
+        return ids_from, ids_to, weights
 
     @classmethod
     def _get_snap_id(self, filename):
@@ -1,8 +1,9 @@
 import numpy as np
 import sqlalchemy
-from sqlalchemy import delete, select
+from sqlalchemy import exists
 
 from .. import core, query
+from ..util import chunked_delete
 from . import GenericTangosTool
 
 
@@ -86,6 +87,7 @@ class TimestepThinner(GenericTangosTool):
 
             if ok:
                 session = core.get_default_session()
+                core.timestep_summary.remove(session, to_remove)
                 for ts in to_remove:
                     session.execute(
                        sqlalchemy.delete(core.TimeStep).filter(core.TimeStep.id == ts.id)
@@ -100,44 +102,30 @@ class TimestepThinner(GenericTangosTool):
         self._cleanup_orphan_properties()
 
     def _cleanup_orphan_objects(self):
-        engine = core.get_default_engine()
-        with engine.connect() as connection:
-            count = connection.execute(
-                delete(core.SimulationObjectBase).filter(
-                    ~core.SimulationObjectBase.timestep_id.in_(
-                        select(core.TimeStep.id)
-                    )
-                )
-            ).rowcount
-            connection.commit()
+        objects = core.SimulationObjectBase.__table__
+        timesteps = core.TimeStep.__table__
+        count = chunked_delete.delete_in_chunks(
+            core.get_default_engine(), objects,
+            objects.c.timestep_id.isnot(None) & ~exists().where(timesteps.c.id == objects.c.timestep_id),
+            "Removing orphan objects")
         print(f"  Removed {count} orphan objects")
 
     def _cleanup_orphan_links(self):
-        engine = core.get_default_engine()
-        with engine.connect() as connection:
-            count = connection.execute(
-                delete(core.HaloLink).filter(
-                    ~core.HaloLink.halo_to_id.in_(
-                        select(core.SimulationObjectBase.id)
-                    ) | ~core.HaloLink.halo_from_id.in_(
-                        select(core.SimulationObjectBase.id)
-                    )
-                )
-            ).rowcount
-            connection.commit()
+        links = core.HaloLink.__table__
+        objects_to = core.SimulationObjectBase.__table__.alias()
+        objects_from = core.SimulationObjectBase.__table__.alias()
+        count = chunked_delete.delete_in_chunks(
+            core.get_default_engine(), links,
+            (links.c.halo_to_id.isnot(None) & ~exists().where(objects_to.c.id == links.c.halo_to_id)) |
+            (links.c.halo_from_id.isnot(None) & ~exists().where(objects_from.c.id == links.c.halo_from_id)),
+            "Removing orphan links")
         print(f"  Removed {count} orphan links")
 
     def _cleanup_orphan_properties(self):
-        engine = core.get_default_engine()
-
-        with engine.connect() as connection:
-            count = connection.execute(
-                delete(core.HaloProperty).where(
-                    ~core.HaloProperty.halo_id.in_(
-                        select(core.SimulationObjectBase.id)
-                    )
-                )
-            ).rowcount
-            connection.commit()
-
+        properties = core.HaloProperty.__table__
+        objects = core.SimulationObjectBase.__table__
+        count = chunked_delete.delete_in_chunks(
+            core.get_default_engine(), properties,
+            properties.c.halo_id.isnot(None) & ~exists().where(objects.c.id == properties.c.halo_id),
+            "Removing orphan properties")
         print(f"  Removed {count} orphan properties")
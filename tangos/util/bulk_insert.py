@@ -0,0 +1,86 @@
+"""Fast insertion of many rows into a table, using the quickest method that the database backend supports"""
+
+import csv
+import io
+import time
+
+from ..log import logger
+
+MYSQL_ROWS_PER_STATEMENT = 1000
+
+_statistics = {}
+
+def bulk_insert(connection, table, column_names, rows):
+    """Insert many rows into a table, within the current transaction of the connection.
+
+    PostgreSQL (via psycopg2) uses COPY FROM STDIN; MySQL uses multi-row INSERT ... VALUES statements; other backends
+    (including SQLite) use a DBAPI executemany with tuple rows. This is intended for numeric data such as ids and
+    weights, but binary data (e.g. packed arrays) is also supported.
+
+    :param connection: the sqlalchemy Connection, e.g. session.connection()
+    :param table: the sqlalchemy Table to insert into
+    :param column_names: the names of the columns being populated
+    :param rows: a sequence of tuples, each with one entry per column
+    """
+    rows = list(rows)
+    if len(rows)==0:
+        return
+
+    start = time.time()
+    dialect = connection.dialect
+    if dialect.name=='postgresql' and dialect.driver=='psycopg2':
+        method = 'copy'
+        _insert_using_copy(connection, table, column_names, rows)
+    elif dialect.name=='mysql':
+        method = 'multirow_values'
+        _insert_using_multirow_values(connection, table, column_names, rows)
+    elif dialect.paramstyle in ('qmark', 'format', 'pyformat'):
+        method = 'executemany'
+        _insert_using_executemany(connection, table, column_names, rows)
+    else:
+        method = 'sqlalchemy'
+        connection.execute(table.insert(), [dict(zip(column_names, row)) for row in rows])
+    elapsed = time.time()-start
+
+    calls, num_rows, seconds = _statistics.get(method, (0, 0, 0.0))
+    _statistics[method] = (calls+1, num_rows+len(rows), seconds+elapsed)
+    logger.debug("Inserted %d rows into %s in %.3fs (%s)", len(rows), table.name, elapsed, method)
+
+def get_statistics():
+    """Return a dictionary mapping each insertion method used so far to a tuple (calls, rows, seconds)"""
+    return dict(_statistics)
+
+def reset_statistics():
+    _statistics.clear()
+
+def _quoted_names(connection, table, column_names):
+    preparer = connection.dialect.identifier_preparer
+    return preparer.format_table(table), ", ".join(preparer.quote(c) for c in column_names)
+
+def _insert_using_copy(connection, table, column_names, rows):
+    buffer = io.StringIO()
+    # None is written as an empty, unquoted field, which COPY reads as NULL; binary data uses the bytea hex format
+    csv.writer(buffer).writerows([[_bytes_to_bytea_hex(v) if isinstance(v, bytes) else v for v in row]
+                                  for row in rows])
+    buffer.seek(0)
+    table_name, columns = _quoted_names(connection, table, column_names)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def _bytes_to_bytea_hex(value):
+    return "\\x" + value.hex()
+
+def _insert_using_multirow_values(connection, table, column_names, rows):
+    for i in range(0, len(rows), MYSQL_ROWS_PER_STATEMENT):
+        connection.execute(table.insert().values([dict(zip(column_names, row))
+                                                  for row in rows[i:i+MYSQL_ROWS_PER_STATEMENT]]))
+
+def _insert_using_executemany(connection, table, column_names, rows):
+    placeholder = "?" if connection.dialect.paramstyle=='qmark' else "%s"
+    table_name, columns = _quoted_names(connection, table, column_names)
+    placeholders = ", ".join([placeholder]*len(column_names))
+    connection.exec_driver_sql(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
+                               [tuple(row) for row in rows])
@@ -0,0 +1,56 @@
+"""Deletion of large numbers of rows in bounded batches.
+
+A single DELETE over a large table can hold locks for hours and build up an enormous transaction. Instead, the rows
+to delete are found a batch at a time by a read-only query in primary key order, then deleted by primary key and
+committed. Each batch is therefore a short transaction, and an interrupted deletion loses at most one batch: running
+it again simply continues, since the completed batches have already been committed."""
+
+import sqlalchemy
+import tqdm
+from sqlalchemy import delete, select
+
+from .. import config
+
+
+def delete_in_chunks(engine, table, condition, description="Deleting", chunk_size=None, start_after_id=None):
+    """Delete the rows of a table that match a condition, committing after each batch.
+
+    :param engine: the sqlalchemy Engine for the database
+    :param table: the Table to delete from, which must have a single integer primary key column
+    :param condition: a sqlalchemy expression selecting the rows to delete. Conditions involving other tables (or
+                      other rows of the same table) should be correlated subqueries such as ~exists(...), which the
+                      database can execute as anti-joins, rather than NOT IN (...) subqueries.
+    :param description: label for the progress bar
+    :param chunk_size: the maximum number of rows deleted in each transaction; defaults to config.DELETE_CHUNK_SIZE
+    :param start_after_id: if specified, only consider rows with primary key greater than this
+    :return: the number of rows deleted
+    """
+    if chunk_size is None:
+        chunk_size = config.DELETE_CHUNK_SIZE
+
+    primary_key, = table.primary_key.columns
+    num_deleted = 0
+    last_id = start_after_id
+
+    with engine.connect() as connection, tqdm.tqdm(desc=description, unit="row") as pbar:
+        try:
+            while True:
+                query = select(primary_key).where(condition)
+                if last_id is not None:
+                    query = query.where(primary_key > last_id)
+                ids = connection.execute(query.order_by(primary_key).limit(chunk_size)).scalars().all()
+                if len(ids)==0:
+                    break
+
+                connection.execute(delete(table).where(primary_key.in_(ids)))
+                connection.commit()
+
+                last_id = ids[-1]
+                num_deleted += len(ids)
+                pbar.update(len(ids))
+        except (KeyboardInterrupt, sqlalchemy.exc.SQLAlchemyError):
+            print(f"Interrupted after deleting {num_deleted} rows from {table.name}. The deletion can be resumed by "
+                  f"running the same command again.")
+            raise
+
+    return num_deleted
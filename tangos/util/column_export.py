@@ -0,0 +1,324 @@
+"""Columnar export of the stored properties of each timestep, for fast read-back without SQL.
+
+Each timestep is written to its own directory, ``<export path>/<simulation basename>/<escaped extension>``. The
+directory holds a header.json describing the table, one .npy file per index column (the database id, halo number,
+finder id and object typecode of every object in the timestep, in database id order) and one or more .npy files per
+exported property:
+
+* scalar properties are stored as a single 1D array;
+* array properties of the same shape for every object are stored as a fixed-size block of shape (n_objects, ...);
+* 1D array properties of varying lengths are stored as a ragged block: a flat array of all values, together with an
+  array of n_objects+1 offsets such that the values for object i are values[offsets[i]:offsets[i+1]].
+
+Where some objects do not have a property, a boolean mask of the objects that do is stored alongside. Plain .npy files
+are used (rather than e.g. Parquet or HDF5) so that every column can be memory-mapped with numpy alone.
+
+The header records a fingerprint of the timestep at the time of export, made from the write counter that tangos
+increments whenever it writes, overwrites or deletes properties or objects in the timestep (see
+core.timestep_summary.record_writes). Checking the fingerprint takes a couple of cheap queries, so that stale exports
+are not used by TimeStep.calculate_all (see config.use_column_export). Changes made to the database other than through
+tangos are not detected; such an export must be rewritten by hand (with ``tangos export-columns``)."""
+
+import json
+import numbers
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .. import config, core
+from ..log import logger
+
+EXPORT_FORMAT_VERSION = 1
+
+_index_columns = ['dbid', 'halo_number', 'finder_id', 'object_typecode']
+
+
+def get_export_path():
+    """Return the root folder for column exports, as set by config.column_export_path"""
+    if config.column_export_path is None:
+        return os.path.join(config.base, ".tangos-columns")
+    else:
+        return config.column_export_path
+
+def timestep_export_path(timestep, export_path=None):
+    """Return the folder in which the column export for the given timestep is (or would be) stored"""
+    if export_path is None:
+        export_path = get_export_path()
+    return os.path.join(export_path, timestep.simulation.basename, timestep.escaped_extension)
+
+def timestep_fingerprint(session, timestep):
+    """Return a summary of the timestep which changes whenever tangos adds, deletes, deprecates or overwrites its
+    objects or properties, or None if the database does not have the write counters (see core.migrations).
+
+    This consists of the timestep's write counter together with the number of objects and their maximum id. It is
+    intended to be cheap enough to check every time an export is read."""
+    write_count = core.timestep_summary.get_write_count(session, timestep)
+    if write_count is None:
+        return None
+    SimulationObjectBase = core.halo.SimulationObjectBase
+    objects = session.execute(
+        select(func.count(SimulationObjectBase.id), func.max(SimulationObjectBase.id)).
+        where(SimulationObjectBase.timestep_id == timestep.id)).one()
+    return [int(write_count)] + [int(x) if x is not None else 0 for x in objects]
+
+
+class RaggedColumn:
+    """A column of 1D arrays of varying lengths, stored as flat values and offsets"""
+
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class ColumnTable:
+    """Read-back of the column export for a single timestep.
+
+    Index columns (dbid, halo_number, finder_id, object_typecode) are available as attributes, and properties by
+    indexing with their name. All columns are memory-mapped, so that only the parts used are read from disk."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            self.header = json.load(f)
+        if self.header['version'] != EXPORT_FORMAT_VERSION:
+            raise ValueError("Column export at %s has an unsupported format version" % path)
+        for name in _index_columns:
+            setattr(self, name, self._load(name))
+
+    def _load(self, filename):
+        return np.load(os.path.join(self.path, filename + ".npy"), mmap_mode='r')
+
+    def __len__(self):
+        return self.header['n_objects']
+
+    def __contains__(self, name):
+        return name in self.header['columns']
+
+    def keys(self):
+        return list(self.header['columns'].keys())
+
+    @property
+    def fingerprint(self):
+        return self.header['fingerprint']
+
+    def is_current(self, session, timestep):
+        """Return True if the timestep has not been written to since the export was written"""
+        fingerprint = timestep_fingerprint(session, timestep)
+        return fingerprint is not None and self.fingerprint == fingerprint
+
+    def __getitem__(self, name):
+        """Return the named property column: a numpy array, or a RaggedColumn for arrays of varying lengths.
+
+        Entries for objects that do not have the property are zero (or empty); see mask."""
+        column = self.header['columns'][name]
+        if column['kind'] == 'ragged':
+            return RaggedColumn(self._load(column['file']), self._load(column['file'] + ".offsets"))
+        else:
+            return self._load(column['file'])
+
+    def mask(self, name):
+        """Return a boolean array which is True for objects that have the named property"""
+        column = self.header['columns'][name]
+        if column['masked']:
+            return self._load(column['file'] + ".mask")
+        else:
+            return np.ones(len(self), dtype=bool)
+
+
+def open_timestep(timestep, export_path=None):
+    """Return a ColumnTable for the given timestep, or None if it has not been exported"""
+    path = timestep_export_path(timestep, export_path)
+    if not os.path.exists(os.path.join(path, "header.json")):
+        return None
+    return ColumnTable(path)
+
+
+def _classify_values(values, present):
+    """Return (kind, arrays) describing how to store a column of values, or (None, None) if it cannot be stored.
+
+    arrays is a dictionary mapping filename suffixes onto the arrays to write."""
+    present_values = [v for v, p in zip(values, present) if p]
+    if len(present_values)==0:
+        return None, None
+
+    if all(isinstance(v, numbers.Number) for v in present_values):
+        dtype = np.asarray(present_values).dtype
+        if dtype == object:
+            return None, None
+        data = np.zeros(len(values), dtype=dtype)
+        data[present] = present_values
+        return 'scalar', {"": data}
+
+    if not all(isinstance(v, np.ndarray) and np.issubdtype(v.dtype, np.number) for v in present_values):
+        return None, None
+
+    dtype = np.result_type(*{v.dtype for v in present_values})
+    shape = present_values[0].shape
+    if all(v.shape == shape for v in present_values):
+        data = np.zeros((len(values),) + shape, dtype=dtype)
+        data[present] = present_values
+        return 'fixed', {"": data}
+    elif all(v.ndim == 1 for v in present_values):
+        lengths = np.zeros(len(values), dtype=np.int64)
+        lengths[present] = [len(v) for v in present_values]
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        return 'ragged', {"": np.concatenate(present_values).astype(dtype), ".offsets": offsets}
+    else:
+        return None, None
+
+def export_timestep(session, timestep, export_path=None, property_names=None):
+    """Write the column export for a timestep, replacing any existing export.
+
+    :param session: the sqlalchemy session
+    :param timestep: the TimeStep to export
+    :param export_path: the root folder for exports; defaults to get_export_path()
+    :param property_names: the names of the properties to export; by default, all properties stored for the timestep
+    :return: the list of names of the properties that were exported
+    """
+    SimulationObjectBase = core.halo.SimulationObjectBase
+
+    fingerprint = timestep_fingerprint(session, timestep)
+    if property_names is None:
+        property_names = sorted(core.timestep_summary.get_property_counts(session, timestep).keys())
+
+    index = np.array(session.execute(select(SimulationObjectBase.id, SimulationObjectBase.halo_number,
+                                            SimulationObjectBase.finder_id, SimulationObjectBase.object_typecode).
+                                     where(SimulationObjectBase.timestep_id == timestep.id).
+                                     order_by(SimulationObjectBase.id)).all(), dtype=np.int64).reshape((-1, 4))
+    dbids = index[:,0]
+
+    columns = {}
+    arrays = {name: index[:,i] for i, name in enumerate(_index_columns)}
+
+    if len(property_names)>0 and len(dbids)>0:
+        for name in property_names:
+            # each property is gathered separately, since a combined query only returns values for objects that have
+            # every one of the properties
+            result_dbids, result_values = timestep.calculate_all("dbid()", name, sanitize=False,
+                                                                 use_column_export=False)
+            values = np.empty(len(dbids), dtype=object)
+            values[np.searchsorted(dbids, np.asarray(result_dbids, dtype=np.int64))] = result_values
+            present = np.array([v is not None for v in values], dtype=bool)
+            kind, column_arrays = _classify_values(values, present)
+            if kind is None:
+                logger.warning("Not exporting property %r for %r, as its values are not numbers or arrays of numbers",
+                               name, timestep)
+                continue
+            filename = str(len(columns))
+            masked = not present.all()
+            columns[name] = {'kind': kind, 'file': filename, 'masked': masked}
+            for suffix, array in column_arrays.items():
+                arrays[filename + suffix] = array
+            if masked:
+                arrays[filename + ".mask"] = present
+
+    header = {'version': EXPORT_FORMAT_VERSION, 'simulation': timestep.simulation.basename,
+              'timestep': timestep.extension, 'n_objects': len(dbids), 'fingerprint': fingerprint,
+              'columns': columns}
+
+    path = timestep_export_path(timestep, export_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write into a temporary directory which is then renamed into place, so that readers never see an incomplete
+    # export
+    temp_path = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".")
+    try:
+        for filename, array in arrays.items():
+            np.save(os.path.join(temp_path, filename + ".npy"), array)
+        with open(os.path.join(temp_path, "header.json"), "w") as f:
+            json.dump(header, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(temp_path, path)
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+    return list(columns.keys())
+
+
+def stored_property_names(calculation):
+    """Return the property names retrieved by a calculation if it consists only of plain stored properties, or None"""
+    from .. import live_calculation
+    if isinstance(calculation, live_calculation.MultiCalculation):
+        calculations = calculation.calculations
+    else:
+        calculations = [calculation]
+    if all(type(c) is live_calculation.StoredProperty for c in calculations):
+        return [c.name() for c in calculations]
+    else:
+        return None
+
+def calculate_all_from_export(timestep, names, object_typecode=None, limit=None, sanitize=True,
+                              order_by_halo_number=False):
+    """Return the named stored properties for all objects in a timestep from its column export, in the format
+    returned by TimeStep.calculate_all.
+
+    Returns None if the export does not exist, is out of date, or does not include all the named properties, in which
+    case the caller should fall back to querying the database."""
+    from .. import live_calculation
+
+    try:
+        table = open_timestep(timestep)
+    except (OSError, ValueError):
+        logger.warning("Column export for %r could not be read", timestep)
+        return None
+
+    if table is None or not all(name in table for name in names):
+        return None
+
+    session = Session.object_session(timestep)
+    if not table.is_current(session, timestep):
+        logger.info("Column export for %r is out of date; reading from the database instead", timestep)
+        return None
+
+    if object_typecode is not None:
+        rows = np.where(table.object_typecode == object_typecode)[0]
+    else:
+        rows = np.arange(len(table))
+    if order_by_halo_number:
+        rows = rows[np.argsort(table.halo_number[rows], kind='stable')]
+    if limit:
+        rows = rows[:limit]
+
+    masks = [table.mask(name)[rows] for name in names]
+
+    if not sanitize:
+        results = np.empty((len(names), len(rows)), dtype=object)
+        for i, name in enumerate(names):
+            column = table[name]
+            if isinstance(column, RaggedColumn):
+                values = [np.array(column[r]) for r in rows]
+            elif column.ndim==1:
+                values = column[rows].tolist()
+            else:
+                values = list(np.array(column[rows]))
+            for j, (value, present) in enumerate(zip(values, masks[i])):
+                results[i, j] = value if present else None
+        return results
+
+    rows = rows[np.all(masks, axis=0)]
+    results = []
+    for name in names:
+        column = table[name]
+        if isinstance(column, RaggedColumn):
+            values = np.empty(len(rows), dtype=object)
+            values[:] = [np.asarray(column[r]) for r in rows]
+            results.append(live_calculation.Calculation._make_numpy_array(values))
+        elif len(rows)>0 and np.all(np.diff(rows)==1):
+            # a contiguous run of objects (e.g. all objects of one type) can be returned as a memory-mapped view
+            results.append(column[rows[0]:rows[-1]+1])
+        else:
+            results.append(column[rows])
+    return results
@@ -6,19 +6,22 @@ from ..log import logger
 def explain_query(query, engine_or_connection=None):
     """Get the underlying SQL engine to explain how it will execute a given query. For debugging purposes.
 
-    If engine_or_connection is None, use the query's existing engine"""
+    If engine_or_connection is None, use the query's existing engine
+
+    The explanation is logged, and also returned as a list of rows (each a tuple of strings)"""
 
     if engine_or_connection is None:
         engine_or_connection = query.session.connection()
 
     if isinstance(engine_or_connection, sqlalchemy.engine.Engine):
         with engine_or_connection.connect() as connection:
-            _explain_query_using_connection(query, connection)
+            return _explain_query_using_connection(query, connection)
     else:
-        _explain_query_using_connection(query, engine_or_connection)
+        return _explain_query_using_connection(query, engine_or_connection)
 
 def _explain_query_using_connection(query, connection):
-    compiled_q = query.statement.compile(compile_kwargs={"literal_binds": True})
+    statement = getattr(query, "statement", query)
+    compiled_q = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
     # use self._connection.execute("explain "+str(compiled_q)) to get explanation, then print it:
 
     from sqlalchemy.sql import text
@@ -29,15 +32,21 @@ def _explain_query_using_connection(query, connection):
         explain_command = "explain analyze "
 
     explain_result = connection.execute(text(explain_command + str(compiled_q)))
-
-    from prettytable import from_db_cursor
-
+    columns = list(explain_result.keys())
+    rows = [tuple(str(x) for x in row) for row in explain_result]
 
     logger.info("Analysis of query:")
     logger.info(compiled_q)
 
-    pt = from_db_cursor(explain_result.cursor)
-    pt.align = "l"
-
+    try:
+        import prettytable
+    except ImportError:
+        for row in rows:
+            logger.info(" | ".join(row))
+    else:
+        pt = prettytable.PrettyTable(columns)
+        pt.add_rows(rows)
+        pt.align = "l"
+        logger.info(pt)
 
-    logger.info(pt)
+    return rows
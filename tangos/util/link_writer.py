@@ -0,0 +1,83 @@
+"""Fast creation of many HaloLinks at once, without constructing ORM objects.
+
+Linkers and merger tree importers produce arrays of (finder_id_from, finder_id_to, weight). These are mapped onto
+database ids using a single (finder_id, id) query per timestep, and then inserted using bulk_insert."""
+
+import numpy as np
+
+from .. import core
+from . import bulk_insert
+
+_link_columns = ['halo_from_id', 'halo_to_id', 'weight', 'relation_id', 'creator_id']
+
+class FinderIdMapper:
+    """Maps finder ids (or, if use_finder_offset is True, finder offsets) of objects in one timestep onto their
+    database ids"""
+
+    def __init__(self, session, timestep, object_typecode=0, use_finder_offset=False):
+        SimulationObjectBase = core.halo.SimulationObjectBase
+        key_column = SimulationObjectBase.finder_offset if use_finder_offset else SimulationObjectBase.finder_id
+        query = session.query(key_column, SimulationObjectBase.id).\
+            filter(SimulationObjectBase.timestep_id == timestep.id, key_column.isnot(None))
+        if object_typecode is not None:
+            query = query.filter(SimulationObjectBase.object_typecode == object_typecode)
+
+        finder_ids_and_ids = np.array(query.all(), dtype=np.int64).reshape((-1, 2))
+        order = np.argsort(finder_ids_and_ids[:,0], kind='stable')
+        self._finder_ids = finder_ids_and_ids[order,0]
+        self._ids = finder_ids_and_ids[order,1]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __call__(self, finder_ids):
+        """Return the database ids for the given finder ids, or -1 where no such object exists"""
+        finder_ids = np.asarray(finder_ids, dtype=np.int64)
+        result = np.full(finder_ids.shape, -1, dtype=np.int64)
+        if len(self._finder_ids)==0:
+            return result
+        position = np.minimum(np.searchsorted(self._finder_ids, finder_ids), len(self._finder_ids)-1)
+        found = self._finder_ids[position] == finder_ids
+        result[found] = self._ids[position[found]]
+        return result
+
+def insert_links(session, ids_from, ids_to, weights, relation):
+    """Insert a HaloLink for each (ids_from, ids_to, weight), skipping any where either database id is negative.
+
+    Must be called with the database write lock held, if running in parallel. The caller is responsible for
+    committing the transaction.
+
+    :param session: the sqlalchemy session
+    :param ids_from: database ids of the objects to link from
+    :param ids_to: database ids of the objects to link to
+    :param weights: the weight of each link, or a single number to use for all links
+    :param relation: the DictionaryItem naming the relationship
+    :return: the number of links inserted
+    """
+    ids_from = np.asarray(ids_from, dtype=np.int64)
+    ids_to = np.asarray(ids_to, dtype=np.int64)
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), ids_from.shape)
+
+    valid = (ids_from >= 0) & (ids_to >= 0)
+    num_links = int(np.count_nonzero(valid))
+    if num_links==0:
+        return 0
+
+    if relation.id is None:
+        session.flush()
+
+    rows = zip(ids_from[valid].tolist(), ids_to[valid].tolist(), weights[valid].tolist(),
+               [relation.id]*num_links, [core.creator.get_creator_id()]*num_links)
+    bulk_insert.bulk_insert(session.connection(), core.halo_data.HaloLink.__table__, _link_columns, rows)
+    return num_links
+
+def insert_links_by_finder_id(session, mapper_from, mapper_to, finder_ids_from, finder_ids_to, weights, relation):
+    """Map finder ids onto database ids using FinderIdMapper objects, then insert links as for insert_links.
+
+    :return: a tuple of the number of links inserted, and the number skipped because either object is not in the
+             database
+    """
+    ids_from = mapper_from(finder_ids_from)
+    ids_to = mapper_to(finder_ids_to)
+    num_links = insert_links(session, ids_from, ids_to, weights, relation)
+    return num_links, len(ids_from) - num_links
@@ -0,0 +1,175 @@
+import cProfile
+import json
+import marshal
+import pstats
+import tracemalloc
+
+from ..parallel_tasks import accumulative_statistics
+
+
+class PropertyProfiler(accumulative_statistics.StatisticsAccumulatorBase):
+    """This class collects cProfile statistics (and optionally the peak memory allocated, using tracemalloc) for each
+    Property class being evaluated. The statistics are summarised in the log, and written out to files that can be
+    inspected with the pstats module, snakeviz, or speedscope."""
+
+    # Functions contributing less than this fraction of a class's total time are omitted from speedscope stacks
+    SPEEDSCOPE_MINIMUM_FRACTION = 1e-4
+
+    # Maximum depth of the stacks reconstructed for speedscope
+    SPEEDSCOPE_MAXIMUM_DEPTH = 100
+
+    def __init__(self, allow_parallel=False, output_prefix=None, track_allocations=False, num_functions=5):
+        self._output_prefix = output_prefix
+        self._track_allocations = track_allocations
+        self._num_functions = num_functions
+        self.reset()
+        super().__init__(allow_parallel=allow_parallel,
+                         accumulator_init_kwargs={'output_prefix': output_prefix,
+                                                  'track_allocations': track_allocations,
+                                                  'num_functions': num_functions})
+
+    def runcall(self, object, function, *args, **kwargs):
+        """Call function(*args, **kwargs), adding its profile to the statistics for the class of object"""
+        cl = object if isinstance(object, type) else type(object)
+        if self._track_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            allocated_at_start = self._reset_allocation_peak()
+
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function, *args, **kwargs)
+        finally:
+            peak = tracemalloc.get_traced_memory()[1] - allocated_at_start if self._track_allocations else 0
+            self._add_run_to_running_totals(cl, pstats.Stats(profile).stats, 1, peak)
+
+    @staticmethod
+    def _reset_allocation_peak():
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # python < 3.9: restarting is the only way to reset the peak
+            tracemalloc.stop()
+            tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+
+    def reset(self):
+        self.stats_by_class = {}
+        self.calls_by_class = {}
+        self.peak_allocation_by_class = {}
+
+    def _add_run_to_running_totals(self, cl, stats, num_calls, peak_allocation):
+        accumulated = self.stats_by_class.setdefault(cl, {})
+        for func, stat in stats.items():
+            if func in accumulated:
+                accumulated[func] = pstats.add_func_stats(accumulated[func], stat)
+            else:
+                accumulated[func] = stat
+        self.calls_by_class[cl] = self.calls_by_class.get(cl, 0) + num_calls
+        self.peak_allocation_by_class[cl] = max(self.peak_allocation_by_class.get(cl, 0), peak_allocation)
+
+    def add(self, other):
+        """Add the profiles collected by another PropertyProfiler to this one"""
+        for cl in other.stats_by_class.keys():
+            self._add_run_to_running_totals(cl, other.stats_by_class[cl], other.calls_by_class[cl],
+                                            other.peak_allocation_by_class[cl])
+
+    @classmethod
+    def format_bytes(cls, num_bytes):
+        """Returns a formatted size, e.g. 1234 -> 1.2kB, 12345678 -> 12.3MB"""
+        for unit in ["B", "kB", "MB"]:
+            if num_bytes < 1000:
+                return f"{num_bytes:.1f}{unit}" if unit != "B" else f"{num_bytes}B"
+            num_bytes /= 1000
+        return f"{num_bytes:.1f}GB"
+
+    @staticmethod
+    def _class_name(cl):
+        return f"{cl.__module__}.{cl.__qualname__}"
+
+    @staticmethod
+    def _total_time(stats):
+        return sum(stat[2] for stat in stats.values())
+
+    def report_to_log(self, logger):
+        if len(self.stats_by_class) == 0:
+            return
+        logger.info("")
+        logger.info("PROFILE OF PROPERTY CALCULATIONS, summed over all processes, if applicable")
+        for cl, stats in self.stats_by_class.items():
+            summary = f" {cl.__qualname__}: {self.calls_by_class[cl]} calls, {self._total_time(stats):.2f}s"
+            if self._track_allocations:
+                summary += f", peak allocation {self.format_bytes(self.peak_allocation_by_class[cl])}"
+            logger.info(summary)
+            by_cumulative_time = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+            for func, (cc, nc, tt, ct, callers) in by_cumulative_time[:self._num_functions]:
+                logger.info(f"   {ct:10.3f}s {tt:10.3f}s {nc:>9d}  {pstats.func_std_string(func)}")
+        if self._output_prefix is not None:
+            self.write_files(self._output_prefix)
+            logger.info(f" Full profiles written to {self._output_prefix}.*.pstats and "
+                        f"{self._output_prefix}.speedscope.json")
+        logger.info("")
+
+    def write_files(self, prefix):
+        """Write a pstats file for each Property class, named prefix.<class name>.pstats, and a single speedscope file
+        named prefix.speedscope.json containing a profile for each Property class"""
+        for cl, stats in self.stats_by_class.items():
+            with open(f"{prefix}.{self._class_name(cl)}.pstats", "wb") as f:
+                marshal.dump(stats, f)
+
+        with open(f"{prefix}.speedscope.json", "w") as f:
+            json.dump(self.to_speedscope(), f)
+
+    def to_speedscope(self):
+        """Return the profiles in speedscope's file format.
+
+        cProfile records only the time spent in each function per caller, not complete stacks. Stacks are therefore
+        reconstructed by dividing the time spent in each function between its callers in proportion to the time
+        recorded for each caller."""
+        frames = []
+        frame_index = {}
+        profiles = []
+
+        for cl, stats in self.stats_by_class.items():
+            samples = []
+            weights = []
+            callees = {}
+            for func, (cc, nc, tt, ct, callers) in stats.items():
+                for caller, caller_stat in callers.items():
+                    callees.setdefault(caller, []).append((func, caller_stat[3]))
+            roots = [func for func, stat in stats.items() if not any(caller in stats for caller in stat[4])]
+            minimum_weight = self.SPEEDSCOPE_MINIMUM_FRACTION * self._total_time(stats)
+
+            def visit(func, stack, fraction):
+                if func not in frame_index:
+                    frame_index[func] = len(frames)
+                    frames.append({'name': func[2], 'file': func[0], 'line': func[1]})
+                stack = stack + [frame_index[func]]
+                self_time = stats[func][2] * fraction
+                if self_time > minimum_weight:
+                    samples.append(stack)
+                    weights.append(self_time)
+                if len(stack) >= self.SPEEDSCOPE_MAXIMUM_DEPTH:
+                    return
+                for callee, time_from_this_caller in callees.get(func, []):
+                    callee_total_time = stats[callee][3]
+                    if frame_index.get(callee) in stack or callee_total_time <= 0:
+                        continue # recursive call, already accounted for in the cumulative time of the caller
+                    callee_fraction = fraction * time_from_this_caller / callee_total_time
+                    if callee_total_time * callee_fraction > minimum_weight:
+                        visit(callee, stack, callee_fraction)
+
+            for root in roots:
+                visit(root, [], 1.0)
+
+            profiles.append({'type': 'sampled', 'name': self._class_name(cl), 'unit': 'seconds',
+                             'startValue': 0, 'endValue': sum(weights), 'samples': samples, 'weights': weights})
+
+        return {'$schema': 'https://www.speedscope.app/file-format-schema.json',
+                'shared': {'frames': frames},
+                'profiles': profiles,
+                'name': 'tangos property calculations',
+                'exporter': 'tangos'}
+
+    def __eq__(self, other):
+        return type(other) == type(self) and self.calls_by_class == other.calls_by_class
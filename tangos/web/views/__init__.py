@@ -4,10 +4,10 @@ import tangos
 
 
 def halo_from_request(request):
-    ts = timestep_from_request(request)
+    path = "/".join([request.matchdict['simid'], request.matchdict['timestepid'], request.matchdict['halonumber']])
     try:
-        halo = ts[request.matchdict['halonumber']]
-    except (KeyError, ValueError):
+        halo = tangos.get_object(path, request.dbsession)
+    except (RuntimeError, KeyError, ValueError):
         raise exc.HTTPNotFound()
     if halo is None:
         raise exc.HTTPNotFound()
@@ -1,7 +1,6 @@
 import socket
 
 from pyramid.view import view_config
-from sqlalchemy import func
 
 import tangos
 from tangos import core
@@ -19,17 +18,12 @@ def simulation_view(request):
 
     timesteps = session.query(tangos.core.TimeStep).filter_by(simulation_id=sim.id).\
         order_by(tangos.core.timestep.TimeStep.time_gyr.desc()).all()
-    counts = session.query(func.count(core.SimulationObjectBase.id)).\
-        join(core.TimeStep).\
-        filter(core.TimeStep.simulation_id==sim.id).\
-        group_by(core.TimeStep.id). \
-        order_by(tangos.core.timestep.TimeStep.time_gyr.desc()).\
-        all()
+    counts_by_timestep = core.timestep_summary.get_object_counts_for_timesteps(session, timesteps)
 
     timestep_links = [request.route_url('timestep_view',simid=sim.escaped_basename,timestepid=timestep.escaped_extension)
                       for timestep in timesteps]
 
-    counts = [c[0] for c in counts]
+    counts = [sum(counts_by_timestep[timestep.id].values()) for timestep in timesteps]
 
     simname = sim.basename
 
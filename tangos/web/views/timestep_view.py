@@ -14,6 +14,8 @@ def timestep_view(request):
 
     all_objects = []
 
+    object_counts = core.timestep_summary.get_object_counts(request.dbsession, ts)
+
     typecode = 0
     while True:
         try:
@@ -21,8 +23,7 @@ def timestep_view(request):
         except ValueError:
             break
 
-        n_objects = request.dbsession.query(core.SimulationObjectBase).\
-            filter_by(timestep_id=ts.id, object_typecode=typecode).order_by(core.SimulationObjectBase.halo_number).count()
+        n_objects = object_counts.get(typecode, 0)
 
         title = core.SimulationObjectBase.class_from_tag(typetag).__name__+"s"
 
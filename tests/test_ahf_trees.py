@@ -7,9 +7,17 @@ import pynbody
 import tangos
 import tangos.input_handlers.pynbody
 from tangos import input_handlers, log, parallel_tasks, testing, tools
+from tangos.input_handlers import ahf_trees
 
 
+def _remove_mtree_sidecar():
+    sidecar = os.path.join(os.path.dirname(__file__), "test_simulations", "test_ahf_merger_tree",
+                           "tiny.000832.z1.512.AHF_mtree.tangos.npz")
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+
 def setup_module():
+    _remove_mtree_sidecar()
 
     testing.init_blank_db_for_testing()
     tangos.config.base = os.path.join(os.path.dirname(__file__), "test_simulations")
@@ -20,6 +28,7 @@ def setup_module():
 
 def teardown_module():
     tangos.core.close_db()
+    _remove_mtree_sidecar()
 
 def test_property_import():
     importer = tools.property_importer.PropertyImporter()
@@ -47,3 +56,20 @@ def test_ahf_merger_tree_import():
     assert tangos.get_halo("%/%640/halo_7").next == tangos.get_halo("%/%832/halo_1")
 
     assert tangos.get_halo("%/%832/halo_1").previous == tangos.get_halo("%/%640/halo_1")
+
+def test_ahf_merger_tree_sidecar(monkeypatch):
+    ts = tangos.get_timestep("test_ahf_merger_tree/tiny.000832")
+    path = os.path.join(tangos.config.base, "test_ahf_merger_tree")
+    links = ahf_trees.AHFTree(path, ts).get_links_for_snapshot()
+    assert os.path.exists(ahf_trees.AHFTree(path, ts)._sidecar_path)
+
+    def fail(self):
+        raise AssertionError("The text file should not be parsed when the sidecar is present")
+    monkeypatch.setattr(ahf_trees.AHFTree, "_load_mtree_file_standard", fail)
+    monkeypatch.setattr(ahf_trees.AHFTree, "_load_mtree_file_cropped", fail)
+    links_from_sidecar = ahf_trees.AHFTree(path, ts).get_links_for_snapshot()
+
+    assert len(links) == 11
+    assert links == links_from_sidecar
+    assert links[0][0] == 0 and links[0][1][0] == 0
+    npt.assert_allclose(links[0][1][1], 1040.**2/(1600*1100))
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import numpy.testing as npt
+import pytest
+from pytest import fixture
+from sqlalchemy import select, text
+
+import tangos
+from tangos import async_query, core, testing
+from tangos.relation_finding import tree
+from tangos.testing import simulation_generator
+
+
+@fixture
+def fresh_database():
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+    for ts in range(1, 4):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(5)
+        generator.add_properties_to_halos(Mvir=lambda i: 10.0*i*ts)
+        if ts>1:
+            generator.link_last_halos()
+    core.get_default_session().commit()
+    yield
+    core.close_db()
+
+
+def test_get_object(fresh_database):
+    halo = asyncio.run(async_query.get_object("sim/ts2/3"))
+    assert halo is tangos.get_object("sim/ts2/3")
+    assert halo.timestep.extension == "ts2" # lazy loads work in the default session
+
+def test_concurrent_calculate_all(fresh_database):
+    timesteps = tangos.get_simulation("sim").timesteps
+
+    async def calculate():
+        return await asyncio.gather(*[async_query.calculate_all(ts, "Mvir", "later(1)", sanitize=False)
+                                      for ts in timesteps])
+
+    results = asyncio.run(calculate())
+    for ts, (Mvir, later) in zip(timesteps, results):
+        expected_Mvir, expected_later = ts.calculate_all("Mvir", "later(1)", sanitize=False)
+        assert list(Mvir) == list(expected_Mvir)
+        # linked objects are transferred into the default session
+        assert all(a is b for a, b in zip(later, expected_later))
+
+    Mvir, = asyncio.run(async_query.calculate_all("sim/ts2", "Mvir"))
+    npt.assert_allclose(Mvir, [20., 40., 60., 80., 100.])
+
+def test_calculate_for_progenitors(fresh_database):
+    halo = tangos.get_object("sim/ts3/2")
+    Mvir, = asyncio.run(async_query.calculate_for_progenitors(halo, "Mvir"))
+    npt.assert_allclose(Mvir, halo.calculate_for_progenitors("Mvir")[0])
+    Mvir, = asyncio.run(async_query.calculate_for_descendants("sim/ts1/2", "Mvir"))
+    npt.assert_allclose(Mvir, [20., 40., 60.])
+
+def test_merger_tree(fresh_database):
+    halo = tangos.get_object("sim/ts3/1")
+    async_tree = asyncio.run(async_query.construct_merger_tree(tree.MergerTree(halo)))
+    assert async_tree.base_halo is halo
+    sync_tree = tree.MergerTree(halo)
+    sync_tree.construct()
+    assert async_tree.summarise() == sync_tree.summarise()
+
+def test_concurrency_limit(fresh_database):
+    runner = async_query.AsyncQueryRunner(max_concurrency=2)
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def slow_query(session, i):
+        with lock:
+            running.append(i)
+            max_running.append(len(running))
+        session.execute(select(core.TimeStep)).all()
+        time.sleep(0.05)
+        with lock:
+            running.remove(i)
+        return i
+
+    async def run_all():
+        return await asyncio.gather(*[runner.run(slow_query, i) for i in range(8)])
+
+    try:
+        assert asyncio.run(run_all()) == list(range(8))
+    finally:
+        runner.shutdown()
+    assert max(max_running) == 2
+
+def test_cancellation(fresh_database):
+    num_queries = []
+
+    def endless_queries(session):
+        while True:
+            session.execute(select(core.TimeStep)).all()
+            num_queries.append(1)
+            time.sleep(0.01)
+
+    async def run_and_cancel():
+        task = asyncio.ensure_future(async_query.run(endless_queries))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run_and_cancel())
+    # the worker has stopped by the time the cancellation completes
+    queries_after_cancellation = len(num_queries)
+    time.sleep(0.05)
+    assert len(num_queries) == queries_after_cancellation > 0
+
+def test_cancellation_interrupts_statement(fresh_database):
+    if testing.testing_db_backend != "sqlite":
+        pytest.skip("Interrupting a statement is only tested on SQLite")
+
+    def long_statement(session):
+        return session.execute(text("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c) "
+                                    "SELECT count(*) FROM c")).scalar()
+
+    async def run_with_timeout():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(async_query.run(long_statement), 0.2)
+        # the worker is free for another query
+        return await asyncio.wait_for(async_query.get_object("sim/ts1/1"), 5.0)
+
+    start = time.time()
+    assert asyncio.run(run_with_timeout()).halo_number == 1
+    assert time.time() - start < 5.0
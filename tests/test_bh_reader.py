@@ -1,10 +1,22 @@
+import os
+import shutil
+
 import numpy as np
 import pynbody
+import pytest
 
 import tangos as db
 from tangos.input_handlers.changa_bh import BlackHolesLog, ShortenedOrbitLog
 
 _sim_path = 'test_simulations/test_tipsy/tiny.000640'
+_log_path = 'test_simulations/test_tipsy/tiny.BlackHoles'
+_cache_path = _log_path + '.tangos-cache'
+
+@pytest.fixture(autouse=True)
+def remove_binary_cache():
+	shutil.rmtree(_cache_path, ignore_errors=True)
+	yield
+	shutil.rmtree(_cache_path, ignore_errors=True)
 
 def test_bhlog():
 	sim = pynbody.load(_sim_path)
@@ -28,3 +40,46 @@ def test_bhlog():
 
 	assert(bhlog.get_last_entry_for_id(12345)['step'] == 2.0)
 	assert(bhlog.get_last_entry_for_id(12346)['step'] == 2.0)
+
+def test_bhlog_binary_cache(monkeypatch):
+	num_parses = [0]
+	original_parse = BlackHolesLog._parse
+	def counting_parse(self, *args):
+		num_parses[0]+=1
+		return original_parse(self, *args)
+	monkeypatch.setattr(BlackHolesLog, '_parse', counting_parse)
+
+	parsed = BlackHolesLog(_sim_path)
+	assert num_parses[0] == 1
+	assert os.path.exists(os.path.join(_cache_path, 'header.json'))
+
+	cached = BlackHolesLog(_sim_path)
+	assert num_parses[0] == 1
+	assert isinstance(cached.vars['mass'].base, np.memmap)
+	assert cached.boxsize == parsed.boxsize
+	for k in parsed.vars:
+		assert (cached.vars[k] == parsed.vars[k]).all()
+		assert str(getattr(cached.vars[k], 'units', None)) == str(getattr(parsed.vars[k], 'units', None))
+	assert cached.get_last_entry_for_id(12345)['step'] == 2.0
+	assert (cached.get_at_stepnum(1.0)['bhid'] == [12345, 12346]).all()
+	assert (np.diff(cached.get_all_entries_for_id(12346)['step']) > 0).all()
+
+	# the cache is discarded when the log file changes
+	stat = os.stat(_log_path)
+	os.utime(_log_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+	try:
+		BlackHolesLog(_sim_path)
+		assert num_parses[0] == 2
+		BlackHolesLog(_sim_path)
+		assert num_parses[0] == 2
+	finally:
+		os.utime(_log_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+def test_bhlog_missing_entries():
+	bhlog = BlackHolesLog(_sim_path)
+	with pytest.raises(ValueError):
+		bhlog.get_at_stepnum_for_id(1.0, 99999)
+	with pytest.raises(ValueError):
+		bhlog.get_last_entry_for_id(99999)
+	assert len(bhlog.get_all_entries_for_id(99999)['time']) == 0
+	assert len(bhlog.get_at_stepnum(1000.0)['time']) == 0
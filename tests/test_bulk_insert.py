@@ -0,0 +1,49 @@
+import warnings
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, select
+
+import tangos
+from tangos import core, temporary_halolist as thl, testing
+from tangos.testing import simulation_generator
+from tangos.util import bulk_insert
+
+
+def setup_module():
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+    generator.add_timestep()
+    generator.add_objects_to_timestep(5)
+
+def teardown_module():
+    core.close_db()
+
+def test_bulk_insert():
+    table = Table('bulk_insert_test', MetaData(),
+                  Column('id', Integer, primary_key=True),
+                  Column('value', Integer),
+                  Column('weight', Float),
+                  prefixes=["TEMPORARY"])
+    bulk_insert.reset_statistics()
+    with core.get_default_engine().connect() as connection:
+        table.create(bind=connection)
+        bulk_insert.bulk_insert(connection, table, ['value', 'weight'], [(1, 0.5), (2, None), (None, 1.5)])
+        bulk_insert.bulk_insert(connection, table, ['value', 'weight'], [])
+        rows = connection.execute(select(table.c.value, table.c.weight).order_by(table.c.id)).all()
+
+    assert [tuple(r) for r in rows] == [(1, 0.5), (2, None), (None, 1.5)]
+    (calls, num_rows, seconds), = bulk_insert.get_statistics().values()
+    assert calls == 1
+    assert num_rows == 3
+
+def test_temporary_halolist_with_duplicates():
+    session = core.get_default_session()
+    with thl.temporary_halolist_table(session, [3, 1, 3, 5]) as table:
+        halos = thl.all_halos_with_duplicates(table)
+    assert [h.halo_number for h in halos] == [3, 1, 3, 5]
+
+def test_empty_temporary_halolist():
+    session = core.get_default_session()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        with thl.temporary_halolist_table(session, []) as table:
+            assert thl.all_halos_with_duplicates(table) == []
@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import pytest
+from pytest import fixture
+
+import tangos
+from tangos import config, core, log, parallel_tasks, testing
+from tangos.tools import changa_bh_importer
+
+_cache_path = os.path.join(os.path.dirname(__file__), "test_simulations/test_tipsy/tiny.BlackHoles.tangos-cache")
+
+@fixture
+def bh_database():
+    parallel_tasks.use('null')
+    testing.init_blank_db_for_testing()
+    old_base = config.base
+    config.base = os.path.join(os.path.dirname(__file__), "test_simulations")
+
+    session = core.get_default_session()
+    sim = core.Simulation("test_tipsy")
+    ts1 = core.TimeStep(sim, "tiny.000640")
+    ts1.time_gyr = 1.0
+    ts2 = core.TimeStep(sim, "tiny.000832")
+    ts2.time_gyr = 2.0
+    session.add_all([sim, ts1, ts2])
+
+    # BH 12346 merges into BH 12345 between the timesteps (see tiny.BHmergers and tiny.BlackHoles). The database ids
+    # of the BHs in the second timestep include one that does not fit in 32 bits.
+    for ts, numbers_and_ids in ((ts1, [(1, 2), (12345, 3), (12346, 4)]), (ts2, [(12345, 5), (1, 2**32+5)])):
+        for halo_number, dbid in numbers_and_ids:
+            bh = core.halo.BH(ts, halo_number)
+            bh.id = dbid
+            session.add(bh)
+    session.commit()
+
+    yield
+
+    config.base = old_base
+    shutil.rmtree(_cache_path, ignore_errors=True)
+    core.close_db()
+
+def _run_importer():
+    importer = changa_bh_importer.ChangaBHImporter()
+    importer.parse_command_line(["--sims", "test_tipsy", "--link-only"])
+    with log.LogCapturer():
+        importer.run_calculation_loop()
+
+def _links(relation, with_weights=False):
+    relation_id = core.get_dict_id(relation)
+    columns = [core.HaloLink.halo_from_id, core.HaloLink.halo_to_id]
+    if with_weights:
+        columns.append(core.HaloLink.weight)
+    return sorted(core.get_default_session().query(*columns).filter_by(relation_id=relation_id).all())
+
+def test_bh_links(bh_database):
+    session = core.get_default_session()
+    # an existing pair of tracker links, which must not be duplicated
+    tracker = core.get_or_create_dictionary_item(session, "tracker")
+    bh_from, bh_to = session.get(core.halo.BH, 3), session.get(core.halo.BH, 5)
+    session.add_all([core.HaloLink(bh_from, bh_to, tracker, 1.0), core.HaloLink(bh_to, bh_from, tracker, 1.0)])
+    session.commit()
+
+    _run_importer()
+
+    assert _links("tracker") == [(2, 2**32+5), (3, 5), (5, 3), (2**32+5, 2)]
+    assert _links("BH_merger_next") == [(4, 5)]
+    # the ratio is taken from the masses in the BH log at the last step of the eaten BH (175/400), rather than from
+    # the .BHmergers file
+    assert _links("BH_merger_prev", with_weights=True) == [(5, 4, pytest.approx(175.0/400.0))]
+    assert _links("BH_merger_next", with_weights=True) == [(4, 5, 1.0)]
+    assert tangos.get_object("test_tipsy/tiny.000832/BH_12345")["BH_merger_prev"].halo_number == 12346
+
+    # running again adds no further links
+    _run_importer()
+    assert len(_links("tracker")) == 4
+    assert len(_links("BH_merger_next")) == 1
+    assert len(_links("BH_merger_prev")) == 1
@@ -0,0 +1,75 @@
+import pytest
+import sqlalchemy.exc
+from sqlalchemy import exists, func, select
+
+from tangos import core, testing
+from tangos.testing import simulation_generator
+from tangos.util import chunked_delete
+
+
+@pytest.fixture
+def fresh_database():
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+    generator.add_timestep()
+    generator.add_objects_to_timestep(10)
+    generator.add_properties_to_halos(Mvir=lambda i: 1.*i)
+    generator.add_properties_to_halos(Rvir=lambda i: 0.1*i)
+    yield
+    core.close_db()
+
+def _num_properties(name):
+    properties = core.HaloProperty.__table__
+    return core.get_default_session().execute(
+        select(func.count()).select_from(properties).where(properties.c.name_id == core.get_dict_id(name))).scalar()
+
+def test_delete_in_chunks(fresh_database):
+    properties = core.HaloProperty.__table__
+    count = chunked_delete.delete_in_chunks(core.get_default_engine(), properties,
+                                            properties.c.name_id == core.get_dict_id("Mvir"), chunk_size=3)
+    assert count == 10
+    assert _num_properties("Mvir") == 0
+    assert _num_properties("Rvir") == 10
+
+def test_delete_in_chunks_start_after_id(fresh_database):
+    properties = core.HaloProperty.__table__
+    mvir_ids = core.get_default_session().execute(
+        select(properties.c.id).where(properties.c.name_id == core.get_dict_id("Mvir")).order_by(properties.c.id)
+    ).scalars().all()
+    count = chunked_delete.delete_in_chunks(core.get_default_engine(), properties,
+                                            properties.c.name_id == core.get_dict_id("Mvir"), chunk_size=4,
+                                            start_after_id=mvir_ids[5])
+    assert count == 4
+    assert _num_properties("Mvir") == 6
+
+def test_delete_in_chunks_anti_join(fresh_database):
+    objects = core.SimulationObjectBase.__table__
+    properties = core.HaloProperty.__table__
+    with core.get_default_engine().begin() as connection:
+        connection.execute(objects.delete().where(objects.c.halo_number > 7))
+
+    count = chunked_delete.delete_in_chunks(core.get_default_engine(), properties,
+                                            ~exists().where(objects.c.id == properties.c.halo_id), chunk_size=4)
+    assert count == 6
+    assert _num_properties("Mvir") == 7
+
+def test_delete_in_chunks_resumes(fresh_database, monkeypatch):
+    properties = core.HaloProperty.__table__
+    condition = properties.c.name_id == core.get_dict_id("Mvir")
+    original_delete = chunked_delete.delete
+    num_calls = [0]
+    def failing_delete(table):
+        num_calls[0]+=1
+        if num_calls[0]==3:
+            raise sqlalchemy.exc.OperationalError("DELETE", {}, Exception("lost connection"))
+        return original_delete(table)
+
+    monkeypatch.setattr(chunked_delete, "delete", failing_delete)
+    with pytest.raises(sqlalchemy.exc.OperationalError):
+        chunked_delete.delete_in_chunks(core.get_default_engine(), properties, condition, chunk_size=3)
+
+    # the first two batches were committed
+    assert _num_properties("Mvir") == 4
+
+    assert chunked_delete.delete_in_chunks(core.get_default_engine(), properties, condition, chunk_size=3) == 4
+    assert _num_properties("Mvir") == 0
@@ -0,0 +1,172 @@
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+from pytest import fixture
+
+import tangos
+from tangos import config, parallel_tasks, testing
+from tangos.testing import simulation_generator
+from tangos.tools import column_exporter
+from tangos.util import column_export
+
+
+@fixture
+def fresh_database():
+    parallel_tasks.use('null')
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+
+    for ts in range(1, 3):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(4)
+        generator.add_properties_to_halos(Mvir=lambda i: 10.0*i + ts)
+        generator.add_properties_to_halos(counts=lambda i: i)
+        generator.add_properties_to_halos(fixed=lambda i: np.array([i, 2.0*i, 3.0*i]))
+        generator.add_properties_to_halos(ragged=lambda i: np.arange(float(i)))
+        generator.add_properties_to_halos(unexportable=lambda i: np.zeros((i, 2)))
+        generator.add_bhs_to_timestep(2)
+        generator.add_properties_to_bhs(BH_mass=lambda i: 100.0*i)
+
+    # a property that only some objects have
+    tangos.get_halo("sim/ts1/2")["sometimes"] = 5.0
+    tangos.get_halo("sim/ts1/4")["sometimes"] = 7.0
+    tangos.core.get_default_session().commit()
+
+    export_path = tempfile.mkdtemp()
+    old_export_path = config.column_export_path
+    config.column_export_path = export_path
+
+    yield export_path
+
+    config.column_export_path = old_export_path
+    shutil.rmtree(export_path)
+    tangos.core.close_db()
+
+def _run_exporter(*args):
+    exporter = column_exporter.ColumnExporter()
+    exporter.parse_command_line(list(args))
+    exporter.run_calculation_loop()
+
+
+def test_export_layout(fresh_database):
+    _run_exporter()
+    ts = tangos.get_timestep("sim/ts1")
+    table = column_export.open_timestep(ts)
+
+    assert len(table) == 6
+    npt.assert_equal(table.halo_number, [1, 2, 3, 4, 1, 2])
+    npt.assert_equal(table.object_typecode, [0, 0, 0, 0, 1, 1])
+    npt.assert_equal(table.dbid, sorted(o.id for o in ts.objects))
+    assert isinstance(table["Mvir"], np.memmap)
+
+    assert "unexportable" not in table
+    assert set(table.keys()) == {"Mvir", "counts", "fixed", "ragged", "sometimes", "BH_mass"}
+
+    npt.assert_equal(table.mask("Mvir"), [True]*4 + [False]*2)
+    npt.assert_allclose(table["Mvir"][:4], [11.0, 21.0, 31.0, 41.0])
+    assert table["counts"].dtype == np.int64
+
+    assert table["fixed"].shape == (6, 3)
+    npt.assert_allclose(table["fixed"][2], [3.0, 6.0, 9.0])
+
+    ragged = table["ragged"]
+    assert isinstance(ragged, column_export.RaggedColumn)
+    assert len(ragged) == 6
+    npt.assert_allclose(ragged[3], [0.0, 1.0, 2.0, 3.0])
+    assert len(ragged[5]) == 0
+
+    npt.assert_equal(table.mask("sometimes"), [False, True, False, True, False, False])
+
+def test_export_selected_properties(fresh_database):
+    _run_exporter("Mvir", "fixed")
+    table = column_export.open_timestep(tangos.get_timestep("sim/ts2"))
+    assert set(table.keys()) == {"Mvir", "fixed"}
+
+def test_calculate_all_from_export_matches_database(fresh_database):
+    _run_exporter()
+    ts = tangos.get_timestep("sim/ts1")
+    for names, kwargs in [(("Mvir",), {}),
+                          (("Mvir", "fixed"), {}),
+                          (("Mvir", "sometimes"), {}),
+                          (("BH_mass",), {'object_typetag': 'BH'}),
+                          (("counts",), {'order_by_halo_number': True, 'limit': 3}),
+                          (("ragged",), {})]:
+        from_db = ts.calculate_all(*names, use_column_export=False, **kwargs)
+        from_export = column_export.calculate_all_from_export(
+            ts, list(names),
+            tangos.core.SimulationObjectBase.object_typecode_from_tag(kwargs.get('object_typetag', 'halo'))
+            if 'object_typetag' in kwargs else None,
+            kwargs.get('limit'), True, kwargs.get('order_by_halo_number', False))
+        assert len(from_db) == len(from_export)
+        for a, b in zip(from_db, from_export):
+            assert a.dtype == b.dtype
+            for x, y in zip(a, b):
+                npt.assert_equal(x, y)
+
+    unsanitized = column_export.calculate_all_from_export(ts, ["sometimes", "ragged"], sanitize=False)
+    assert unsanitized.shape == (2, 6)
+    assert unsanitized[0, 0] is None and unsanitized[0, 1] == 5.0
+    npt.assert_equal(unsanitized[1, 2], [0.0, 1.0, 2.0])
+    assert unsanitized[1, 4] is None
+
+def test_calculate_all_uses_export_only_when_current(fresh_database):
+    ts = tangos.get_timestep("sim/ts2")
+    assert column_export.calculate_all_from_export(ts, ["Mvir"]) is None # not yet exported
+
+    _run_exporter()
+    Mvir, = ts.calculate_all("Mvir", use_column_export=True)
+    assert isinstance(Mvir, np.memmap)
+    npt.assert_allclose(Mvir, [12.0, 22.0, 32.0, 42.0])
+
+    # live calculations are never served from the export
+    Mvir_doubled, = ts.calculate_all("Mvir*2", use_column_export=True)
+    assert not isinstance(Mvir_doubled, np.memmap)
+
+    # properties not in the export fall back to the database
+    assert column_export.calculate_all_from_export(ts, ["Mvir", "not_exported"]) is None
+
+    ts[1]["Mvir"] = 1000.0
+    tangos.core.get_default_session().commit()
+    assert column_export.calculate_all_from_export(ts, ["Mvir"]) is None
+    Mvir, = ts.calculate_all("Mvir", use_column_export=True)
+    npt.assert_allclose(Mvir, [1000.0, 22.0, 32.0, 42.0])
+
+    # re-exporting brings the export up to date
+    _run_exporter()
+    Mvir, = ts.calculate_all("Mvir", use_column_export=True)
+    assert isinstance(Mvir, np.memmap)
+    npt.assert_allclose(Mvir, [1000.0, 22.0, 32.0, 42.0])
+
+def test_export_is_stale_after_overwriting_in_place(fresh_database):
+    ts = tangos.get_timestep("sim/ts1")
+    _run_exporter()
+    assert column_export.calculate_all_from_export(ts, ["fixed"]) is not None
+
+    # an array of the same size, written over the existing property
+    ts[1]["fixed"] = np.array([9.0, 9.0, 9.0])
+    tangos.core.get_default_session().commit()
+    assert column_export.calculate_all_from_export(ts, ["fixed"]) is None
+    fixed, = ts.calculate_all("fixed", use_column_export=True)
+    npt.assert_allclose(fixed[0], [9.0, 9.0, 9.0])
+
+    _run_exporter()
+    assert column_export.calculate_all_from_export(ts, ["Mvir"]) is not None
+
+    # exchanging values between objects leaves the sum of the values unchanged
+    ts[1]["Mvir"], ts[2]["Mvir"] = ts[2]["Mvir"], ts[1]["Mvir"]
+    tangos.core.get_default_session().commit()
+    assert column_export.calculate_all_from_export(ts, ["Mvir"]) is None
+    Mvir, = ts.calculate_all("Mvir", use_column_export=True)
+    npt.assert_allclose(Mvir, [21.0, 11.0, 31.0, 41.0])
+
+def test_checking_export_is_cheap(fresh_database):
+    ts = tangos.get_timestep("sim/ts1")
+    _run_exporter()
+    with testing.SqlExecutionTracker() as ctr:
+        Mvir, fixed = ts.calculate_all("Mvir", "fixed", use_column_export=True)
+    assert isinstance(Mvir, np.memmap)
+    # the write counter and object count are checked, without reading any properties
+    assert ctr.count <= 2
+    assert "haloproperties" not in ctr
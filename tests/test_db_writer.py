@@ -410,3 +410,37 @@ def test_writer_with_property_accessing_timestep(fresh_database):
     run_writer_with_args("dummy_property_accessing_timestep")
 
     assert db.get_halo("%/step.1/halo_1")['dummy_property_accessing_timestep'] == -1.0
+
+@pytest.mark.parametrize('parallel', [True, False])
+def test_profiling(fresh_database, parallel, tmp_path):
+    import json
+    import pstats
+
+    if parallel:
+        parallel_tasks.use('multiprocessing-3')
+    prefix = str(tmp_path / "profile")
+    log = run_writer_with_args("dummy_property", "dummy_region_property", "--profile", prefix,
+                               "--profile-allocations", parallel=parallel)
+    _assert_properties_as_expected()
+
+    # calls from all processes are combined
+    assert "DummyProperty: 15 calls" in log
+    assert "DummyRegionProperty: 15 calls" in log
+    assert "peak allocation" in log
+
+    module = DummyProperty.__module__
+    stats = pstats.Stats(prefix + f".{module}.DummyProperty.pstats")
+    assert any(func[2] == "calculate" and func[0].endswith("test_db_writer.py") for func in stats.stats)
+    assert stats.stats[next(func for func in stats.stats if func[2] == "calculate")][1] == 15
+
+    with open(prefix + ".speedscope.json") as f:
+        speedscope = json.load(f)
+    assert {p['name'] for p in speedscope['profiles']} == {f"{module}.DummyProperty",
+                                                           f"{module}.DummyRegionProperty"}
+    for p in speedscope['profiles']:
+        assert len(p['samples']) == len(p['weights'])
+        assert all(0 <= i < len(speedscope['shared']['frames']) for sample in p['samples'] for i in sample)
+
+def test_no_profiling_by_default(fresh_database):
+    log = run_writer_with_args("dummy_property")
+    assert "PROFILE OF PROPERTY CALCULATIONS" not in log
@@ -17,3 +17,47 @@ def test_set():
     assert bh_obj is not None
     bh_obj2 = tangos.core.dictionary.get_or_create_dictionary_item(db.core.get_default_session(), "BH")
     assert bh_obj2 is bh_obj
+
+def test_ids_shared_between_sessions():
+    session = db.core.get_default_session()
+    tangos.core.dictionary.get_or_create_dictionary_item(session, "Mvir")
+    session.commit()
+
+    engine = db.core.get_default_engine()
+    cache = tangos.core.dictionary._get_dict_cache_for_engine(engine)
+    other_session = db.core.Session()
+    mvir_id = db.core.get_dict_id("Mvir", session=other_session)
+    assert cache.get("Mvir") == mvir_id
+
+    # a further session neither rereads the table nor has its own cache
+    with testing.SqlExecutionTracker() as tracker:
+        assert db.core.get_dict_id("Mvir", session=db.core.Session()) == mvir_id
+    assert tracker.count_statements_containing("dictionary") == 0
+    other_session.close()
+
+def test_uncommitted_item_visible_to_own_session():
+    session = db.core.get_default_session()
+    item = tangos.core.dictionary.get_or_create_dictionary_item(session, "pending")
+    session.flush()
+    assert db.core.get_dict_id("pending", session=session) == item.id
+    session.rollback()
+    assert db.core.get_dict_id("pending", None) is None
+    assert db.core.get_dict_id("pending", None, session=session) is None
+
+def test_cache_is_bounded():
+    session = db.core.get_default_session()
+    for i in range(5):
+        tangos.core.dictionary.get_or_create_dictionary_item(session, "bounded_%d"%i)
+    session.commit()
+
+    old_size = tangos.config.dictionary_cache_size
+    tangos.config.dictionary_cache_size = 3
+    try:
+        cache = tangos.core.dictionary._get_dict_cache_for_engine(db.core.get_default_engine())
+        ids = [db.core.get_dict_id("bounded_%d"%i) for i in range(5)]
+        assert len(cache._ids) <= 3
+        # evicted items are found again
+        assert [db.core.get_dict_id("bounded_%d"%i) for i in range(5)] == ids
+        assert len(cache._ids) <= 3
+    finally:
+        tangos.config.dictionary_cache_size = old_size
@@ -1,4 +1,5 @@
 import pytest
+import sqlalchemy
 
 import tangos
 import tangos.testing as testing
@@ -111,3 +112,77 @@ def test_import_filtered(source_engine_and_session, destination_engine_and_sessi
 
     assert "Mvir" not in tangos.get_halo("sim/ts1/halo_1").keys()
     assert "Mvir" in tangos.get_halo("sim_existing/ts1/halo_1").keys()
+
+
+def test_import_resumes_after_lost_connection(source_engine_and_session, destination_engine_and_session, monkeypatch):
+    import sqlalchemy.exc
+
+    source_engine, source_session = source_engine_and_session
+    _, destination_session = destination_engine_and_session
+
+    original_bulk_insert = tangos.util.bulk_insert.bulk_insert
+    num_calls = [0]
+    def sometimes_failing_bulk_insert(connection, table, column_names, rows):
+        num_calls[0]+=1
+        if num_calls[0] in (3, 4, 8):
+            # the partially-inserted chunk is rolled back when the importer reconnects
+            original_bulk_insert(connection, table, column_names, rows[:1])
+            raise sqlalchemy.exc.OperationalError("INSERT", {}, Exception("lost connection"))
+        original_bulk_insert(connection, table, column_names, rows)
+
+    monkeypatch.setattr(tangos.tools.db_importer.bulk_insert, "bulk_insert", sometimes_failing_bulk_insert)
+    monkeypatch.setattr(tangos.tools.db_importer, "DB_IMPORT_MAX_CHUNK_SIZE", 7)
+
+    importer = _get_importer_instance(source_engine)
+    importer.run_calculation_loop()
+
+    differ = diff.TangosDbDiff(source_session, destination_session)
+    differ.compare_simulation("sim")
+    assert not differ.failed, "Copied database differs; see log for details"
+
+def test_import_with_multiple_connections(source_engine_and_session, destination_engine_and_session):
+    # SQLite falls back to copying one table at a time, but the option must still be accepted
+    source_engine, source_session = source_engine_and_session
+    _, destination_session = destination_engine_and_session
+
+    importer = _get_importer_instance(source_engine, "--connections", "3")
+    importer.run_calculation_loop()
+
+    differ = diff.TangosDbDiff(source_session, destination_session)
+    differ.compare_simulation("sim")
+    assert not differ.failed, "Copied database differs; see log for details"
+
+def test_failed_import_is_removed(source_engine_and_session, destination_engine_and_session, monkeypatch):
+    source_engine, source_session = source_engine_and_session
+    destination_engine, destination_session = destination_engine_and_session
+
+    tables = [c.__table__ for c in (tangos.core.Creator, tangos.core.Simulation, tangos.core.TimeStep,
+                                    tangos.core.SimulationObjectBase, tangos.core.DictionaryItem,
+                                    tangos.core.SimulationProperty, tangos.core.HaloLink, tangos.core.HaloProperty,
+                                    tangos.core.TimeStepSummary)]
+    def num_rows():
+        with destination_engine.connect() as connection:
+            return {table.name: connection.execute(sqlalchemy.select(sqlalchemy.func.count()).select_from(table)).scalar()
+                    for table in tables}
+    rows_before_import = num_rows()
+
+    original_copy_table = tangos.tools.db_importer._copy_table
+    def copy_table_failing_for_links(from_engine, target_engine, orm_class, *args, **kwargs):
+        if orm_class is tangos.core.HaloLink:
+            raise RuntimeError("Simulated failure")
+        return original_copy_table(from_engine, target_engine, orm_class, *args, **kwargs)
+    monkeypatch.setattr(tangos.tools.db_importer, "_copy_table", copy_table_failing_for_links)
+
+    importer = _get_importer_instance(source_engine)
+    with pytest.raises(RuntimeError):
+        importer.run_calculation_loop()
+    assert num_rows() == rows_before_import
+
+    # importing again once the problem is fixed gives a single copy of the data
+    monkeypatch.setattr(tangos.tools.db_importer, "_copy_table", original_copy_table)
+    importer = _get_importer_instance(source_engine)
+    importer.run_calculation_loop()
+
+    differ = diff.TangosDbDiff(source_session, tangos.get_default_session())
+    differ.compare_simulation("sim")
+    assert not differ.failed, "Copied database differs; see log for details"
@@ -0,0 +1,74 @@
+import numpy as np
+
+import tangos
+from tangos import core, testing
+from tangos.testing import simulation_generator
+from tangos.util import link_writer
+
+
+def setup_module():
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+    generator.add_timestep()
+    generator.add_objects_to_timestep(4)
+    generator.add_objects_to_timestep(2, object_typecode=1)
+    generator.add_timestep()
+    generator.add_objects_to_timestep(3)
+
+def teardown_module():
+    core.close_db()
+
+def test_finder_id_mapper():
+    session = core.get_default_session()
+    ts1 = tangos.get_timestep("sim/ts1")
+    halos = link_writer.FinderIdMapper(session, ts1)
+    bhs = link_writer.FinderIdMapper(session, ts1, object_typecode=1)
+    assert len(halos) == 4
+    assert len(bhs) == 2
+
+    ids = halos([4, 1, 7, 0])
+    assert ids[0] == tangos.get_halo("sim/ts1/4").id
+    assert ids[1] == tangos.get_halo("sim/ts1/1").id
+    assert (ids[2:] == -1).all()
+
+    assert bhs([2])[0] == tangos.get_halo("sim/ts1/bh_2").id
+
+def test_finder_id_mapper_empty_timestep():
+    session = core.get_default_session()
+    ts2 = tangos.get_timestep("sim/ts2")
+    bhs = link_writer.FinderIdMapper(session, ts2, object_typecode=1)
+    assert len(bhs) == 0
+    assert (bhs([1, 2]) == -1).all()
+
+def test_insert_links_by_finder_id():
+    session = core.get_default_session()
+    relation = core.dictionary.get_or_create_dictionary_item(session, "link_writer_test")
+    halos_1 = link_writer.FinderIdMapper(session, tangos.get_timestep("sim/ts1"))
+    halos_2 = link_writer.FinderIdMapper(session, tangos.get_timestep("sim/ts2"))
+
+    num_links, num_missing = link_writer.insert_links_by_finder_id(session, halos_1, halos_2,
+                                                                   np.array([1, 2, 4, 3]), np.array([1, 1, 3, 9]),
+                                                                   np.array([1.0, 0.25, 0.5, 1.0]), relation)
+    session.commit()
+    assert num_links == 3
+    assert num_missing == 1
+
+    links = session.query(core.HaloLink).filter_by(relation_id=relation.id).order_by(core.HaloLink.id).all()
+    assert [(l.halo_from.path, l.halo_to.path, l.weight) for l in links] == \
+           [("sim/ts1/halo_1", "sim/ts2/halo_1", 1.0), ("sim/ts1/halo_2", "sim/ts2/halo_1", 0.25),
+            ("sim/ts1/halo_4", "sim/ts2/halo_3", 0.5)]
+    assert all(l.creator_id == core.creator.get_creator_id() for l in links)
+
+    assert tangos.get_halo("sim/ts1/2").calculate("link_writer_test.halo_number()") == 1
+
+def test_insert_links_with_scalar_weight():
+    session = core.get_default_session()
+    relation = core.dictionary.get_or_create_dictionary_item(session, "link_writer_scalar_test")
+    num_links = link_writer.insert_links(session, [tangos.get_halo("sim/ts2/1").id, -1],
+                                         [tangos.get_halo("sim/ts1/1").id, tangos.get_halo("sim/ts1/2").id],
+                                         0.75, relation)
+    session.commit()
+    assert num_links == 1
+    link, = session.query(core.HaloLink).filter_by(relation_id=relation.id).all()
+    assert link.weight == 0.75
+    assert link_writer.insert_links(session, [], [], [], relation) == 0
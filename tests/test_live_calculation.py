@@ -279,3 +279,98 @@ def test_non_existent_redirection_multihalo():
     vals1, vals2 = tangos.get_timestep("sim/ts3").calculate_all("BH_mass","later(1).BH_mass")
     assert len(vals1)==0
     assert len(vals2)==0
+
+def test_shared_link_resolved_once(monkeypatch):
+    calls = []
+    original = lc.Link._get_values_and_description_from_halo_id_list
+    def counting_version(self, target_halo_ids):
+        calls.append(str(self.locator))
+        return original(self, target_halo_ids)
+    monkeypatch.setattr(lc.Link, "_get_values_and_description_from_halo_id_list", counting_version)
+
+    ts1 = tangos.get_timestep("sim/ts1")
+    masses, dummy, dbids = ts1.calculate_all("BH.BH_mass", "dummy_property_3", "BH.dbid()", object_type='halo')
+    assert calls == ["BH"]
+    assert masses[0] == 1000.0
+    assert dummy[0] == -2.5
+    assert dbids[0] == tangos.get_halo("sim/ts1/1.1").id
+
+    calls.clear()
+    masses_separately, = ts1.calculate_all("BH.BH_mass", object_type='halo')
+    dbids_separately, = ts1.calculate_all("BH.dbid()", object_type='halo')
+    assert len(calls) == 2
+    assert np.all(masses_separately == masses)
+    assert np.all(dbids_separately == dbids)
+
+def test_link_with_selection_basis_not_shared():
+    calc = lc.parser.parse_property_names("BH.BH_mass", "BH('BH_mass','max','BH').dbid()")
+    assert len(calc._plan()) == 2
+
+def test_explain():
+    calc = lc.parser.parse_property_names("later(1).dummy_property_3", "dummy_property_1", "later(1).dbid()")
+    explanation = calc.explain()
+    assert "resolve link later(1) once, shared by later(1).dummy_property_3, later(1).dbid()" in explanation
+    assert "evaluate dummy_property_1" in explanation
+    assert lc.parser.parse_property_name("dummy_property_1").explain() == "evaluate dummy_property_1"
+
+def test_parse_cache_returns_independent_copies():
+    lc.parser.clear_parse_cache()
+    first = lc.parser.parse_property_name("later(1).BH_mass")
+    second = lc.parser.parse_property_name("later(1).BH_mass")
+    assert first is not second
+    assert first.property is not second.property
+    assert str(first) == str(second)
+
+    info = lc.parser.parse_cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+
+    first.property.set_multivalued()
+    assert not lc.parser.parse_property_name("later(1).BH_mass").property._multivalued
+
+def test_parse_cache_builtin_function_copy():
+    calc = lc.parser.parse_property_name("abs(dummy_property_3)")
+    calc_copy = lc.parser.parse_property_name("abs(dummy_property_3)")
+    assert type(calc_copy) is type(calc) is lc.BuiltinFunction
+    assert tangos.get_halo("sim/ts1/1").calculate(calc_copy) == 2.5
+
+def test_parse_cache_copies_do_not_share_link_state():
+    for i in range(2):
+        assert tangos.get_halo("sim/ts1/1").calculate('link(BH, BH_mass, "min")')["BH_mass"] == 900.0
+
+def _bh_masses_and_targets():
+    ts1 = tangos.get_timestep("sim/ts1")
+    return ts1.calculate_all("BH.BH_mass", "later(1).dbid()", object_type='halo')
+
+def test_link_resolution_strategies_agree(monkeypatch):
+    from tangos import config
+    with testing.SqlExecutionTracker() as ctr:
+        in_clause_results = _bh_masses_and_targets()
+    assert "halolist_pooled" not in ctr
+
+    monkeypatch.setattr(config, "max_ids_for_in_clause", 0)
+    with testing.SqlExecutionTracker() as ctr:
+        temp_table_results = _bh_masses_and_targets()
+        temp_table_results_again = _bh_masses_and_targets()
+    assert "DROP TABLE halolist_pooled" not in ctr
+
+    for a, b, c in zip(in_clause_results, temp_table_results, temp_table_results_again):
+        assert np.all(a==b)
+        assert np.all(a==c)
+
+def test_pooled_temporary_halolist_is_reused():
+    from tangos import temporary_halolist as thl
+    session = tangos.core.Session()
+    try:
+        with testing.SqlExecutionTracker() as ctr:
+            with thl.pooled_temporary_halolist_table(session, [1, 2, 1]) as table:
+                first_results = [h.id for h in thl.all_halos_with_duplicates(table)]
+            with thl.pooled_temporary_halolist_table(session, [2]) as table_again:
+                second_results = [h.id for h in thl.all_halos_with_duplicates(table_again)]
+        assert table is table_again
+        assert first_results == [1, 2, 1]
+        assert second_results == [2]
+        assert ctr.count_statements_containing("CREATE TEMPORARY") <= 1
+        assert "DROP TABLE" not in ctr
+    finally:
+        session.close()
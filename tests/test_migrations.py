@@ -0,0 +1,129 @@
+import numpy.testing as npt
+import pytest
+from pytest import fixture
+from sqlalchemy import inspect, select
+
+import tangos
+from tangos import core, log, testing
+from tangos.core import migrations, timestep_summary
+from tangos.scripts import manager
+from tangos.testing import simulation_generator
+
+
+@fixture
+def fresh_database():
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+    for ts in range(1, 3):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(4)
+        generator.add_properties_to_halos(Mvir=lambda i: 10.0*i)
+        if ts>1:
+            generator.link_last_halos()
+    yield
+    core.close_db()
+
+def _index_names(table):
+    return {index['name'] for index in inspect(core.get_default_engine()).get_indexes(table)}
+
+def _recorded_versions():
+    with core.get_default_engine().connect() as connection:
+        return list(connection.execute(select(migrations.SchemaVersion.version)
+                                       .order_by(migrations.SchemaVersion.version)).scalars())
+
+
+def test_new_database_is_latest_version(fresh_database):
+    assert migrations.latest_version() >= 2
+    assert _recorded_versions() == list(range(1, migrations.latest_version()+1))
+    assert "haloproperties_covering_index" in _index_names("haloproperties")
+    assert "halolink_covering_index" in _index_names("halolink")
+
+def test_upgrade_is_idempotent(fresh_database):
+    migrations.upgrade(core.get_default_engine())
+    assert _recorded_versions() == list(range(1, migrations.latest_version()+1))
+
+    # even if the changes already exist when the database has not recorded them
+    with core.get_default_engine().begin() as connection:
+        connection.execute(migrations.SchemaVersion.__table__.delete())
+    migrations.upgrade(core.get_default_engine())
+    assert _recorded_versions() == list(range(1, migrations.latest_version()+1))
+
+def test_downgrade_and_upgrade(fresh_database):
+    migrations.downgrade(core.get_default_engine(), 1)
+    assert _recorded_versions() == [1]
+    assert "haloproperties_covering_index" not in _index_names("haloproperties")
+    assert "halolink_covering_index" not in _index_names("halolink")
+
+    # reconnecting leaves the database alone, unless an upgrade is requested
+    core.close_db()
+    with log.LogCapturer() as lc:
+        testing.init_blank_db_for_testing(erase_if_exists=False)
+    assert "tangos db-upgrade" in lc.get_output()
+    assert _recorded_versions() == [1]
+    assert "haloproperties_covering_index" not in _index_names("haloproperties")
+
+    core.close_db()
+    testing.init_blank_db_for_testing(erase_if_exists=False, upgrade=True)
+    assert _recorded_versions()[-1] == migrations.latest_version()
+    assert "haloproperties_covering_index" in _index_names("haloproperties")
+
+    Mvir, Mvir_later = tangos.get_timestep("sim/ts1").calculate_all("Mvir", "later(1).Mvir")
+    npt.assert_allclose(Mvir, [10.0, 20.0, 30.0, 40.0])
+    npt.assert_allclose(Mvir_later, [10.0, 20.0, 30.0, 40.0])
+
+def test_new_indexes_are_analyzed(fresh_database):
+    if testing.testing_db_backend != "sqlite":
+        pytest.skip("Statistics are only refreshed explicitly on SQLite")
+    engine = core.get_default_engine()
+    with engine.connect() as connection:
+        connection.exec_driver_sql("ANALYZE")
+    migrations.downgrade(engine, 1)
+    migrations.upgrade(engine)
+    with engine.connect() as connection:
+        analyzed = connection.exec_driver_sql("SELECT idx FROM sqlite_stat1").scalars().all()
+    assert "haloproperties_covering_index" in analyzed
+    assert "halolink_covering_index" in analyzed
+
+def _make_old_database():
+    """Revert the test database to the schema of an old version of tangos, and return its filename"""
+    engine = core.get_default_engine()
+    migrations.downgrade(engine, 1)
+    with engine.begin() as connection:
+        for table in migrations.tables_added_by_upgrade:
+            connection.exec_driver_sql("DROP TABLE IF EXISTS %s" % table)
+    filename = engine.url.database
+    core.close_db()
+    return filename
+
+def test_open_old_database_read_only(fresh_database):
+    if testing.testing_db_backend != "sqlite":
+        pytest.skip("Read-only connections are only tested on SQLite")
+    filename = _make_old_database()
+
+    core.init_db("sqlite:///file:%s?mode=ro&uri=true" % filename)
+    Mvir, Mvir_later = tangos.get_timestep("sim/ts1").calculate_all("Mvir", "later(1).Mvir")
+    npt.assert_allclose(Mvir, [10.0, 20.0, 30.0, 40.0])
+    npt.assert_allclose(Mvir_later, [10.0, 20.0, 30.0, 40.0])
+
+    # without the summary table, objects and properties are counted live
+    session = core.get_default_session()
+    ts = tangos.get_timestep("sim/ts1")
+    assert not timestep_summary.is_available(session)
+    assert timestep_summary.get_object_counts(session, ts) == {0: 4}
+    assert timestep_summary.get_property_counts(session, ts) == {'Mvir': 4}
+    core.close_db()
+
+def test_db_upgrade_command(fresh_database):
+    _make_old_database()
+    testing.init_blank_db_for_testing(erase_if_exists=False)
+    assert not timestep_summary.is_available(core.get_default_session())
+
+    # writing to a database without the summary table is still possible
+    tangos.get_halo("sim/ts1/1")["new_property"] = 1.0
+
+    parser, _ = manager.get_argument_parser_and_subparsers()
+    options = parser.parse_args(["db-upgrade"])
+    options.func(options)
+    assert _recorded_versions() == list(range(1, migrations.latest_version()+1))
+    assert "haloproperties_covering_index" in _index_names("haloproperties")
+    assert timestep_summary.is_available(core.get_default_session())
@@ -0,0 +1,64 @@
+import numpy as np
+import numpy.testing as npt
+
+from tangos.input_handlers import particle_matching
+
+
+def test_particles_in_common_from_group_arrays():
+    group1 = np.array([0, 0, 0, 1, 1, -1, 2])
+    group2 = np.array([0, 0, 1, 1, -1, 0, 5])
+    matrix = particle_matching.particles_in_common_from_group_arrays(group1, group2, (3, 2))
+    npt.assert_equal(matrix.toarray(), [[2, 1], [0, 1], [0, 0]])
+
+def test_particles_in_common_from_members():
+    # particle 3 is in both halo 0 and its subhalo 1 in the second catalogue
+    ids1 = np.array([1, 2, 3, 4, 10, 11])
+    group1 = np.array([0, 0, 0, 0, 1, 1])
+    ids2 = np.array([11, 3, 2, 3, 4, 99])
+    group2 = np.array([0, 0, 0, 1, 1, 1])
+    matrix = particle_matching.particles_in_common_from_members(ids1, group1, ids2, group2, (2, 2))
+    npt.assert_equal(matrix.toarray(), [[2, 2], [1, 0]])
+
+def test_catalogs_from_particles_in_common():
+    matrix = np.array([[8, 2, 0], [0, 1, 9]])
+    forward, backward = particle_matching.catalogs_from_particles_in_common(matrix, np.array([1, 2]),
+                                                                            np.array([5, 6, 7]), 0.15)
+    assert forward.keys() == {1, 2}
+    assert [n for n, _ in forward[1]] == [5, 6]
+    npt.assert_allclose([w for _, w in forward[1]], [0.8, 0.2])
+    assert [n for n, _ in forward[2]] == [7]
+
+    assert backward.keys() == {5, 6, 7}
+    assert [n for n, _ in backward[6]] == [1, 2]
+    npt.assert_allclose([w for _, w in backward[6]], [2./3, 1./3])
+    assert backward[7] == [(2, 1.0)]
+
+def test_catalogs_with_explicit_normalisation():
+    matrix = np.array([[1, 0], [0, 0]])
+    forward, backward = particle_matching.catalogs_from_particles_in_common(matrix, np.array([1, 2]),
+                                                                            np.array([1, 2]), 0.0,
+                                                                            normalisation1=np.array([4, 0]),
+                                                                            normalisation2=np.array([2, 3]))
+    assert forward == {1: [(1, 0.25)], 2: []}
+    assert backward == {1: [(1, 0.5)], 2: []}
+
+def test_particles_in_common_by_merge_join():
+    np.random.seed(1)
+    num_particles = 1000
+    ids1 = np.random.permutation(num_particles) + 100
+    group1 = np.random.randint(-1, 5, num_particles)
+    # second snapshot contains only some of the particles, in a different order
+    ids2 = np.random.permutation(ids1)[:800]
+    group2 = np.random.randint(-1, 7, len(ids2))
+
+    expected = particle_matching.particles_in_common_from_members(ids1[group1>=0], group1[group1>=0],
+                                                                  ids2[group2>=0], group2[group2>=0], (5, 7))
+    for chunk_size in (1, 37, 10000):
+        result = particle_matching.particles_in_common_by_merge_join(ids1, group1, ids2, group2, (5, 7),
+                                                                     chunk_size=chunk_size)
+        npt.assert_equal(result.toarray(), expected.toarray())
+
+def test_merge_join_with_no_members():
+    result = particle_matching.particles_in_common_by_merge_join(np.arange(5), np.zeros(5, dtype=int),
+                                                                 np.arange(5), -np.ones(5, dtype=int), (1, 1))
+    npt.assert_equal(result.toarray(), [[0]])
@@ -0,0 +1,93 @@
+import pytest
+from pytest import fixture
+
+import tangos
+from tangos import core, testing
+from tangos.testing import simulation_generator
+
+
+@fixture
+def fresh_database():
+    testing.init_blank_db_for_testing()
+    generator = simulation_generator.SimulationGeneratorForTests()
+    for ts in range(1, 4):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(5)
+        generator.add_bhs_to_timestep(2)
+    core.get_default_session().commit()
+    yield generator
+    core.close_db()
+
+
+def test_get_object(fresh_database):
+    halo = tangos.get_object("sim/ts2/3")
+    assert halo.halo_number == 3 and halo.timestep.extension == "ts2"
+    assert tangos.get_object("sim/ts2/halo_3") is halo
+    bh = tangos.get_object("sim/ts2/BH_2")
+    assert isinstance(bh, core.halo.BH) and bh.halo_number == 2
+    assert tangos.get_object("sim/ts2/1.2") is bh
+    assert tangos.get_object("sim/ts2/17") is None
+
+def test_cached_path_uses_single_query(fresh_database):
+    tangos.get_object("sim/ts2/1")
+    core.get_default_session().expunge_all()
+    with testing.SqlExecutionTracker() as tracker:
+        halo = tangos.get_object("sim/ts2/4")
+    assert tracker.count == 1
+    assert halo.halo_number == 4
+
+    with testing.SqlExecutionTracker() as tracker:
+        ts = tangos.get_timestep("sim/ts2") # loaded by primary key
+        assert tangos.get_timestep("sim/ts2") is ts # no further query
+    assert tracker.count == 1
+
+def test_errors(fresh_database):
+    with pytest.raises(RuntimeError, match="No simulation"):
+        tangos.get_object("nonexistent/ts1/1")
+    with pytest.raises(RuntimeError, match="No timestep"):
+        tangos.get_object("sim/ts7/1")
+    with pytest.raises(RuntimeError, match="Multiple"):
+        tangos.get_object("sim/ts%/1")
+    with pytest.raises(RuntimeError, match="Multiple"):
+        tangos.get_timestep("sim/ts%")
+
+def test_cache_invalidated_by_changes(fresh_database):
+    with pytest.raises(RuntimeError):
+        tangos.get_timestep("sim/%4")
+    fresh_database.add_timestep()
+    fresh_database.add_objects_to_timestep(2)
+    core.get_default_session().commit()
+    assert tangos.get_object("sim/%4/2").timestep.extension == "ts4"
+
+    # a bulk delete bypasses the ORM events; the stale ID is noticed instead
+    tangos.get_object("sim/ts3/1")
+    session = core.get_default_session()
+    ts3 = tangos.get_timestep("sim/ts3")
+    session.execute(core.SimulationObjectBase.__table__.delete().where(
+        core.SimulationObjectBase.timestep_id == ts3.id))
+    session.execute(core.TimeStep.__table__.delete().where(core.TimeStep.id == ts3.id))
+    session.commit()
+    session.expunge_all()
+    with pytest.raises(RuntimeError, match="No timestep"):
+        tangos.get_object("sim/ts3/1")
+
+def test_get_objects(fresh_database):
+    paths = ["sim/ts3/2", "sim/ts1/5", "sim/ts1/BH_1", "sim/ts2/99", "sim/ts3/2"]
+    with testing.SqlExecutionTracker() as tracker:
+        objects = tangos.get_objects(paths)
+    assert tracker.count_statements_containing("FROM halos") == 1
+
+    assert [o.path if o is not None else None for o in objects] == \
+           ["sim/ts3/halo_2", "sim/ts1/halo_5", "sim/ts1/BH_1", None, "sim/ts3/halo_2"]
+    assert objects[0] is objects[4]
+    assert objects == [tangos.get_object(p) for p in paths]
+
+def test_get_objects_in_batches(fresh_database):
+    original_max = tangos.query._max_objects_per_query
+    tangos.query._max_objects_per_query = 3
+    try:
+        paths = ["sim/ts%d/%d" % (ts, n) for ts in range(1, 4) for n in range(1, 6)]
+        objects = tangos.get_objects(paths)
+    finally:
+        tangos.query._max_objects_per_query = original_max
+    assert [o.path for o in objects] == ["sim/ts%d/halo_%d" % (ts, n) for ts in range(1, 4) for n in range(1, 6)]
@@ -118,6 +118,25 @@ def test_NDM_cut(fresh_database_no_contents):
     ndm, = db.get_timestep("dummy_sim_2/step.1").calculate_all("NDM()")
     assert ndm.min()==2005
 
+def test_objects_enumerated_once(fresh_database_no_contents):
+    handler = output_testing.TestInputHandlerReverseHaloNDM("dummy_sim_2")
+    calls = []
+    original_enumerate_objects = handler.enumerate_objects
+    def counting_enumerate_objects(ts_extension, *args, **kwargs):
+        calls.append(ts_extension)
+        return original_enumerate_objects(ts_extension, *args, **kwargs)
+    handler.enumerate_objects = counting_enumerate_objects
+
+    manager = add_simulation.SimulationAdderUpdater(handler)
+    with log.LogCapturer():
+        manager.scan_simulation_and_add_all_descendants()
+
+    # one call per timestep for each of halos and groups
+    assert len(calls) == 2*len(db.get_simulation("dummy_sim_2").timesteps)
+    halo = db.get_halo("dummy_sim_2/step.1/halo_2")
+    assert isinstance(halo, db.core.halo.Halo)
+    assert halo.creator is not None
+
 def test_add_with_pynbody(fresh_database_no_contents):
 
     manager = tools.add_simulation.SimulationAdderUpdater(
@@ -139,3 +158,18 @@ def test_add_with_pynbody_parallel(fresh_database_no_contents):
 
     assert db.get_timestep("test_ahf_merger_tree/tiny.000640").halos.count() == 9
     assert db.get_timestep("test_ahf_merger_tree/tiny.000832").halos.count() == 9
+
+def _add_test_simulation_parallel():
+    manager = add_simulation.SimulationAdderUpdater(output_testing.TestInputHandlerReverseHaloNDM("dummy_sim_2"))
+    manager.scan_simulation_and_add_all_descendants()
+
+def test_add_test_simulation_parallel(fresh_database_no_contents):
+    pt.use("multiprocessing-4")
+    pt.launch(_add_test_simulation_parallel)
+
+    sim = db.get_simulation("dummy_sim_2")
+    assert [ts.halos.count() for ts in sim.timesteps] == [8, 5, 3]
+    for ts in sim.timesteps:
+        assert ts.time_gyr is not None
+        halo_number, ndm = ts.calculate_all("halo_number()", "NDM()")
+        assert (ndm[halo_number.argsort()] == sorted(ndm, reverse=True)).all()
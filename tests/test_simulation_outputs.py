@@ -241,3 +241,28 @@ def test_input_handler_priority():
     # if we select handler 3 manually, we should get it
     handler = DummyPynbodyHandler3.best_matching_handler("test_tipsy")
     assert handler is DummyPynbodyHandler3
+
+def _assert_catalogs_equal(cat1, cat2):
+    assert cat1.keys() == cat2.keys()
+    for k in cat1:
+        assert [m[0] for m in cat1[k]] == [m[0] for m in cat2[k]]
+        npt.assert_allclose([m[1] for m in cat1[k]], [m[1] for m in cat2[k]])
+
+def test_match_objects_symmetric():
+    handler = pynbody_outputs.ChangaInputHandler("test_ahf_merger_tree")
+    for dm_only in (False, True):
+        forward, backward = handler.match_objects_symmetric("tiny.000640", "tiny.000832", 0, None, dm_only)
+        assert len(forward) > 0 and len(backward) > 0
+        _assert_catalogs_equal(forward, handler.match_objects("tiny.000640", "tiny.000832", 0, None, dm_only))
+        _assert_catalogs_equal(backward, handler.match_objects("tiny.000832", "tiny.000640", 0, None, dm_only))
+
+    for dm_only in (False, True):
+        low_memory = handler.match_objects_symmetric("tiny.000640", "tiny.000832", 0, None, dm_only,
+                                                     low_memory=True)
+        bridged = handler.match_objects_symmetric("tiny.000640", "tiny.000832", 0, None, dm_only)
+        _assert_catalogs_equal(low_memory[0], bridged[0])
+        _assert_catalogs_equal(low_memory[1], bridged[1])
+
+    forward, backward = handler.match_objects_symmetric("tiny.000640", "tiny.000832", 2, 4)
+    assert len(forward) == 0 # only halo 0 is in the first catalogue
+    assert set(backward.keys()) == {2, 3, 4}
@@ -0,0 +1,74 @@
+import numpy.testing as npt
+import pytest
+from pytest import fixture
+from sqlalchemy import select, text
+
+import tangos
+from tangos import core, parallel_tasks, testing
+from tangos.core import sqlite_profile
+from tangos.testing import simulation_generator
+
+
+@fixture
+def read_optimised_database():
+    if testing.testing_db_backend != "sqlite":
+        pytest.skip("The read-optimised profile only applies to SQLite")
+    parallel_tasks.use('null')
+    testing.init_blank_db_for_testing(sqlite_read_optimised=True)
+    generator = simulation_generator.SimulationGeneratorForTests()
+    for ts in range(1, 3):
+        generator.add_timestep()
+        generator.add_objects_to_timestep(5)
+        generator.add_properties_to_halos(Mvir=lambda i: 10.0*i)
+        if ts>1:
+            generator.link_last_halos()
+    yield
+    core.close_db()
+
+
+def test_wal_and_pragmas(read_optimised_database):
+    with core.get_default_engine().connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA mmap_size")).scalar() == tangos.config.sqlite_mmap_size
+    assert not core.reads_need_lock()
+
+def test_read_write_split(read_optimised_database):
+    session = core.get_default_session()
+    session.commit()
+    query = select(core.SimulationObjectBase.id)
+    assert session.get_bind(clause=query) is core._read_only_engine
+
+    tangos.get_halo("sim/ts1/1")["new_property"] = 1.0 # commits
+    assert session.get_bind(clause=query) is core._read_only_engine
+
+    # once the transaction has written, queries must see its changes
+    halo = tangos.get_halo("sim/ts1/2")
+    session.add(core.HaloProperty(halo, core.get_or_create_dictionary_item(session, "pending_property"), 2.0))
+    session.flush()
+    assert session.get_bind(clause=query) is core.get_default_engine()
+    assert halo["pending_property"] == 2.0
+    session.commit()
+    assert session.get_bind(clause=query) is core._read_only_engine
+
+def test_read_only_connection_cannot_write(read_optimised_database):
+    with core._read_only_engine.connect() as connection:
+        with pytest.raises(Exception):
+            connection.execute(text("DELETE FROM halos"))
+
+def test_calculations(read_optimised_database):
+    ts = tangos.get_timestep("sim/ts2")
+    Mvir, = ts.calculate_all("Mvir")
+    npt.assert_allclose(Mvir, [10.0, 20.0, 30.0, 40.0, 50.0])
+    original_threshold = tangos.config.max_ids_for_in_clause
+    try:
+        for threshold in [original_threshold, 0]: # resolve links with an IN clause, then with a temporary table
+            tangos.config.max_ids_for_in_clause = threshold
+            Mvir_later, = tangos.get_timestep("sim/ts1").calculate_all("later(1).Mvir")
+            npt.assert_allclose(Mvir_later, [10.0, 20.0, 30.0, 40.0, 50.0])
+    finally:
+        tangos.config.max_ids_for_in_clause = original_threshold
+
+def test_not_applicable():
+    assert sqlite_profile.is_applicable("sqlite:///tangos.db")
+    assert not sqlite_profile.is_applicable("sqlite://")
+    assert not sqlite_profile.is_applicable("postgresql+psycopg2://localhost/tangos")
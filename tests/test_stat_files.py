@@ -115,6 +115,33 @@ def test_insert_properties():
     assert ts1.halos[3]['hostHalo']==ts1.halos[0]
     testing.assert_halolists_equal(ts1.halos[0]['childHalo'], [ts1.halos[2], ts1.halos[3]])
 
+def test_insert_properties_from_rows():
+    # handlers that yield rows rather than reading a stat file have their rows assembled into columns
+    halos = ts1.halos.order_by(tangos.core.halo.SimulationObjectBase.finder_offset).all()
+
+    class RowByRowHandler(type(sim.get_output_handler())):
+        def iterate_object_properties_for_timestep(self, ts_extension, object_typetag, property_names):
+            for h in halos:
+                yield [h.finder_offset, h.finder_id, 2.0*h.finder_id, np.arange(3)*h.finder_id,
+                       tangos.util.proxy_object.IncompleteProxyObjectFromFinderId(halos[0].finder_id, 'halo'),
+                       "not a number"]
+
+    names = ["row_float", "row_array", "row_link", "row_string"]
+    importer = property_importer.PropertyImporter()
+    importer.handler = RowByRowHandler(sim.basename)
+    columns = importer.handler.read_object_properties_for_timestep(ts1.extension, 'halo', names)
+    assert len(columns) == 6
+    assert columns[2].dtype == np.float64
+    assert columns[3].dtype == object
+
+    importer._import_properties_for_timestep(ts1, names, 'halo')
+    for h in halos:
+        assert h["row_float"] == 2.0*h.finder_id
+        npt.assert_equal(h["row_array"], np.arange(3)*h.finder_id)
+        assert h["row_link"] == halos[0]
+        with npt.assert_raises(KeyError):
+            h["row_string"]
+
 def test_default_value():
     class AHFStatFileWithDefaultValues(stat.AHFStatFile):
         _column_translations = {'nonexistent_column': translations.DefaultValue('nonexistent_column', 42),
@@ -160,3 +187,22 @@ def test_import_properties_is_only_numeric_or_array():
     # Importing an array of non-numeric types should fail
     property = importer._create_property(db_name, halo, np.array(["42.0", "42.0", "42.0"]))
     assert property is None
+
+def test_read_columns():
+    statfile = stat.HaloStatFile(ts1.filename)
+    cat_index, finder_id, ndm, rvir, host = statfile.read_columns("n_dm", "Rvir", "hostHalo")
+    assert finder_id.dtype == np.int64
+    assert all(ndm == [4348608, 402567, 419933, 199525])
+    npt.assert_allclose(rvir, [195.87, 88.75, 90.01, 69.41])
+    assert host[0] is None
+    assert host[2]._finder_id == 0
+
+    rows = list(statfile.iter_rows("n_dm", "Rvir"))
+    assert rows[1] == [2, 1, 402567, 88.75]
+    assert type(rows[1][2]) is int
+
+def test_read_columns_mixed_int_float():
+    # Phi0 in this file has an integer in the first row but floats further down
+    _, _, values = stat.HaloStatFile(ts1.filename).read_columns("Phi0")
+    assert values.dtype == np.float64
+    npt.assert_allclose(values, [777583, 67984.8, 41949, 21804.3])
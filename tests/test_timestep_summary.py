@@ -0,0 +1,119 @@
+import os
+
+import test_db_writer  # for dummy_property
+from pytest import fixture
+
+import tangos as db
+from tangos import cached_writer, core, log, parallel_tasks, testing
+from tangos.core import timestep_summary
+from tangos.input_handlers import output_testing
+from tangos.tools import add_simulation, property_deleter, property_writer
+
+
+def setup_func():
+    parallel_tasks.use('null')
+    testing.init_blank_db_for_testing()
+    db.config.base = os.path.join(os.path.dirname(__file__), "test_simulations")
+    manager = add_simulation.SimulationAdderUpdater(output_testing.TestInputHandler("dummy_sim_1"))
+    with log.LogCapturer():
+        manager.scan_simulation_and_add_all_descendants()
+
+def teardown_func():
+    db.core.close_db()
+
+@fixture
+def fresh_database():
+    setup_func()
+    yield
+    teardown_func()
+
+def _write_properties(*args):
+    writer = property_writer.PropertyWriter()
+    writer.parse_command_line(list(args))
+    with log.LogCapturer():
+        writer.run_calculation_loop()
+
+def _stored_rows(ts):
+    return core.get_default_session().query(core.TimeStepSummary).filter_by(timestep_id=ts.id).count()
+
+def test_object_counts_from_adder(fresh_database):
+    session = core.get_default_session()
+    ts1 = db.get_timestep("dummy_sim_1/step.1")
+    ts2 = db.get_timestep("dummy_sim_1/step.2")
+    assert _stored_rows(ts1)>0
+    assert timestep_summary.get_object_counts(session, ts1) == {0: 10}
+    assert timestep_summary.get_object_counts(session, ts2) == {0: 5}
+
+def test_property_counts_from_writer(fresh_database):
+    session = core.get_default_session()
+    ts1 = db.get_timestep("dummy_sim_1/step.1")
+    assert timestep_summary.get_property_counts(session, ts1) == {}
+    _write_properties("dummy_property", "--type", "halo")
+    assert timestep_summary.get_property_counts(session, ts1) == {'dummy_property': 10}
+    assert timestep_summary.get_property_counts(session, ts1, 1) == {}
+
+    # overwriting should not double-count
+    _write_properties("dummy_property", "--type", "halo", "--force")
+    assert timestep_summary.get_property_counts(session, ts1) == {'dummy_property': 10}
+
+def test_property_counts_from_setitem(fresh_database):
+    session = core.get_default_session()
+    ts1 = db.get_timestep("dummy_sim_1/step.1")
+    ts1.halos[0]['my_value'] = 1.0
+    ts1.halos[1]['my_value'] = 2.0
+    ts1.halos[0]['my_value'] = 3.0
+    assert timestep_summary.get_property_counts(session, ts1) == {'my_value': 2}
+
+def test_property_counts_after_deletion(fresh_database):
+    session = core.get_default_session()
+    _write_properties("dummy_property", "--type", "halo")
+
+    tool = property_deleter.PropertyDeleter()
+    tool.parse_command_line("dummy_property --for dummy_sim_1/step.1/halo_1 -f".split())
+    tool.run_calculation_loop()
+
+    ts1 = db.get_timestep("dummy_sim_1/step.1")
+    ts2 = db.get_timestep("dummy_sim_1/step.2")
+    assert timestep_summary.get_property_counts(session, ts1) == {'dummy_property': 9}
+    assert timestep_summary.get_property_counts(session, ts2) == {'dummy_property': 5}
+
+    tool = property_deleter.PropertyDeleter()
+    tool.parse_command_line("dummy_property -f".split())
+    tool.run_calculation_loop()
+
+    assert timestep_summary.get_property_counts(session, ts1) == {}
+    assert timestep_summary.get_property_counts(session, ts2) == {}
+
+def test_unsummarised_timestep_falls_back_to_live_count(fresh_database):
+    session = core.get_default_session()
+    _write_properties("dummy_property", "--type", "halo")
+    ts1 = db.get_timestep("dummy_sim_1/step.1")
+
+    timestep_summary.remove(session, [ts1])
+    session.commit()
+    assert _stored_rows(ts1) == 0
+
+    assert timestep_summary.get_object_counts(session, ts1) == {0: 10}
+    assert timestep_summary.get_property_counts(session, ts1) == {'dummy_property': 10}
+
+    timestep_summary.refresh(session)
+    session.commit()
+    assert _stored_rows(ts1) > 0
+    assert timestep_summary.get_property_counts(session, ts1) == {'dummy_property': 10}
+
+def test_property_counts_from_insert_list_are_incremental(fresh_database):
+    session = core.get_default_session()
+    ts1 = db.get_timestep("dummy_sim_1/step.1")
+    halos = ts1.halos.all()
+
+    cached_writer.insert_list([(h, 'my_value', 1.0) for h in halos[:3]])
+    assert timestep_summary.get_property_counts(session, ts1) == {'my_value': 3}
+
+    # later batches add to the stored count; objects that already have the property are not counted again
+    cached_writer.insert_list([(h, 'my_value', 2.0) for h in halos[2:5]] + [(halos[5], 'other_value', 1.0)])
+    assert timestep_summary.get_property_counts(session, ts1) == {'my_value': 5, 'other_value': 1}
+
+    # the incremental counts agree with a full recount
+    timestep_summary.refresh(session, [ts1])
+    session.commit()
+    assert timestep_summary.get_property_counts(session, ts1) == {'my_value': 5, 'other_value': 1}